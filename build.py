@@ -4,13 +4,24 @@ import click
 import os
 import subprocess
 import time
+from functools import partial as _partial
 from pymongo.errors import PyMongoError
 
 import nedrexdb
 from nedrexdb import config, downloaders
 from nedrexdb.control.docker import NeDRexDevInstance, NeDRexLiveInstance, update_neo4j_image_version
 from nedrexdb.control.embeddings import EmbeddingController
-from nedrexdb.db import MongoInstance, mongo_to_neo, collection_stats
+from nedrexdb.control.scheduler import ParserTask, resolve_tasks, run_tasks, stage_leaf_tasks
+from nedrexdb.db import (
+    MongoInstance,
+    bulk_load,
+    collection_stats,
+    columnar,
+    connect_database,
+    mongo_to_neo,
+    staging,
+)
+from nedrexdb.db.build_cache import BuildCache
 from nedrexdb.db.import_embeddings import fetch_embeddings, upsert_embeddings
 from nedrexdb.db.parsers import (
     biogrid,
@@ -123,17 +134,45 @@ def _prepare_dev_environment(embedding_controller):
 
     # MongoDB data download & import
     MongoInstance.connect("dev")
-    MongoInstance.set_indexes()
+    # the query indexes are built once the parsers are done
+    MongoInstance.set_indexes(query=False)
+
+
+def _set_query_indexes():
+    workers = config.get("db.index_workers") or 1
+    logger.info(f"Building query indexes with {workers} worker(s)")
+    MongoInstance.set_indexes(load=False, workers=workers)
+
+
+def _write_columnar():
+    # the export and the profiling read the Parquet copies of the collections
+    if config.get("db.columnar"):
+        columnar.write_collections(
+            MongoInstance.DB,
+            config["api.node_collections"] + config["api.edge_collections"],
+            workers=config.get("db.export_workers") or 1,
+        )
+
 
+def _build_cache(rebuild):
+    # parsers whose inputs did not change since the live build reuse its collections
+    if rebuild or not config.get("db.incremental_build"):
+        return BuildCache(), None
+    live_db = connect_database("live")
+    return BuildCache.from_database(live_db), live_db
 
-def _ingest_data(version, nedrex_versions, ignored_sources):
+
+def _ingest_data(version, nedrex_versions, ignored_sources, rebuild=False):
     if nedrex_versions:
         MongoInstance.DB["metadata"].replace_one({}, nedrex_versions, upsert=True)
 
     # Run parser pipeline
+    cache, live_db = _build_cache(rebuild)
     run_parsers(
         version=version,
-        ignored_sources=ignored_sources
+        ignored_sources=ignored_sources,
+        cache=cache,
+        cache_db=live_db,
     )
 
     for src in ignored_sources:
@@ -142,6 +181,9 @@ def _ingest_data(version, nedrex_versions, ignored_sources):
             logger.info(f"Dropping collection for ignored source: {col}")
             MongoInstance.DB[col].drop()
 
+    _set_query_indexes()
+    _write_columnar()
+
 
 def _post_process_data(dev_instance):
     # clean up for export
@@ -221,7 +263,7 @@ def update(conf, download, rebuild, version_update, create_embeddings):
     _prepare_dev_environment(embedding_controller)
 
     # Stage 4: Ingest data into Mongo
-    _ingest_data(version, nedrex_versions, ignored_sources)
+    _ingest_data(version, nedrex_versions, ignored_sources, rebuild)
 
     # Stage 5: Post-process (Mongo to Neo4j)
     _post_process_data(dev_instance)
@@ -232,105 +274,116 @@ def update(conf, download, rebuild, version_update, create_embeddings):
     )
 
 
-# Unified parser pipeline used by both the full update() path and parse_dev().
-def run_parsers(version, ignored_sources, hippie_method_scores=None):
+def _parse_ncbi():
+    ncbi.parse_gene_info()
+    ncbi.parse_gene_summary()
+
+
+def _molecule_similarity():
+    # imported lazily, the module requires a connected MongoInstance
+    from nedrexdb.analyses import molecule_similarity
+    molecule_similarity.run()
+
+
+def parser_tasks(version, hippie_method_scores=None):
     """
-    Unified parser pipeline used by both the full update() path and parse_dev().
-    Ordering does matter due to dependencies in the parsing process.
-    Custom db build is possible with conditional execution based on ignored_sources.
+    Declares the parser pipeline as tasks with explicit dependencies.
+    A task depends on every task that writes a collection it reads (or enriches).
     """
-
-    # --- PRIMARY NODE SOURCES (must run first) ---
-    if "go" not in ignored_sources:
-        go.parse_go()
-    if "mondo" not in ignored_sources:
-        mondo.parse_mondo_json()  # disorder nodes
-    if "ncbi" not in ignored_sources:
-        ncbi.parse_gene_info()
-        ncbi.parse_gene_summary()
-    if "uberon" not in ignored_sources:
-        uberon.parse()
-    if "uniprot" not in ignored_sources:
-        uniprot.parse_proteins()
-
-    # --- NODE SOURCES THAT REQUIRE EXISTING NODES ---
-    if "cosmic" not in ignored_sources:
-        cosmic.parse_gene_disease_associations()
-    if "clinvar" not in ignored_sources:
-        clinvar.parse()
-    if "drugbank" not in ignored_sources:
-        if version == "licensed":
-            drugbank._parse_drugbank()  # requires proteins
-        else:
-            drugbank.parse_drugbank()
-    if "chembl" not in ignored_sources:
-        chembl.parse_chembl()
-    if "uniprot" not in ignored_sources:
-        uniprot_signatures.parse()  # requires proteins
-    if "hpo" not in ignored_sources:
-        hpo.parse()  # requires disorders
-    if "reactome" not in ignored_sources:
-        reactome.parse()  # requires proteins
-    if "bioontology" not in ignored_sources:
-        bioontology.parse()  # requires phenotype
-
-    # --- SOURCES ADDING DATA TO EXISTING NODES ---
-    if "drug_central" not in ignored_sources:
-        drug_central.parse_drug_central()
-    if "unichem" not in ignored_sources:
-        unichem.parse()
-    if "repotrial" not in ignored_sources:
-        repotrial.parse()
-
-    # --- SCORE-RELATED EXTRACTION (hippie) ---
-    if "hippie" not in ignored_sources:
-        if hippie_method_scores is None:
-            hippie_method_scores = hippie.parse_perplexity_techinque_scores()
-
-    # --- EDGE SOURCES ---
-    if "ctd" not in ignored_sources:
-        ctd.parse()
-    if "disgenet" not in ignored_sources:
-        disgenet.parse_gene_disease_associations()
-    if "intogen" not in ignored_sources:
-        intogen.parse_gene_disease_associations()
-    if "orphanet" not in ignored_sources:
-        orphanet.parse_gene_disease_associations()
-    if "opentargets" not in ignored_sources:
-        opentargets.parse_gene_disease_associations()
-    if "ncg" not in ignored_sources:
-        ncg.parse_gene_disease_associations()
-
-    # GO annotations
-    if "go" not in ignored_sources:
-        go.parse_goa()
-
-    # Edges requiring hippie scores
-    if "hpa" not in ignored_sources:
-        hpa.parse_hpa()
-    if "biogrid" not in ignored_sources and "hippie" not in ignored_sources:
-        biogrid.parse_ppis(hippie_method_scores)
-    if "iid" not in ignored_sources and "hippie" not in ignored_sources:
-        iid.parse_ppis(hippie_method_scores)
-    if "intact" not in ignored_sources and "hippie" not in ignored_sources:
-        intact.parse(hippie_method_scores)
+    drugbank_parser = drugbank._parse_drugbank if version == "licensed" else drugbank.parse_drugbank
+
+    tasks = [
+        # --- PRIMARY NODE SOURCES ---
+        ParserTask("go", go.parse_go, ("go",)),
+        ParserTask("mondo", mondo.parse_mondo_json, ("mondo",)),
+        ParserTask("ncbi", _parse_ncbi, ("ncbi",)),
+        ParserTask("uberon", uberon.parse, ("uberon",)),
+        ParserTask("uniprot", uniprot.parse_proteins, ("uniprot",)),
+        # --- NODE SOURCES THAT REQUIRE EXISTING NODES ---
+        ParserTask("cosmic", cosmic.parse_gene_disease_associations, ("cosmic",), ("ncbi", "mondo")),
+        # clinvar and reactome read back the nodes they wrote, so they cannot be staged
+        ParserTask("clinvar", clinvar.parse, ("clinvar",), ("ncbi", "mondo", "cosmic"), stageable=False),
+        ParserTask("drugbank", drugbank_parser, ("drugbank",), ("uniprot",)),
+        ParserTask("chembl", chembl.parse_chembl, ("chembl",), ("drugbank",)),
+        ParserTask("uniprot_signatures", uniprot_signatures.parse, ("uniprot",), ("uniprot",)),
+        ParserTask("hpo", hpo.parse, ("hpo",), ("mondo",)),
+        ParserTask("reactome", reactome.parse, ("reactome",), ("uniprot",), stageable=False),
+        ParserTask("bioontology", bioontology.parse, ("bioontology",), ("hpo",)),
+        # --- SOURCES ADDING DATA TO EXISTING NODES ---
+        ParserTask("drug_central", drug_central.parse_drug_central, ("drug_central",),
+                   ("drugbank", "mondo", "uniprot")),
+        ParserTask("unichem", unichem.parse, ("unichem",), ("drugbank", "drug_central")),
+        ParserTask("repotrial", repotrial.parse, ("repotrial",), ("mondo",)),
+        # --- EDGE SOURCES ---
+        ParserTask("ctd", ctd.parse, ("ctd",), ("mondo", "drugbank")),
+        ParserTask("disgenet", disgenet.parse_gene_disease_associations, ("disgenet",), ("mondo", "ncbi")),
+        ParserTask("intogen", intogen.parse_gene_disease_associations, ("intogen",), ("ncbi",)),
+        ParserTask("orphanet", orphanet.parse_gene_disease_associations, ("orphanet",), ("mondo", "ncbi")),
+        ParserTask("opentargets", opentargets.parse_gene_disease_associations, ("opentargets",), ("mondo", "ncbi")),
+        ParserTask("ncg", ncg.parse_gene_disease_associations, ("ncg",), ("mondo", "ncbi")),
+        ParserTask("go_annotations", go.parse_goa, ("go",), ("go", "uniprot")),
+        ParserTask("hpa", hpa.parse_hpa, ("hpa",), ("ncbi", "uniprot", "uberon")),
+        # PPIs are only parsed when they can be scored
+        ParserTask("biogrid", biogrid.parse_ppis, ("biogrid", "hippie"), ("uniprot",)),
+        ParserTask("iid", iid.parse_ppis, ("iid", "hippie"), ("uniprot",)),
+        ParserTask("intact", intact.parse, ("intact", "hippie"), ("uniprot",)),
+        # scored once, after all PPI sources have been merged
+        ParserTask("hippie", _partial(hippie.score_ppis, hippie_method_scores), ("hippie",),
+                   ("biogrid", "iid", "intact")),
+        ParserTask("sider", sider.parse, ("sider",), ("drugbank", "unichem", "bioontology")),
+        ParserTask("uniprot_idmap", uniprot.parse_idmap, ("uniprot",), ("uniprot", "ncbi")),
+        # --- ANALYSES AND CLEAN-UP ---
+        ParserTask("molecule_similarity", _molecule_similarity, ("repotrial",), ("drugbank", "drug_central")),
+        ParserTask("trim_uberon", trim_uberon.trim_uberon, ("uberon",), ("uberon", "hpa")),
+    ]
 
     # omim is licensed-only
-    if version == "licensed" and "omim" not in ignored_sources:
-        omim.parse_gene_disease_associations()
-
-    if "sider" not in ignored_sources:
-        sider.parse()
+    if version == "licensed":
+        tasks.append(ParserTask("omim", omim.parse_gene_disease_associations, ("omim",), ("mondo", "ncbi")))
 
-    if "uniprot" not in ignored_sources:
-        uniprot.parse_idmap()
+    return tasks
 
-    if "repotrial" not in ignored_sources:
-        from nedrexdb.analyses import molecule_similarity
-        molecule_similarity.run()
 
-    if "uberon" not in ignored_sources:
-        trim_uberon.trim_uberon()
+# Unified parser pipeline used by both the full update() path and parse_dev().
+def run_parsers(version, ignored_sources, hippie_method_scores=None, workers=None, cache=None, cache_db=None):
+    """
+    Unified parser pipeline used by both the full update() path and parse_dev().
+    Parsers run as soon as the parsers they depend on (see parser_tasks) are done, using
+    up to `workers` processes (config: db.parser_workers; 1 runs everything serially).
+    Custom db build is possible with conditional execution based on ignored_sources.
+    With a BuildCache, the collections of parsers whose inputs did not change are copied
+    from `cache_db` (the live database) instead, and the cache is stored with the build.
+    In staging mode (db.staging), the writes of the tasks no other task requires are merged
+    after all tasks ran.
+    """
+    if workers is None:
+        workers = config.get("db.parser_workers") or 1
+
+    if "hippie" not in ignored_sources and hippie_method_scores is None:
+        hippie_method_scores = hippie.parse_perplexity_techinque_scores()
+
+    tasks = resolve_tasks(parser_tasks(version, hippie_method_scores), ignored_sources)
+    if cache is not None:
+        tasks = cache.skip(tasks)
+        if cache_db is not None:
+            cache.restore(cache_db, MongoInstance.DB)
+    if config.get("db.staging"):
+        tasks = stage_leaf_tasks(tasks)
+        staging.drop()
+
+    writes = {}
+    timings = run_tasks(tasks, ignored_sources=ignored_sources, workers=workers, writes=writes)
+
+    staged = [task.name for task in tasks if task.staged]
+    if staged:
+        for name, collections in bulk_load.merge_staged(staged).items():
+            writes[name] = writes.get(name, set()) | collections
+        staging.drop()
+
+    if cache is not None:
+        cache.record(writes)
+        cache.save(MongoInstance.DB)
+    return timings
 
 def get_fallback_version(fallback_path="/data/nedrex_files/nedrex_data/fallback_version"):
     default_version = None
@@ -424,7 +477,8 @@ def parse_dev(version, download, rebuild, version_update, prev_metadata,
 
     # MongoDB data download & import
     MongoInstance.connect("dev")
-    MongoInstance.set_indexes()
+    # the query indexes are built once the parsers are done
+    MongoInstance.set_indexes(query=False)
 
     MongoInstance.DB["metadata"].replace_one({}, nedrex_versions, upsert=True)
 
@@ -440,6 +494,9 @@ def parse_dev(version, download, rebuild, version_update, prev_metadata,
             logger.info(f"Minimal Build: Dropping collection for ignored source: {col}")
             MongoInstance.DB[col].drop()
 
+    _set_query_indexes()
+    _write_columnar()
+
     return embeddings, tobuild_embeddings, no_download, current_metadata
 
 
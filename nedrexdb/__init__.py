@@ -89,6 +89,27 @@ class _Config:
                                         'mongo_db': 'nedrex',
                                         'root_directory': '/data/nedrex_files/nedrex_data',
                                         'volume_root': f'{vt}_nedrex',
+                                        'parser_workers': 4,
+                                        'export_workers': 4,
+                                        'similarity_workers': 4,
+                                        'uniprot_workers': 4,
+                                        'clinvar_workers': 4,
+                                        'hpa_workers': 4,
+                                        'index_workers': 4,
+                                        'download_workers': 4,
+                                        'incremental_build': True,
+                                        'write_batch_bytes': 8 * 1024 * 1024,
+                                        'write_workers': 2,
+                                        'write_max_in_flight': 4,
+                                        'mongo_client': {'max_pool_size': 100,
+                                                         'min_pool_size': 0,
+                                                         'compressors': ['zstd', 'snappy'],
+                                                         'w': 1,
+                                                         'journal': False},
+                                        'bulk_load': True,
+                                        'bulk_load_max_keys': 1_000_000,
+                                        'staging': False,
+                                        'columnar': False,
                                         'dev': {'mongo_port': 27017 if vt == "licensed" else 26017,
                                                 'mongo_name': f'{vt}_nedrex_dev',
                                                 'mongo_express_port': 8081 if vt == "licensed" else 7081,
@@ -1,15 +1,22 @@
+import bisect as _bisect
+import hashlib as _hashlib
+import multiprocessing as _mp
+import os as _os
+import pickle as _pickle
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
 from datetime import datetime
-from itertools import combinations
+from pathlib import Path as _Path
 from typing import Final
 
 import rdkit.Chem as Chem  # type: ignore
 from more_itertools import chunked
-from pymongo import UpdateOne  # type: ignore
 from rdkit import DataStructs, RDLogger  # type: ignore
 from rdkit.Chem import AllChem, MACCSkeys  # type: ignore
 from tqdm import tqdm  # type: ignore
 
+from nedrexdb import config as _config
 from nedrexdb.db import MongoInstance
+from nedrexdb.logger import logger
 
 
 if MongoInstance.DB is None:
@@ -21,6 +28,18 @@ else:
 # disable logging, because we expect warnings
 RDLogger.DisableLog("rdApp.*")
 
+_MORGAN_BITS: Final = 16_384
+# a pair is stored if either of the screening fingerprints is similar enough
+_MORGAN_R2_THRESHOLD: Final = 0.3
+_MACCS_THRESHOLD: Final = 0.8
+_SCORE_KEYS: Final = ("morgan_r1", "morgan_r2", "morgan_r3", "morgan_r4", "maccs")
+_FINGERPRINT_KEYS: Final = ("maccs", "morgan_r1", "morgan_r2", "morgan_r3", "morgan_r4")
+# cached fingerprints and pairs are discarded if any of the parameters change
+_CACHE_PARAMETERS: Final = (_MORGAN_BITS, _MORGAN_R2_THRESHOLD, _MACCS_THRESHOLD, _SCORE_KEYS)
+
+# (sorted drug IDs, fingerprint name -> fingerprints in the same order), set before forking the workers
+_FINGERPRINTS = None
+
 
 def set_indexes():
     _DRUG_SIMILARITY_COLL.create_index("memberOne")
@@ -28,125 +47,207 @@ def set_indexes():
     _DRUG_SIMILARITY_COLL.create_index([("memberOne", 1), ("memberTwo", 1)])
 
 
-def get_parsable_drugs():
-    # get SMILES strings
-    drugs = {doc["primaryDomainId"]: doc.get("smiles") for doc in _DRUG_COLL.find()}
-    # remove key-value pairs where the value is None
-    drugs = {k: v for k, v in drugs.items() if v}
-    # remove key-value pairs with unparsable values
-    drugs = {k: Chem.MolFromSmiles(v) for k, v in drugs.items() if Chem.MolFromSmiles(v)}
-    return drugs
-
-
-def find_similar_compounds_morgan(parsable_drugs) -> None:
-    morgan_fps = {k: AllChem.GetMorganFingerprintAsBitVect(v, 2, nBits=16_384) for k, v in parsable_drugs.items()}
-
-    pairs_iter = combinations(sorted(parsable_drugs.keys()), 2)
-    filtered_pairs = (
-        (
-            a,
-            b,
-        )
-        for a, b in pairs_iter
-        if DataStructs.TanimotoSimilarity(morgan_fps[a], morgan_fps[b]) >= 0.3
-    )
-
-    for chunk in tqdm(chunked(filtered_pairs, 1_000), leave=False, desc="Finding similar compounds (Morgan R2)"):
-        tnow = datetime.utcnow()
-        updates = [
-            UpdateOne(
-                {"memberOne": a, "memberTwo": b},
-                {
-                    "$set": {
-                        "updated": tnow,
-                    },
-                    "$setOnInsert": {"created": tnow, "type": "MoleculeSimilarityMolecule"},
-                    "$addToSet": {
-                        "dataSources": "repotrial",
-                    },
-                },
-                upsert=True,
-            )
-            for a, b in chunk
-        ]
+def smiles_hash(smiles):
+    return _hashlib.sha1(smiles.encode()).hexdigest()
 
-        _DRUG_SIMILARITY_COLL.bulk_write(updates)  # type: ignore
-
-
-def find_similar_compounds_maccs(parsable_drugs) -> None:
-    maccs_fps = {k: MACCSkeys.GenMACCSKeys(v) for k, v in parsable_drugs.items()}
-
-    pairs_iter = combinations(sorted(parsable_drugs.keys()), 2)
-    filtered_pairs = (
-        (
-            a,
-            b,
-        )
-        for a, b in pairs_iter
-        if DataStructs.TanimotoSimilarity(maccs_fps[a], maccs_fps[b]) >= 0.8
-    )
-
-    for chunk in tqdm(chunked(filtered_pairs, 1_000), leave=False, desc="Finding similar compounds (MACCS)"):
-        tnow = datetime.utcnow()
-        updates = [
-            UpdateOne(
-                {"memberOne": a, "memberTwo": b},
-                {
-                    "$set": {
-                        "updated": tnow,
-                    },
-                    "$setOnInsert": {"created": tnow, "type": "MoleculeSimilarityMolecule"},
-                    "$addToSet": {
-                        "dataSources": "repotrial",
-                    },
-                },
-                upsert=True,
-            )
-            for a, b in chunk
-        ]
 
-        _DRUG_SIMILARITY_COLL.bulk_write(updates)  # type: ignore
+def get_drug_smiles():
+    """Returns drug ID -> SMILES for all drugs with a SMILES string."""
+    return {
+        doc["primaryDomainId"]: doc["smiles"]
+        for doc in _DRUG_COLL.find({"smiles": {"$nin": [None, ""]}}, {"_id": 0, "primaryDomainId": 1, "smiles": 1})
+    }
 
 
-def calculate_similarity(parsable_drugs):
-    fingerprints = {}
-    fingerprints["maccs"] = {k: MACCSkeys.GenMACCSKeys(v) for k, v in parsable_drugs.items()}
+def compute_fingerprints(smiles):
+    """Parses a SMILES string once and returns its fingerprints (None if it cannot be parsed)."""
+    mol = Chem.MolFromSmiles(smiles)
+    if not mol:
+        return None
 
+    fingerprints = {"maccs": MACCSkeys.GenMACCSKeys(mol)}
     for r in range(1, 5):
-        fingerprints[f"morgan_r{r}"] = {
-            k: AllChem.GetMorganFingerprintAsBitVect(v, r, nBits=16_384) for k, v in parsable_drugs.items()
+        fingerprints[f"morgan_r{r}"] = AllChem.GetMorganFingerprintAsBitVect(mol, r, nBits=_MORGAN_BITS)
+    return fingerprints
+
+
+def get_fingerprints(drug_smiles, fingerprint_cache):
+    """Returns the sorted IDs of the parsable drugs and their fingerprints as aligned lists.
+
+    Fingerprints are looked up by SMILES hash in `fingerprint_cache`, which is
+    updated with the ones computed here.
+    """
+    hashes = {k: smiles_hash(v) for k, v in drug_smiles.items()}
+    missing = {h: drug_smiles[k] for k, h in hashes.items() if h not in fingerprint_cache}
+    logger.info(f"Computing fingerprints for {len(missing)} of {len(hashes)} SMILES strings")
+    for h, smiles in missing.items():
+        fingerprint_cache[h] = compute_fingerprints(smiles)
+
+    ids = sorted(k for k, h in hashes.items() if fingerprint_cache[h] is not None)
+    fingerprints = {key: [fingerprint_cache[hashes[k]][key] for k in ids] for key in _FINGERPRINT_KEYS}
+    return ids, fingerprints
+
+
+def score_rows(rows, ids, fingerprints, unchanged=None):
+    """Compares each drug in `rows` against all drugs after it.
+
+    If `unchanged` (sorted indices of drugs whose pairs are already known) is
+    given, rows are also compared against the unchanged drugs before them, so
+    that rows of changed drugs cover all their pairs exactly once.
+
+    The screening fingerprints (Morgan R2 and MACCS) are compared with one bulk
+    call per row; all scores are then computed for the pairs that pass.
+    Returns (memberOne, memberTwo, scores) tuples.
+    """
+    n = len(ids)
+    results = []
+    for i in rows:
+        if unchanged is None:
+            columns = range(i + 1, n)
+        else:
+            columns = unchanged[: _bisect.bisect_left(unchanged, i)] + list(range(i + 1, n))
+        screening = {
+            key: DataStructs.BulkTanimotoSimilarity(fingerprints[key][i], [fingerprints[key][j] for j in columns])
+            for key in ("morgan_r2", "maccs")
         }
 
-    comparisons = (
-        (
-            doc["memberOne"],
-            doc["memberTwo"],
-        )
-        for doc in _DRUG_SIMILARITY_COLL.find()
-    )
+        for j, m, k in zip(columns, screening["morgan_r2"], screening["maccs"]):
+            if m < _MORGAN_R2_THRESHOLD and k < _MACCS_THRESHOLD:
+                continue
+            scores = {"morgan_r2": m, "maccs": k}
+            for key in ("morgan_r1", "morgan_r3", "morgan_r4"):
+                scores[key] = DataStructs.TanimotoSimilarity(fingerprints[key][i], fingerprints[key][j])
+            a, b = (ids[i], ids[j]) if i < j else (ids[j], ids[i])
+            results.append((a, b, scores))
+    return results
+
+
+def _score_rows_in_worker(rows):
+    return score_rows(rows, *_FINGERPRINTS)
+
+
+def find_similar_pairs(ids, fingerprints, workers=1, rows=None, unchanged=None):
+    """Yields the similar pairs of drugs, scoring blocks of rows across `workers` processes.
+
+    By default, all pairs are scored. Otherwise, only the pairs of the drugs
+    at indices `rows` are (see score_rows for `unchanged`).
+    """
+    global _FINGERPRINTS
+
+    rows = list(range(len(ids)) if rows is None else rows)
+    # rows get shorter towards the end of the triangle, so the blocks interleave rows to balance the work
+    n_blocks = max(1, workers) * 16
+    blocks = [rows[start::n_blocks] for start in range(min(n_blocks, len(rows)))]
+
+    if workers <= 1:
+        for block in tqdm(blocks, leave=False, desc="Calculating compound similarities"):
+            yield from score_rows(block, ids, fingerprints, unchanged)
+        return
+
+    # the workers inherit the fingerprints on fork instead of receiving them with every block
+    _FINGERPRINTS = (ids, fingerprints, unchanged)
+    try:
+        with _ProcessPoolExecutor(max_workers=workers, mp_context=_mp.get_context("fork")) as executor:
+            for results in tqdm(
+                executor.map(_score_rows_in_worker, blocks),
+                total=len(blocks),
+                leave=False,
+                desc="Calculating compound similarities",
+            ):
+                yield from results
+    finally:
+        _FINGERPRINTS = None
+
+
+def write_similarities(pairs):
+    """Replaces the collection contents with one complete document per pair."""
+    _DRUG_SIMILARITY_COLL.delete_many({})
+
+    tnow = datetime.utcnow()
+    total = 0
+    for chunk in chunked(pairs, 10_000):
+        docs = [
+            {
+                "memberOne": a,
+                "memberTwo": b,
+                "type": "MoleculeSimilarityMolecule",
+                "dataSources": ["repotrial"],
+                "created": tnow,
+                "updated": tnow,
+                **{key: scores[key] for key in _SCORE_KEYS},
+            }
+            for a, b, scores in chunk
+        ]
+        _DRUG_SIMILARITY_COLL.insert_many(docs, ordered=False)
+        total += len(docs)
+    return total
+
 
-    for chunk in tqdm(chunked(comparisons, 1_000), leave=False, desc="Calculating compound similarities"):
-        tnow = datetime.utcnow()
-        updates = []
+def _cache_dir():
+    return _Path(_config["db.root_directory"]) / "cache" / "molecule_similarity"
 
-        for a, b in chunk:
-            query = {"memberOne": a, "memberTwo": b}
-            update = {"$set": {"updated": tnow}}
 
-            for r in range(1, 5):
-                key = f"morgan_r{r}"
-                update["$set"][key] = DataStructs.TanimotoSimilarity(fingerprints[key][a], fingerprints[key][b])
+def load_cache(path):
+    """Loads the cache of the previous build, or an empty one if it is missing or outdated."""
+    empty = {"parameters": _CACHE_PARAMETERS, "fingerprints": {}, "hashes": {}, "pairs": []}
+    if not path.exists():
+        return empty
 
-            update["$set"]["maccs"] = DataStructs.TanimotoSimilarity(fingerprints["maccs"][a], fingerprints["maccs"][b])
+    with path.open("rb") as f:
+        cache = _pickle.load(f)
+    if cache.get("parameters") != _CACHE_PARAMETERS:
+        logger.info("Molecule similarity parameters changed, discarding the cache")
+        return empty
+    return cache
 
-            updates.append(UpdateOne(query, update))
 
-        _DRUG_SIMILARITY_COLL.bulk_write(updates)
+def save_cache(path, cache):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        _pickle.dump(cache, f, protocol=_pickle.HIGHEST_PROTOCOL)
+    _os.replace(tmp, path)
+
+
+def incremental_pairs(ids, fingerprints, hashes, cache, workers=1):
+    """Returns all similar pairs, reusing the cached pairs of drugs whose SMILES did not change.
+
+    Only the changed and new drugs are compared against all drugs.
+    """
+    previous = cache["hashes"]
+    unchanged = [i for i, k in enumerate(ids) if previous.get(k) == hashes[k]]
+    changed = [i for i, k in enumerate(ids) if previous.get(k) != hashes[k]]
+    logger.info(f"{len(changed)} of {len(ids)} drugs are new or changed")
+
+    unchanged_ids = {ids[i] for i in unchanged}
+    kept = [
+        (a, b, dict(zip(_SCORE_KEYS, scores)))
+        for a, b, *scores in cache["pairs"]
+        if a in unchanged_ids and b in unchanged_ids
+    ]
+    return kept + list(find_similar_pairs(ids, fingerprints, workers, rows=changed, unchanged=unchanged or None))
 
 
 def run():
+    cache_path = _cache_dir() / "cache.pkl"
+    cache = load_cache(cache_path)
+
+    drug_smiles = get_drug_smiles()
+    ids, fingerprints = get_fingerprints(drug_smiles, cache["fingerprints"])
+    hashes = {k: smiles_hash(drug_smiles[k]) for k in ids}
+    current = {smiles_hash(v) for v in drug_smiles.values()}
+    del drug_smiles
+
+    workers = _config.get("db.similarity_workers") or 1
+    logger.info(f"Comparing {len(ids)} drugs with {workers} worker(s)")
+    pairs = incremental_pairs(ids, fingerprints, hashes, cache, workers)
+    total = write_similarities(pairs)
+    # building the indexes after inserting the pairs is faster than maintaining them
     set_indexes()
-    parsable_drugs = get_parsable_drugs()
-    find_similar_compounds_morgan(parsable_drugs)
-    find_similar_compounds_maccs(parsable_drugs)
-    calculate_similarity(parsable_drugs)
+    logger.info(f"Stored {total} similar drug pairs")
+
+    # only keep the fingerprints of current drugs, so the cache does not grow with every release
+    cache["fingerprints"] = {h: fp for h, fp in cache["fingerprints"].items() if h in current}
+    cache["hashes"] = hashes
+    cache["pairs"] = [(a, b, *(scores[key] for key in _SCORE_KEYS)) for a, b, scores in pairs]
+    save_cache(cache_path, cache)
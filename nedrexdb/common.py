@@ -1,16 +1,28 @@
+import ftplib as _ftplib
+import hashlib as _hashlib
+import json as _json
 import os
+import shutil as _shutil
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path as _Path
 from typing import Optional as _Optional
+from urllib.parse import urlparse as _urlparse
 
 import requests as _requests  # type: ignore
 from pydantic import BaseModel as _BaseModel, validator as _validator
 from tqdm import tqdm as _tqdm
 
+from nedrexdb.exceptions import DownloadError as _DownloadError
 from nedrexdb.logger import logger as _logger
 
+_CHUNK_SIZE = 1024 * 1024
+# files smaller than this are not split into range requests
+_MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+_TIMEOUT = 60
+
 
 @contextmanager
 def change_directory(directory: str):
@@ -21,11 +33,32 @@ def change_directory(directory: str):
     os.chdir(current_directory)
 
 
+def file_digest(path, algorithm="sha256"):
+    with open(path, "rb") as f:
+        return _hashlib.file_digest(f, algorithm).hexdigest()
+
+
 class Downloader(_BaseModel):
+    """Downloads a file to `target`.
+
+    The file is written to `<target>.part` and renamed to `target` once it is
+    complete (and matches `checksum`), so `target` never holds a partial file.
+    A failed download is resumed from the partial file with a range request,
+    as long as the server reports the same ETag (or Last-Modified date) as
+    when the download started; otherwise, it starts over. With `connections`
+    > 1, large files are downloaded in that many ranges concurrently.
+
+    `checksum` is either "<algorithm>:<hex digest>" (e.g., "md5:...") or the URL
+    of a checksum file whose first word is the digest, with the algorithm as its
+    extension (e.g., "https://.../clinvar.vcf.gz.md5").
+    """
+
     url: str
     target: _Path
     username: _Optional[str]
     password: _Optional[str]
+    connections: int = 1
+    checksum: _Optional[str] = None
 
     @_validator("url")
     def url_https_or_http_or_ftp(cls, v):
@@ -34,44 +67,218 @@ class Downloader(_BaseModel):
         else:
             raise ValueError(f"url {v!r} is not http(s) or ftp")
 
-    def download(self):
+    @property
+    def part(self) -> _Path:
+        return self.target.with_name(f"{self.target.name}.part")
+
+    @property
+    def _state_file(self) -> _Path:
+        return self.target.with_name(f"{self.target.name}.part.json")
+
+    def _segment(self, idx) -> _Path:
+        return self.target.with_name(f"{self.target.name}.part{idx}")
+
+    def download(self) -> bool:
+        """Downloads the file (with up to three attempts); returns whether `target` was written."""
         for _ in range(3):
             try:
                 self._download()
-            except _requests.ConnectionError:
+            except (_requests.ConnectionError, _requests.Timeout, _requests.exceptions.ChunkedEncodingError):
+                # the partial file is kept, so the next attempt resumes it
                 _logger.warning(f"failed to download {self.url!r}")
                 time.sleep(10)
+            except _DownloadError as e:
+                _logger.warning(f"failed to download {self.url!r}: {e}")
+                time.sleep(10)
             else:
-                return
+                return True
         _logger.critical(f"failed to download {self.url!r} three times, aborting!")
+        return False
 
-    def _download(self):
+    def auth(self):
         if self.username is None and self.password is None:
-            auth = None
+            return None
         elif self.username is not None and self.password is not None:
-            auth = (self.username, self.password)
+            return (self.username, self.password)
         else:
             raise ValueError("either both or none of 'username' and 'password' must be set")
 
+    def _download(self):
+        auth = self.auth()
         _logger.info("Downloading %s" % self.url)
 
-        if auth:
-            with _requests.get(self.url, stream=True, auth=auth) as response:
-                response.raise_for_status()
+        self.target.parent.mkdir(exist_ok=True, parents=True)
+        if self.url.startswith("ftp://"):
+            self._download_ftp()
+        else:
+            self._download_http(auth)
 
-                with self.target.open(mode="wb") as f:
-                    for chunk in _tqdm(response.iter_content(chunk_size=8_192), leave=False):
-                        f.write(chunk)
+        self._verify_checksum(auth)
+        os.replace(self.part, self.target)
+        self._state_file.unlink(missing_ok=True)
+
+    def _ftp_size(self):
+        """Returns the size the FTP server reports for the file (SIZE), or None."""
+        url = _urlparse(self.url)
+        try:
+            with _ftplib.FTP(url.hostname, timeout=_TIMEOUT) as ftp:
+                ftp.login(self.username or "anonymous", self.password or "")
+                ftp.voidcmd("TYPE I")
+                return ftp.size(url.path)
+        except _ftplib.all_errors + (ValueError,):
+            return None
+
+    def _download_ftp(self):
+        size = self._ftp_size()
+        # wget resumes the partial file (--continue) if the server supports it
+        result = subprocess.run(
+            (
+                "wget",
+                "--no-verbose",
+                "--read-timeout",
+                "10",
+                "--continue",
+                "-q",
+                "-O",
+                f"{self.part.resolve()}",
+                self.url,
+            ),
+            check=False,
+        )
+        # the partial file is kept, so the next attempt resumes it
+        if result.returncode != 0:
+            raise _DownloadError(f"wget exited with status {result.returncode}")
+        if not self.part.exists():
+            raise _DownloadError("wget did not write a file")
+        if size is not None and self.part.stat().st_size != size:
+            raise _DownloadError(f"expected {size} bytes, got {self.part.stat().st_size}")
+
+    def _download_http(self, auth):
+        size, validator, ranges = self._probe(auth)
+
+        # partial files of a different version of the file cannot be resumed
+        state = {"url": self.url, "size": size, "validator": validator}
+        if not validator or self._load_state() != state:
+            self._discard()
+        self._state_file.write_text(_json.dumps(state))
+
+        if ranges and size and self.connections > 1 and size >= 2 * _MIN_SEGMENT_SIZE:
+            self._download_segments(auth, size, validator)
         else:
-            subprocess.call(
-                (
-                    "wget",
-                    "--no-verbose",
-                    "--read-timeout",
-                    "10",
-                    "-q",
-                    "-O",
-                    f"{self.target.resolve()}",
-                    self.url,
-                )
-            )
+            self._download_stream(auth, validator if ranges else None)
+
+        if size is not None and self.part.stat().st_size != size:
+            raise _DownloadError(f"expected {size} bytes, got {self.part.stat().st_size}")
+
+    def _probe(self, auth):
+        """Returns the size, ETag (or Last-Modified date) and range support the server reports."""
+        try:
+            response = _requests.head(self.url, auth=auth, allow_redirects=True, timeout=_TIMEOUT)
+        except _requests.RequestException:
+            return None, None, False
+        if response.status_code >= 400:
+            return None, None, False
+        headers = response.headers
+        # the length of a compressed response is not the size of the file
+        size = headers.get("Content-Length") if "Content-Encoding" not in headers else None
+        validator = headers.get("ETag") or headers.get("Last-Modified")
+        # weak ETags cannot be used in If-Range
+        if validator and validator.startswith("W/"):
+            validator = headers.get("Last-Modified")
+        return (int(size) if size else None), validator, headers.get("Accept-Ranges") == "bytes"
+
+    def _load_state(self):
+        try:
+            return _json.loads(self._state_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _discard(self):
+        self.part.unlink(missing_ok=True)
+        for idx in range(max(self.connections, 1)):
+            self._segment(idx).unlink(missing_ok=True)
+
+    def _get(self, auth, start=0, end=None, validator=None):
+        headers = {"Accept-Encoding": "identity"}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+            if validator:
+                headers["If-Range"] = validator
+        response = _requests.get(self.url, auth=auth, stream=True, headers=headers, timeout=_TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    def _download_stream(self, auth, validator):
+        offset = self.part.stat().st_size if validator and self.part.exists() else 0
+        with self._get(auth, start=offset, validator=validator) as response:
+            if response.status_code == 206:
+                _logger.debug(f"Resuming {self.url} at byte {offset}")
+                mode = "ab"
+            else:
+                # the server sent the whole file
+                offset, mode = 0, "wb"
+            total = response.headers.get("Content-Length")
+            with self.part.open(mode) as f, _tqdm(
+                total=int(total) if total else None, unit="B", unit_scale=True, desc=self.target.name, leave=False
+            ) as progress:
+                for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                    f.write(chunk)
+                    progress.update(len(chunk))
+
+    def _download_segments(self, auth, size, validator):
+        step = -(-size // self.connections)
+        bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+        def fetch(idx):
+            start, end = bounds[idx]
+            segment = self._segment(idx)
+            have = segment.stat().st_size if segment.exists() else 0
+            if start + have > end:
+                return
+            with self._get(auth, start=start + have, end=end, validator=validator) as response:
+                if response.status_code != 206:
+                    raise _DownloadError("the file changed during the download")
+                with segment.open("ab") as f:
+                    for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                        f.write(chunk)
+
+        _logger.debug(f"Downloading {self.url} in {len(bounds)} ranges")
+        with _ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+            errors = [f.exception() for f in [pool.submit(fetch, idx) for idx in range(len(bounds))]]
+        for error in errors:
+            if isinstance(error, _DownloadError):
+                self._discard()
+            if error is not None:
+                raise error
+
+        with self.part.open("wb") as f:
+            for idx in range(len(bounds)):
+                with self._segment(idx).open("rb") as segment:
+                    _shutil.copyfileobj(segment, f, _CHUNK_SIZE)
+        for idx in range(len(bounds)):
+            self._segment(idx).unlink()
+
+    def _expected_digest(self, auth):
+        if self.checksum is None:
+            return None
+        if "://" not in self.checksum:
+            algorithm, digest = self.checksum.split(":", 1)
+            return algorithm, digest.strip().lower()
+        response = _requests.get(self.checksum, auth=auth, timeout=_TIMEOUT)
+        response.raise_for_status()
+        algorithm = self.checksum.rsplit(".", 1)[1].lower()
+        # md5sum style ("<digest>  <filename>") or BSD style ("MD5 (<filename>) = <digest>")
+        text = response.text.strip()
+        digest = text.rsplit("=", 1)[1] if text.upper().startswith(algorithm.upper() + " (") else text.split()[0]
+        return algorithm, digest.strip().lower()
+
+    def _verify_checksum(self, auth):
+        expected = self._expected_digest(auth)
+        if expected is None:
+            return
+        algorithm, digest = expected
+        actual = file_digest(self.part, algorithm)
+        if actual != digest:
+            # a corrupt file cannot be resumed
+            self._discard()
+            raise _DownloadError(f"{algorithm} checksum mismatch (expected {digest}, got {actual})")
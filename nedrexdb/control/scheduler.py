@@ -0,0 +1,151 @@
+import dataclasses as _dataclasses
+import multiprocessing as _mp
+import time as _time
+from concurrent.futures import (
+    FIRST_COMPLETED as _FIRST_COMPLETED,
+    ProcessPoolExecutor as _ProcessPoolExecutor,
+    wait as _wait,
+)
+from dataclasses import dataclass as _dataclass
+from typing import Callable as _Callable
+
+from nedrexdb.db import build_cache as _build_cache, id_index as _id_index, staging as _staging
+from nedrexdb.exceptions import AssumptionError as _AssumptionError, ProcessError as _ProcessError
+from nedrexdb.logger import logger
+
+
+@_dataclass(frozen=True)
+class ParserTask:
+    """A single step of the parser pipeline.
+
+    `sources` are the source names that disable the task when any of them is
+    in ignored_sources. `requires` names the tasks that have to finish before
+    this one starts; requirements that are not scheduled (e.g., ignored) are
+    treated as satisfied. The writes of a `staged` task are staged and merged
+    after all tasks ran (see staging); tasks that read back what they wrote
+    are not `stageable`.
+    """
+
+    name: str
+    func: _Callable
+    sources: tuple[str, ...]
+    requires: tuple[str, ...] = ()
+    staged: bool = False
+    stageable: bool = True
+
+
+def stage_leaf_tasks(tasks):
+    """Returns the tasks with the stageable tasks no other task requires staged."""
+    # no task reads what these tasks write, so it can be merged after all tasks ran
+    required = {name for task in tasks for name in task.requires}
+    return [_dataclasses.replace(task, staged=task.stageable and task.name not in required) for task in tasks]
+
+
+def resolve_tasks(tasks, ignored_sources):
+    """Returns the tasks to run in dependency order, checking that the dependencies form a DAG."""
+    names = [task.name for task in tasks]
+    if len(names) != len(set(names)):
+        raise _AssumptionError(f"parser task names are not unique: {names}")
+
+    known = set(names)
+    for task in tasks:
+        unknown = set(task.requires) - known
+        if unknown:
+            raise _AssumptionError(f"task {task.name!r} requires unknown tasks {sorted(unknown)}")
+
+    scheduled = [task for task in tasks if not any(src in ignored_sources for src in task.sources)]
+
+    # Kahn's algorithm; ties keep the declared order, so a serial run is stable.
+    scheduled_names = {task.name for task in scheduled}
+    pending = {task.name: set(task.requires) & scheduled_names for task in scheduled}
+    ordered = []
+    while pending:
+        task = next((task for task in scheduled if task.name in pending and not pending[task.name]), None)
+        if task is None:
+            raise _AssumptionError(f"cyclic parser dependencies between {sorted(pending)}")
+        del pending[task.name]
+        ordered.append(task)
+        for requires in pending.values():
+            requires.discard(task.name)
+
+    return ordered
+
+
+def _run_task(task, versions=None):
+    # ID lookups cached by this worker may be outdated by writes of other workers
+    if versions is not None:
+        _id_index.sync(versions)
+    # collections written before the task are not its output
+    _build_cache.written_collections()
+    start = _time.perf_counter()
+    if task.staged:
+        _staging.activate(task.name)
+    try:
+        task.func()
+    finally:
+        _staging.deactivate()
+    return _time.perf_counter() - start, _id_index.written_collections(), _build_cache.written_collections()
+
+
+def _log_timings(timings):
+    logger.info("Parser wall times:")
+    for name, elapsed in sorted(timings.items(), key=lambda i: i[1], reverse=True):
+        logger.info(f"  {name:<24} {elapsed:>10.1f}s")
+
+
+def run_tasks(tasks, ignored_sources, workers=1, writes=None):
+    """Runs the parser tasks, respecting their dependencies.
+
+    With a single worker the tasks run serially, in dependency order, within
+    this process. Otherwise, every task whose requirements have finished is
+    submitted to a process pool of `workers` processes. Returns the wall time
+    (in seconds) of each task; the collections each task wrote are added to
+    the `writes` dict, if given.
+    """
+    if writes is None:
+        writes = {}
+    scheduled = resolve_tasks(tasks, ignored_sources)
+    logger.info(f"Running {len(scheduled)} parser tasks with {workers} worker(s)")
+
+    timings = {}
+    if workers <= 1:
+        for task in scheduled:
+            logger.debug(f"Starting parser task {task.name!r}")
+            timings[task.name], _, writes[task.name] = _run_task(task)
+            logger.info(f"Finished parser task {task.name!r} in {timings[task.name]:.1f}s")
+        _log_timings(timings)
+        return timings
+
+    scheduled_names = {task.name for task in scheduled}
+    waiting = {task.name: task for task in scheduled}
+    done = set()
+    running = {}
+    # number of writes per collection, for the ID lookups cached in the workers
+    versions = {}
+
+    context = _mp.get_context("fork")
+    # the workers connect to MongoDB with clients of their own after the fork (see MongoInstance.connect)
+    with _ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        while waiting or running:
+            for name, task in list(waiting.items()):
+                if (set(task.requires) & scheduled_names) <= done:
+                    logger.debug(f"Starting parser task {name!r}")
+                    running[executor.submit(_run_task, task, dict(versions))] = name
+                    del waiting[name]
+
+            finished, _ = _wait(running, return_when=_FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    timings[name], written, writes[name] = future.result()
+                except Exception as e:
+                    for other in running:
+                        other.cancel()
+                    raise _ProcessError(f"parser task {name!r} failed") from e
+                done.add(name)
+                for collection in written:
+                    versions[collection] = versions.get(collection, 0) + 1
+                logger.info(f"Finished parser task {name!r} in {timings[name]:.1f}s")
+
+    _log_timings(timings)
+    return timings
@@ -1,3 +1,7 @@
+import importlib.util as _importlib_util
+import os as _os
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from contextlib import contextmanager as _contextmanager
 from dataclasses import dataclass as _dataclass
 
 from pymongo import MongoClient as _MongoClient
@@ -36,54 +40,136 @@ from nedrexdb.db.models.edges import (
     variant_associated_with_disorder as _variant_associated_with_disorder,
 )
 
+_MODELS = (
+    # Nodes
+    _disorder.Disorder,
+    _drug.Drug,
+    _gene.Gene,
+    _genomic_variant.GenomicVariant,
+    _pathway.Pathway,
+    _phenotype.Phenotype,
+    _protein.Protein,
+    _tissue.Tissue,
+    _side_effect.SideEffect,
+    _go.GO,
+    # Edges
+    _disorder_has_phenotype.DisorderHasPhenotype,
+    _disorder_is_subtype_of_disorder.DisorderIsSubtypeOfDisorder,
+    _drug_has_contraindication.DrugHasContraindication,
+    _drug_has_indication.DrugHasIndication,
+    _drug_has_target.DrugHasTarget,
+    _drug_has_side_effect.DrugHasSideEffect,
+    _gene_associated_with_disorder.GeneAssociatedWithDisorder,
+    _gene_expressed_in_tissue.GeneExpressedInTissue,
+    _protein_encoded_by_gene.ProteinEncodedByGene,
+    _protein_expressed_in_tissue.ProteinExpressedInTissue,
+    _protein_in_pathway.ProteinInPathway,
+    _protein_interacts_with_protein.ProteinInteractsWithProtein,
+    _go_is_subtype_of_go.GOIsSubtypeOfGOBase,
+    _protein_has_go_annotation.ProteinHasGOAnnotation,
+    _side_effect_same_as_phenotype.SideEffectSameAsPhenotype,
+    _variant_affects_gene.VariantAffectsGene,
+    _variant_associated_with_disorder.VariantAssociatedWithDisorder,
+)
+
+# compressor name -> module the driver needs for it
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def client_options():
+    """Returns the MongoClient options (pool size, compression, write concern) set in db.mongo_client."""
+    options = _config.get("db.mongo_client") or {}
+
+    compressors = []
+    for name in options.get("compressors", []):
+        if _importlib_util.find_spec(_COMPRESSOR_MODULES.get(name, name)) is None:
+            logger.debug(f"MongoDB compressor {name!r} is not available")
+        else:
+            compressors.append(name)
+
+    client_options = {
+        "maxPoolSize": options.get("max_pool_size", 100),
+        "minPoolSize": options.get("min_pool_size", 0),
+        "w": options.get("w", 1),
+        "journal": options.get("journal", False),
+    }
+    if compressors:
+        client_options["compressors"] = ",".join(compressors)
+    return client_options
+
+
+def connect_database(version):
+    """Returns the database of the version ('live' or 'dev'), on a new client.
+
+    MongoInstance holds the database the parsers work on; this is also used to
+    read the other one, e.g., the live database while building dev.
+    """
+    if version not in ("live", "dev"):
+        raise ValueError(f"version given ({version!r}) should be 'live' or 'dev")
+
+    # the container is reached by its name, on the port within the Docker network
+    port = _config.get(f"db.{version}.mongo_port_internal") or 27017
+    host = _config[f"db.{version}.mongo_name"]
+    dbname = _config["db.mongo_db"]
+    logger.debug(f"Connecting to MongoDB... {host}:{port}")
+    # connect=False defers connecting (and the monitor threads) until the first operation
+    return _MongoClient(host=host, port=port, connect=False, **client_options())[dbname]
+
 
 @_dataclass
 class MongoInstance:
     CLIENT = None
     DB = None
+    VERSION = None
 
     @classmethod
     def connect(cls, version):
-        if version not in ("live", "dev"):
-            raise ValueError(f"version given ({version!r}) should be 'live' or 'dev")
+        """Connects to the MongoDB container of the version ('live' or 'dev').
 
-        port = _config[f"db.{version}.mongo_port"]
-        host = _config[f"db.{version}.mongo_name"]
-        dbname = _config["db.mongo_db"]
-        logger.debug(f"Connecting to MongoDB... {host}:{port}")
-        cls.CLIENT = _MongoClient(host=host, port=27017)
-        cls.DB = cls.CLIENT[dbname]
+        Forked processes get a client of their own (see _reconnect_after_fork),
+        as a MongoClient must not be used across a fork.
+        """
+        cls.DB = connect_database(version)
+        cls.CLIENT = cls.DB.client
+        cls.VERSION = version
 
     @classmethod
-    def set_indexes(cls):
+    @_contextmanager
+    def session(cls, causal_consistency=True):
+        """Yields a client session, which is ended when the block exits.
+
+        Pass it as `session=` to the operations that have to read their own
+        writes, e.g., when they run on different connections of the pool.
+        """
+        if cls.CLIENT is None:
+            raise ValueError("run nedrexdb.db.connect() first to connect to MongoDB")
+        with cls.CLIENT.start_session(causal_consistency=causal_consistency) as session:
+            yield session
+
+    @classmethod
+    def set_indexes(cls, load=True, query=True, workers=1):
+        """Creates the indexes of the model collections.
+
+        Only the indexes needed while parsing (`load`) are created before the
+        parsers run; the indexes for querying (`query`) are built afterwards,
+        which is faster than maintaining them on every write. With several
+        `workers`, the collections are indexed concurrently.
+        """
         if cls.DB is None:
             raise ValueError("run nedrexdb.db.connect() first to connect to MongoDB")
-        # Nodes
-        _disorder.Disorder.set_indexes(cls.DB)
-        _drug.Drug.set_indexes(cls.DB)
-        _gene.Gene.set_indexes(cls.DB)
-        _genomic_variant.GenomicVariant.set_indexes(cls.DB)
-        _pathway.Pathway.set_indexes(cls.DB)
-        _phenotype.Phenotype.set_indexes(cls.DB)
-        _protein.Protein.set_indexes(cls.DB)
-        _tissue.Tissue.set_indexes(cls.DB)
-        _side_effect.SideEffect.set_indexes(cls.DB)
-        _go.GO.set_indexes(cls.DB)
-        # Edges
-        _disorder_has_phenotype.DisorderHasPhenotype.set_indexes(cls.DB)
-        _disorder_is_subtype_of_disorder.DisorderIsSubtypeOfDisorder.set_indexes(cls.DB)
-        _drug_has_contraindication.DrugHasContraindication.set_indexes(cls.DB)
-        _drug_has_indication.DrugHasIndication.set_indexes(cls.DB)
-        _drug_has_target.DrugHasTarget.set_indexes(cls.DB)
-        _drug_has_side_effect.DrugHasSideEffect.set_indexes(cls.DB)
-        _gene_associated_with_disorder.GeneAssociatedWithDisorder.set_indexes(cls.DB)
-        _gene_expressed_in_tissue.GeneExpressedInTissue.set_indexes(cls.DB)
-        _protein_encoded_by_gene.ProteinEncodedByGene.set_indexes(cls.DB)
-        _protein_expressed_in_tissue.ProteinExpressedInTissue.set_indexes(cls.DB)
-        _protein_in_pathway.ProteinInPathway.set_indexes(cls.DB)
-        _protein_interacts_with_protein.ProteinInteractsWithProtein.set_indexes(cls.DB)
-        _go_is_subtype_of_go.GOIsSubtypeOfGOBase.set_indexes(cls.DB)
-        _protein_has_go_annotation.ProteinHasGOAnnotation.set_indexes(cls.DB)
-        _side_effect_same_as_phenotype.SideEffectSameAsPhenotype.set_indexes(cls.DB)
-        _variant_affects_gene.VariantAffectsGene.set_indexes(cls.DB)
-        _variant_associated_with_disorder.VariantAssociatedWithDisorder.set_indexes(cls.DB)
+
+        def set_model_indexes(model):
+            model.set_indexes(cls.DB, load=load, query=query)
+
+        # MongoDB builds the indexes, so threads are enough to run them concurrently
+        with _ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(set_model_indexes, _MODELS))
+
+
+def _reconnect_after_fork():
+    # The parent's client (its sockets and monitor threads) must not be used, or closed, in the child
+    if MongoInstance.CLIENT is not None:
+        MongoInstance.connect(MongoInstance.VERSION)
+
+
+_os.register_at_fork(after_in_child=_reconnect_after_fork)
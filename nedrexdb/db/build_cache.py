@@ -0,0 +1,305 @@
+"""Reuse of the collections of the previous (live) build for parsers whose inputs did not change.
+
+Every parser task gets a key, the hash of
+  - the files it parses (the downloads of its sources),
+  - its code (the modules the task's function uses, with the modules they
+    import, and the shared code: nedrexdb/db, the models and common.py), and
+  - the keys of the tasks it requires (see ParserTask.requires),
+so a key only stays the same if the task would write the same documents.
+The keys and the collections each task wrote (recorded by a command listener
+while the task runs) are stored with the build, in the metadata document.
+
+When the next build runs the same tasks, a collection whose writers all have
+the same key as before is copied from the live database instead of being
+parsed again, and the tasks writing only such collections are skipped.
+Collections are restored as a whole: when one of several sources writing,
+e.g., gene_associated_with_disorder changed, all of them are parsed again.
+"""
+
+import ast as _ast
+import dataclasses as _dataclasses
+import hashlib as _hashlib
+import inspect as _inspect
+import json as _json
+import textwrap as _textwrap
+import threading as _threading
+from functools import lru_cache as _lru_cache, partial as _partial
+from pathlib import Path as _Path
+
+from bson.codec_options import CodecOptions as _CodecOptions
+from bson.raw_bson import RawBSONDocument as _RawBSONDocument
+from pymongo import InsertOne as _InsertOne, monitoring as _monitoring
+
+import nedrexdb as _nedrexdb
+from nedrexdb import config as _config
+from nedrexdb.common import file_digest as _file_digest
+from nedrexdb.db import bulk_writer as _bulk_writer, id_index as _id_index, staging as _staging
+from nedrexdb.logger import logger
+
+_WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify", "drop"}
+_PACKAGE_DIRECTORY = _Path(_nedrexdb.__file__).parent
+_RAW_CODEC_OPTIONS = _CodecOptions(document_class=_RawBSONDocument)
+
+# collections written by this process since the last call to written_collections()
+_WRITTEN = set()
+_WRITTEN_LOCK = _threading.Lock()
+
+
+class _WriteListener(_monitoring.CommandListener):
+    """Records the collections written to, and drops their ID lookups once a write is done (see id_index)."""
+
+    def __init__(self):
+        # request ID -> collection of the write commands in progress
+        self._pending = {}
+
+    def started(self, event):
+        # staged writes are recorded for the tasks when they are merged
+        if event.command_name in _WRITE_COMMANDS and not event.database_name.endswith(_staging.SUFFIX):
+            collection = event.command[event.command_name]
+            with _WRITTEN_LOCK:
+                _WRITTEN.add(collection)
+                self._pending[event.request_id] = collection
+
+    def _done(self, event):
+        with _WRITTEN_LOCK:
+            collection = self._pending.pop(event.request_id, None)
+        # the lookups are dropped after the write, so they cannot be reloaded without it
+        if collection is not None:
+            _id_index.written(collection)
+
+    def succeeded(self, event):
+        self._done(event)
+
+    def failed(self, event):
+        self._done(event)
+
+
+# applies to the clients created from here on, i.e., by MongoInstance.connect
+_monitoring.register(_WriteListener())
+
+
+def written_collections():
+    """Returns (and resets) the collections this process wrote to since the last call."""
+    with _WRITTEN_LOCK:
+        written = set(_WRITTEN)
+        _WRITTEN.clear()
+    return written
+
+
+def _hash_files(paths, manifest):
+    digest = _hashlib.sha256()
+    for path in paths:
+        stat = path.stat()
+        entry = manifest.get(str(path), {})
+        # the hash from the download manifest, unless the file was changed since
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            file_hash = entry["sha256"]
+        else:
+            file_hash = _file_digest(path)
+        digest.update(f"{path.name}\0{file_hash}\0".encode())
+    return digest.hexdigest()
+
+
+def _source_files(source, download_dir):
+    directory = download_dir / source
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.rglob("*") if path.is_file() and not path.name.endswith(".part"))
+
+
+def _module_file(name):
+    """Returns the file of a nedrexdb module (found without importing it), or None."""
+    if name is None or name.split(".")[0] != "nedrexdb":
+        return None
+    path = _PACKAGE_DIRECTORY.parent.joinpath(*name.split("."))
+    for candidate in (path.with_suffix(".py"), path / "__init__.py"):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _imported_modules(tree):
+    """Returns the (absolute) names of the modules imported anywhere in an AST, with their packages."""
+    names = set()
+    for node in _ast.walk(tree):
+        if isinstance(node, _ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, _ast.ImportFrom) and node.module and not node.level:
+            # the imported names may be modules of the package, too
+            names.add(node.module)
+            names.update(f"{node.module}.{alias.name}" for alias in node.names)
+    # importing a module runs the __init__ of its packages
+    return {".".join(name.split(".")[:idx]) for name in names for idx in range(1, name.count(".") + 2)}
+
+
+@_lru_cache(maxsize=None)
+def _parse_imports(path, mtime_ns):
+    tree = _ast.parse(path.read_text())
+    return frozenset(filter(None, map(_module_file, _imported_modules(tree))))
+
+
+def _file_imports(path):
+    return _parse_imports(path, path.stat().st_mtime_ns)
+
+
+def _import_closure(files):
+    seen = set()
+    pending = list(files)
+    while pending:
+        path = pending.pop()
+        if path not in seen:
+            seen.add(path)
+            pending.extend(_file_imports(path))
+    return seen
+
+
+def _shared_code_files():
+    db = _PACKAGE_DIRECTORY / "db"
+    return {*db.glob("*.py"), db / "parsers" / "__init__.py", _PACKAGE_DIRECTORY / "common.py",
+            *(db / "models").rglob("*.py")}
+
+
+def _code_files(func):
+    """Returns the files of the code a task's function runs, and the function's source if it is not in nedrexdb.
+
+    The function's module and the nedrexdb modules it imports (transitively)
+    are found by their import statements. A function outside the package, like
+    the wrappers in build.py, contributes its own source and the modules it uses
+    (imports, and the modules of the globals it refers to), not its whole file.
+    """
+    while isinstance(func, _partial):
+        func = func.func
+    source_file = _Path(_inspect.getsourcefile(func)).resolve()
+    if source_file.is_relative_to(_PACKAGE_DIRECTORY.resolve()):
+        return sorted(_import_closure({source_file}) | _shared_code_files()), None
+
+    source = _textwrap.dedent(_inspect.getsource(func))
+    tree = _ast.parse(source)
+    modules = _imported_modules(tree)
+    for node in _ast.walk(tree):
+        if isinstance(node, _ast.Name) and node.id in func.__globals__:
+            value = func.__globals__[node.id]
+            modules.add(value.__name__ if _inspect.ismodule(value) else getattr(value, "__module__", None))
+    roots = set(filter(None, map(_module_file, modules)))
+    return sorted(_import_closure(roots) | _shared_code_files()), source
+
+
+def _code_hash(func):
+    files, source = _code_files(func)
+    digest = _hashlib.sha256(_hash_files(files, {}).encode())
+    if source is not None:
+        digest.update(source.encode())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    def __init__(self, previous=None, download_dir=None):
+        # task name -> {"key": ..., "collections": [...]} of the previous build
+        self.previous = previous or {}
+        self._download_dir = download_dir
+        self._file_hashes = {}
+        self.keys = {}
+        self.restored = set()
+        self.entries = {}
+
+    @classmethod
+    def from_database(cls, db):
+        """Returns the cache recorded with the build in `db`; empty if it cannot be read."""
+        try:
+            metadata = db["metadata"].find_one() or {}
+        except Exception as e:
+            logger.warning(f"Could not read the build cache: {e}")
+            metadata = {}
+        return cls(metadata.get("build_cache"))
+
+    @property
+    def download_dir(self):
+        if self._download_dir is None:
+            self._download_dir = _Path(_config["db.root_directory"]) / _config["sources.directory"]
+        # resolved, as the download manifest has the absolute paths of the files
+        return _Path(self._download_dir).resolve()
+
+    def _manifest(self):
+        try:
+            entries = _json.loads((self.download_dir / "manifest.json").read_text())
+        except (OSError, ValueError):
+            return {}
+        return {entry["file"]: entry for entry in entries.values() if "file" in entry and "sha256" in entry}
+
+    def task_keys(self, tasks):
+        """Returns the key of each task; `tasks` are the scheduled tasks, in dependency order."""
+        manifest = self._manifest()
+        keys = {}
+        for task in tasks:
+            digest = _hashlib.sha256(_nedrexdb.__version__.encode())
+            for source in sorted(task.sources):
+                if source not in self._file_hashes:
+                    self._file_hashes[source] = _hash_files(_source_files(source, self.download_dir), manifest)
+                digest.update(f"source:{source}:{self._file_hashes[source]}".encode())
+            digest.update(f"code:{_code_hash(task.func)}".encode())
+            for name in sorted(set(task.requires) & set(keys)):
+                digest.update(f"requires:{name}:{keys[name]}".encode())
+            keys[task.name] = digest.hexdigest()
+        return keys
+
+    def plan(self, tasks):
+        """Returns the tasks to skip and the collections to restore from the previous build.
+
+        Nothing is reused unless the previous build ran the same tasks, as the
+        collections written by a new task are not known.
+        """
+        self.keys = self.task_keys(tasks)
+        if set(self.keys) != set(self.previous):
+            if self.previous:
+                logger.info("The parser tasks changed since the previous build, parsing all sources")
+            return set(), set()
+
+        writers = {}
+        for name, entry in self.previous.items():
+            for collection in entry["collections"]:
+                writers.setdefault(collection, set()).add(name)
+
+        skipped = {name for name, key in self.keys.items() if self.previous[name]["key"] == key}
+        # a collection is only restored if none of its writers runs again
+        changed = True
+        while changed:
+            changed = False
+            for names in writers.values():
+                if names & skipped and not names <= skipped:
+                    skipped -= names
+                    changed = True
+        restored = {collection for collection, names in writers.items() if names <= skipped}
+        return skipped, restored
+
+    def skip(self, tasks):
+        """Returns the tasks, with the functions of those whose output is restored replaced by no-ops."""
+        skipped, self.restored = self.plan(tasks)
+        for name in skipped:
+            self.entries[name] = self.previous[name]
+        if skipped:
+            logger.info(f"Reusing the output of {len(skipped)} parser task(s): {sorted(skipped)}")
+        return [_dataclasses.replace(task, func=_restored) if task.name in skipped else task for task in tasks]
+
+    def record(self, writes):
+        """Records the collections written by the tasks that ran (name -> collections)."""
+        for name, collections in writes.items():
+            if self.entries.get(name, {}).get("key") != self.keys[name]:
+                self.entries[name] = {"key": self.keys[name], "collections": sorted(set(collections) - {"metadata"})}
+
+    def restore(self, source_db, target_db):
+        """Copies the restored collections from `source_db` (the live database) to `target_db`."""
+        for collection in sorted(self.restored):
+            logger.info(f"Restoring {collection!r} from the previous build")
+            cursor = source_db[collection].with_options(codec_options=_RAW_CODEC_OPTIONS).find(batch_size=10_000)
+            writer = _bulk_writer.BulkWriter(target_db[collection])
+            try:
+                writer.write(_InsertOne(doc) for doc in cursor)
+            finally:
+                writer.close()
+
+    def save(self, db):
+        db["metadata"].update_one({}, {"$set": {"build_cache": self.entries}})
+
+
+def _restored():
+    pass
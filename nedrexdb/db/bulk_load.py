@@ -0,0 +1,207 @@
+"""Bulk-load mode: merge the upserts of a parser in memory and insert whole documents.
+
+Every model's generate_update returns an upsert UpdateOne ($setOnInsert,
+$set, $addToSet, $max/$min), which makes MongoDB look up and rewrite a
+document per update. In bulk-load mode (db.bulk_load), `loader` merges the
+upserts of a collection by their filter (e.g., primaryDomainId or
+(sourceDomainId, targetDomainId)) and, if the collection is empty when the
+loader first writes to it, inserts the merged documents. The writes go
+through a BulkWriter (see bulk_writer).
+
+Documents that already exist (written by another parser, or by an earlier
+flush of the same loader) violate the collection's unique index; they are
+written again as merged upserts. Collections without a unique index on the
+filter fields, or that are not empty, get merged upserts right away. Other
+operations (e.g., updates without upsert, which enrich existing documents)
+are passed through after the merged documents are written.
+"""
+
+from contextlib import contextmanager as _contextmanager
+
+from pymongo import InsertOne as _InsertOne, UpdateOne as _UpdateOne
+
+from nedrexdb import config as _config
+from nedrexdb.db import MongoInstance, staging as _staging
+from nedrexdb.db.bulk_writer import BulkWriter as _BulkWriter
+from nedrexdb.logger import logger
+
+# write the held operations once this many documents (or passed-through operations) are held in memory
+_DEFAULT_MAX_KEYS = 1_000_000
+_DUPLICATE_KEY = 11000
+
+
+def _add_to_set(values, new):
+    for value in new["$each"] if isinstance(new, dict) and "$each" in new else [new]:
+        if value not in values:
+            values.append(value)
+
+
+def _bson_order(value):
+    # null sorts before any number in MongoDB's $max / $min comparisons
+    return (value is not None, value)
+
+
+def merge_update(merged, update):
+    """Merges the update document of an upsert into `merged`, following MongoDB's semantics."""
+    for field, value in update.get("$setOnInsert", {}).items():
+        merged["$setOnInsert"].setdefault(field, value)
+    merged["$set"].update(update.get("$set", {}))
+    for field, value in update.get("$addToSet", {}).items():
+        _add_to_set(merged["$addToSet"].setdefault(field, []), value)
+    for op, pick in (("$max", max), ("$min", min)):
+        for field, value in update.get(op, {}).items():
+            if field in merged[op]:
+                value = pick(merged[op][field], value, key=_bson_order)
+            merged[op][field] = value
+
+    unsupported = set(update) - {"$setOnInsert", "$set", "$addToSet", "$max", "$min"}
+    if unsupported:
+        raise ValueError(f"cannot merge update operators {sorted(unsupported)}")
+
+
+def merged_document(query, merged):
+    """Returns the document that an upsert of the merged update inserts."""
+    doc = dict(query)
+    doc.update(merged["$setOnInsert"])
+    doc.update(merged["$set"])
+    for op in ("$addToSet", "$max", "$min"):
+        doc.update(merged[op])
+    return doc
+
+
+def merged_upsert(query, merged):
+    update = {op: fields for op, fields in merged.items() if fields}
+    if "$addToSet" in update:
+        update["$addToSet"] = {field: {"$each": values} for field, values in update["$addToSet"].items()}
+    return _UpdateOne(query, update, upsert=True)
+
+
+class _InsertOrUpsert(_InsertOne):
+    """Inserts a merged document; `upsert` is written instead if the document exists already."""
+
+    __slots__ = ("upsert",)
+
+    def __init__(self, document, upsert):
+        super().__init__(document)
+        self.upsert = upsert
+
+
+def _upsert_existing(operations, errors):
+    if any(error["code"] != _DUPLICATE_KEY for error in errors):
+        return None
+    # the documents exist already, so their updates are merged into them instead
+    return [operations[error["index"]].upsert for error in errors]
+
+
+class BulkLoader:
+    def __init__(self, coll, max_keys=_DEFAULT_MAX_KEYS):
+        self._coll = coll
+        self._max_keys = max_keys
+        self._merged = {}
+        self._passthrough = []
+        self._insert = None
+        self._writer = _BulkWriter(coll, on_errors=_upsert_existing)
+
+    @property
+    def stats(self):
+        return self._writer.stats
+
+    def _can_insert(self, query):
+        if self._coll.estimated_document_count() != 0:
+            return False
+        fields = set(query)
+        return any(
+            index.get("unique") and {field for field, _ in index["key"]} == fields
+            for index in self._coll.index_information().values()
+        )
+
+    def write(self, operations):
+        for op in operations:
+            # UpdateOne keeps the filter and update documents in private attributes
+            if not (isinstance(op, _UpdateOne) and op._upsert):
+                self._passthrough.append(op)
+                continue
+
+            key = tuple(sorted(op._filter.items()))
+            if key not in self._merged:
+                empty = {"$setOnInsert": {}, "$set": {}, "$addToSet": {}, "$max": {}, "$min": {}}
+                self._merged[key] = (op._filter, empty)
+            merge_update(self._merged[key][1], op._doc)
+
+        if len(self._merged) + len(self._passthrough) >= self._max_keys:
+            self.flush()
+
+    def _write_merged(self):
+        if not self._merged:
+            return
+        if self._insert is None:
+            self._insert = self._can_insert(next(iter(self._merged.values()))[0])
+            mode = "insert_many" if self._insert else "upserts"
+            logger.debug(f"Bulk-loading {self._coll.name!r} with {mode}")
+
+        if self._insert:
+            self._writer.write(
+                _InsertOrUpsert(merged_document(query, merged), merged_upsert(query, merged))
+                for query, merged in self._merged.values()
+            )
+        else:
+            self._writer.write(merged_upsert(query, merged) for query, merged in self._merged.values())
+        self._merged = {}
+
+    def flush(self):
+        self._write_merged()
+        if self._passthrough:
+            # the passed-through updates may refer to the merged documents
+            self._writer.flush()
+            self._writer.write(self._passthrough)
+            self._passthrough = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+@_contextmanager
+def loader(collection_name):
+    """Yields a writer for the collection; call `write` with chunks of operations.
+
+    In bulk-load mode, the operations are merged and written when the block
+    exits (or when db.bulk_load_max_keys documents are held). Otherwise, they
+    are passed on to a BulkWriter right away. The operations of a staged task
+    are staged instead (see staging).
+    """
+    coll = MongoInstance.DB[collection_name]
+    task_name = _staging.current()
+    if task_name is not None:
+        writer = _staging.StagingWriter(_BulkWriter(_staging.collection(task_name, collection_name)), task_name,
+                                        collection_name)
+    elif _config.get("db.bulk_load"):
+        writer = BulkLoader(coll, _config.get("db.bulk_load_max_keys") or _DEFAULT_MAX_KEYS)
+    else:
+        writer = _BulkWriter(coll)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def merge_staged(task_names):
+    """Writes the operations staged by the tasks to the shared collections.
+
+    The operations of each collection are written through a loader, task by
+    task in the given order, so the merged documents do not depend on the order
+    the tasks ran in. Returns the collections merged for each task.
+    """
+    contributions = {}
+    merged = {}
+    for task_name in task_names:
+        merged[task_name] = _staging.staged_collections(task_name)
+        for collection_name in merged[task_name]:
+            contributions.setdefault(collection_name, []).append(task_name)
+
+    for collection_name, contributors in sorted(contributions.items()):
+        logger.info(f"Merging the staged writes of {contributors} into {collection_name!r}")
+        with loader(collection_name) as writer:
+            for task_name in contributors:
+                writer.write(_staging.operations(task_name, collection_name))
+    return merged
@@ -0,0 +1,179 @@
+"""Unordered bulk writes that run in the background while the parsers go on parsing.
+
+A BulkWriter batches write operations by their BSON size (db.write_batch_bytes)
+and writes the batches with unordered bulk_write calls on a small thread pool
+(db.write_workers). At most db.write_max_in_flight batches are queued or being
+written; beyond that, `write` blocks until a batch is done, so a parser cannot
+run ahead of MongoDB (instead of throttling with fixed chunk sizes or sleeps).
+
+Write errors do not stop the other batches; they are counted in the writer's
+`stats` and the first one is raised when the writer is closed, unless an
+`on_errors` handler replaces the failed operations (see bulk_load).
+"""
+
+import threading as _threading
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from contextlib import contextmanager as _contextmanager
+from dataclasses import dataclass as _dataclass
+
+import bson as _bson
+from bson.raw_bson import RawBSONDocument as _RawBSONDocument
+from pymongo.errors import BulkWriteError as _BulkWriteError
+
+from nedrexdb import config as _config
+from nedrexdb.db import MongoInstance, staging as _staging
+from nedrexdb.logger import logger
+
+_DEFAULT_BATCH_BYTES = 8 * 1024 * 1024
+# MongoDB's maxWriteBatchSize; bigger batches are split by the driver anyway
+_MAX_BATCH_OPERATIONS = 100_000
+_DEFAULT_WORKERS = 2
+_DEFAULT_MAX_IN_FLIGHT = 4
+
+
+@_dataclass
+class WriteStats:
+    inserted: int = 0
+    upserted: int = 0
+    matched: int = 0
+    modified: int = 0
+    deleted: int = 0
+    errors: int = 0
+
+    def add(self, result):
+        """Adds the counts of a bulk_api_result (of a BulkWriteResult or BulkWriteError)."""
+        self.inserted += result.get("nInserted", 0)
+        self.upserted += result.get("nUpserted", 0)
+        self.matched += result.get("nMatched", 0)
+        self.modified += result.get("nModified", 0)
+        self.deleted += result.get("nRemoved", 0)
+        self.errors += len(result.get("writeErrors", ())) + len(result.get("writeConcernErrors", ()))
+
+
+def operation_size(op):
+    """Returns the (approximate) BSON size of a write operation."""
+    size = 0
+    for attr in ("_filter", "_doc"):
+        doc = getattr(op, attr, None)
+        if isinstance(doc, _RawBSONDocument):
+            size += len(doc.raw)
+        elif isinstance(doc, dict):
+            size += len(_bson.encode(doc))
+    return size
+
+
+class BulkWriter:
+    """Writes operations to a collection in unordered batches, in background threads.
+
+    `on_errors(operations, write_errors)` is called (in a writer thread) when a
+    batch has write errors; it returns the operations to write instead, or
+    None if the errors cannot be handled.
+    """
+
+    def __init__(self, coll, batch_bytes=None, workers=None, max_in_flight=None, on_errors=None):
+        self._coll = coll
+        self._batch_bytes = batch_bytes or _config.get("db.write_batch_bytes") or _DEFAULT_BATCH_BYTES
+        workers = workers or _config.get("db.write_workers") or _DEFAULT_WORKERS
+        max_in_flight = max_in_flight or _config.get("db.write_max_in_flight") or _DEFAULT_MAX_IN_FLIGHT
+        self._on_errors = on_errors
+
+        self._executor = _ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"write-{coll.name}")
+        self._in_flight = _threading.BoundedSemaphore(max_in_flight)
+        self._futures = set()
+        self._lock = _threading.Lock()
+        self._error = None
+
+        self._batch = []
+        self._size = 0
+        self.stats = WriteStats()
+
+    def write(self, operations):
+        for op in operations:
+            self._batch.append(op)
+            self._size += operation_size(op)
+            if self._size >= self._batch_bytes or len(self._batch) >= _MAX_BATCH_OPERATIONS:
+                self._submit()
+
+    def _submit(self):
+        if self._error is not None:
+            raise self._error
+        if not self._batch:
+            return
+        batch, self._batch, self._size = self._batch, [], 0
+
+        # blocks while max_in_flight batches are pending
+        self._in_flight.acquire()
+        future = self._executor.submit(self._write_batch, batch)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._in_flight.release()
+        with self._lock:
+            self._futures.discard(future)
+
+    def _write_batch(self, batch):
+        try:
+            result = self._coll.bulk_write(batch, ordered=False).bulk_api_result
+        except _BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            retry = None
+            if self._on_errors is not None and errors and not e.details.get("writeConcernErrors"):
+                retry = self._on_errors(batch, errors)
+            if retry is None:
+                self._fail(e)
+                result = e.details
+            else:
+                # the handled errors are not counted, their replacement operations are
+                result = {**e.details, "writeErrors": []}
+                if retry:
+                    self._write_batch(retry)
+        except Exception as e:
+            self._fail(e)
+            return
+        with self._lock:
+            self.stats.add(result)
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+
+    def flush(self):
+        """Writes the pending operations and waits until all batches are written."""
+        self._submit()
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                break
+            for future in futures:
+                future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+        logger.debug(f"Wrote to {self._coll.name!r}: {self.stats}")
+        if self._error is not None:
+            raise self._error
+
+
+@_contextmanager
+def writer(collection_name, **kwargs):
+    """Yields a BulkWriter for the collection; its operations are all written when the block exits.
+
+    The operations of a staged task are staged instead (see staging).
+    """
+    task_name = _staging.current()
+    if task_name is not None:
+        bulk_writer = _staging.StagingWriter(BulkWriter(_staging.collection(task_name, collection_name), **kwargs),
+                                             task_name, collection_name)
+    else:
+        bulk_writer = BulkWriter(MongoInstance.DB[collection_name], **kwargs)
+    try:
+        yield bulk_writer
+    finally:
+        bulk_writer.close()
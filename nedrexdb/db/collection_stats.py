@@ -3,6 +3,7 @@ from collections import defaultdict
 from tqdm import tqdm
 
 from nedrexdb import config as _config
+from nedrexdb.db import columnar as _columnar
 from nedrexdb.logger import logger
 import time as _time
 
@@ -28,10 +29,15 @@ def profile_collections(db):
                 logger.warning(f"Collection '{coll}' is empty")
                 continue
 
-            for doc in tqdm(db[coll].find(), total=total_docs, desc=f"Processing {coll}", leave=False):
-                doc_count += 1
-                for attr in doc.keys():
-                    attr_counts[attr] += 1
+            if _config.get("db.columnar") and _columnar.parts(coll):
+                doc_count, counts = _columnar.attribute_counts(coll)
+                attr_counts["_id"] = doc_count
+                attr_counts.update(counts)
+            else:
+                for doc in tqdm(db[coll].find(), total=total_docs, desc=f"Processing {coll}", leave=False):
+                    doc_count += 1
+                    for attr in doc.keys():
+                        attr_counts[attr] += 1
 
             unique_attrs = list(attr_counts.keys())
 
@@ -0,0 +1,227 @@
+"""Columnar (Parquet) copies of the collections, read by the export and the profiling.
+
+Once the parsers are done, `write_collections` streams every node and edge
+collection out of MongoDB once, into Parquet files under
+<db.root_directory>/columnar/<collection>/ (db.columnar). The Neo4j export
+and the collection profiling then read the columns they need from these
+files (see `read`) instead of scanning the documents in MongoDB again.
+
+Documents keep their nesting (as structs); `_id` is left out. The files are
+read back to the same values as the documents: a field is stored in an Arrow
+type only if its values convert to it exactly (e.g., not ints and floats
+mixed), and BSON-encoded otherwise, which also keeps fields set to null apart
+from missing ones. A part file is started whenever a batch of documents does
+not fit the schema of the current part, e.g., when a field only appears later
+in the collection or has a different type.
+"""
+
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from pathlib import Path as _Path
+import shutil as _shutil
+
+import bson as _bson
+import pyarrow as _pa
+import pyarrow.parquet as _pq
+from more_itertools import chunked as _chunked
+
+from nedrexdb import config as _config
+from nedrexdb.logger import logger
+
+_BATCH_ROWS = 50_000
+_ENCODED = {b"encoding": b"bson"}
+# the value of a field a document does not have
+_MISSING = object()
+
+
+def directory(collection=None):
+    root = _Path(_config["db.root_directory"]) / "columnar"
+    return root if collection is None else root / collection
+
+
+def parts(collection):
+    """Returns the Parquet files of a collection (none if it has not been written)."""
+    return sorted(directory(collection).glob("part-*.parquet"))
+
+
+def _same(a, b):
+    """Returns whether the values are equal and of the same types (1 and 1.0 are not the same)."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(_same, a, b))
+    return a == b
+
+
+def _writable(data_type):
+    # Parquet cannot store structs without fields (empty embedded documents)
+    if _pa.types.is_struct(data_type):
+        return data_type.num_fields > 0 and all(_writable(field.type) for field in data_type)
+    if _pa.types.is_list(data_type):
+        return _writable(data_type.value_type)
+    return True
+
+
+def _is_encoded(field):
+    return field.metadata is not None and field.metadata.get(b"encoding") == b"bson"
+
+
+def _encode(values):
+    return _pa.array([None if value is _MISSING else _bson.encode({"v": value}) for value in values], _pa.binary())
+
+
+def _decode(value):
+    return _bson.decode(value)["v"]
+
+
+def _native(values):
+    """Returns the values as an Arrow array, or None if they would not be read back exactly."""
+    # a null column cannot tell a field set to null from a missing one
+    if any(value is None for value in values):
+        return None
+    values = [None if value is _MISSING else value for value in values]
+    try:
+        array = _pa.array(values)
+    except (_pa.ArrowInvalid, _pa.ArrowTypeError, OverflowError):
+        return None
+    if not _writable(array.type) or not _same(array.to_pylist(), values):
+        return None
+    return array
+
+
+def _new_column(key, values):
+    """Returns the field and the array of the values, BSON-encoded if they have no exact Arrow type."""
+    array = _native(values)
+    if array is None:
+        logger.debug(f"writing field {key!r} BSON-encoded")
+        return _pa.field(key, _pa.binary(), metadata=_ENCODED), _encode(values)
+    return _pa.field(key, array.type), array
+
+
+def _conformed_column(field, values):
+    """Returns the array of the values with the type of the field, or None if they do not fit it."""
+    if _is_encoded(field):
+        return _encode(values)
+    array = _native(values)
+    if array is None:
+        return None
+    if array.type == _pa.null():
+        # none of the documents have the field
+        return _pa.nulls(len(values), field.type)
+    return array if array.type == field.type else None
+
+
+def _record_batch(rows, schema=None):
+    """Returns the documents as a record batch, with the schema if given (None if they do not fit it)."""
+    # the fields of all documents, in order of first appearance
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    if schema is None:
+        fields = []
+        arrays = []
+        for key in keys:
+            field, array = _new_column(key, [row.get(key, _MISSING) for row in rows])
+            fields.append(field)
+            arrays.append(array)
+        return _pa.RecordBatch.from_arrays(arrays, schema=_pa.schema(fields))
+
+    if not set(keys) <= set(schema.names):
+        return None
+    arrays = []
+    for field in schema:
+        array = _conformed_column(field, [row.get(field.name, _MISSING) for row in rows])
+        if array is None:
+            return None
+        arrays.append(array)
+    return _pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class CollectionWriter:
+    """Writes documents of a collection to Parquet part files, one batch at a time."""
+
+    def __init__(self, collection):
+        self._directory = directory(collection)
+        if self._directory.exists():
+            _shutil.rmtree(self._directory)
+        self._directory.mkdir(parents=True)
+        self._writer = None
+        self._parts = 0
+        self.rows = 0
+
+    def write(self, rows):
+        batch = _record_batch(rows, self._writer.schema) if self._writer is not None else None
+        if batch is None:
+            self._close_part()
+            batch = _record_batch(rows)
+            path = self._directory / f"part-{self._parts:05d}.parquet"
+            self._writer = _pq.ParquetWriter(path, batch.schema, compression="zstd")
+            self._parts += 1
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def _close_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        self._close_part()
+
+
+def write_collection(db, collection, batch_rows=_BATCH_ROWS):
+    writer = CollectionWriter(collection)
+    try:
+        cursor = db[collection].find({}, {"_id": 0}, batch_size=batch_rows)
+        for rows in _chunked(cursor, batch_rows):
+            writer.write(rows)
+    finally:
+        writer.close()
+    logger.debug(f"Wrote {writer.rows} documents of {collection!r} to Parquet")
+    return writer.rows
+
+
+def write_collections(db, collections, workers=1):
+    """Writes the (existing) collections to Parquet, `workers` collections at a time."""
+    existing = set(db.list_collection_names())
+    collections = [collection for collection in collections if collection in existing]
+    logger.info(f"Writing {len(collections)} collections to Parquet with {workers} worker(s)")
+    # the cursors and Arrow's writers release the GIL for most of the work
+    with _ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda collection: write_collection(db, collection), collections))
+
+
+def read(collection, fields=None, batch_rows=_BATCH_ROWS):
+    """Yields the documents of a collection, with only the top-level `fields` (if given) read from the files.
+
+    Fields a document did not have are left out, as in a MongoDB projection.
+    """
+    for path in parts(collection):
+        parquet = _pq.ParquetFile(path)
+        names = parquet.schema_arrow.names
+        columns = names if fields is None else [name for name in fields if name in names]
+        encoded = {field.name for field in parquet.schema_arrow if _is_encoded(field)}
+        if not columns:
+            # the documents have none of the fields
+            for _ in range(parquet.metadata.num_rows):
+                yield {}
+            continue
+        for batch in parquet.iter_batches(batch_size=batch_rows, columns=columns):
+            for row in batch.to_pylist():
+                yield {
+                    key: _decode(value) if key in encoded else value for key, value in row.items() if value is not None
+                }
+
+
+def attribute_counts(collection):
+    """Returns the number of documents and the number of documents with each top-level field."""
+    documents = 0
+    counts = {}
+    for path in parts(collection):
+        parquet = _pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=_BATCH_ROWS):
+            documents += batch.num_rows
+            for name, column in zip(batch.schema.names, batch.columns):
+                present = batch.num_rows - column.null_count
+                if present:
+                    counts[name] = counts.get(name, 0) + present
+    return documents, counts
@@ -0,0 +1,172 @@
+"""Column types of the Neo4j export, derived from the pydantic models.
+
+Types use the neo4j-admin import names (string, int, double, boolean and
+their array forms, e.g. string[]). The declared types can be overridden per
+collection in the config, e.g.
+
+    [export_schema.gene_associated_with_disorder]
+    omimMappingCode = "string"
+    omimFlags = false  # do not export this field
+"""
+
+import types as _types
+import typing as _typing
+
+from nedrexdb import config as _config
+from nedrexdb.exceptions import ConfigError as _ConfigError
+from nedrexdb.db.models.nodes import (
+    disorder as _disorder,
+    drug as _drug,
+    gene as _gene,
+    genomic_variant as _genomic_variant,
+    go as _go,
+    pathway as _pathway,
+    phenotype as _phenotype,
+    protein as _protein,
+    side_effect as _side_effect,
+    tissue as _tissue,
+)
+from nedrexdb.db.models.edges import (
+    disorder_has_phenotype as _disorder_has_phenotype,
+    disorder_is_subtype_of_disorder as _disorder_is_subtype_of_disorder,
+    drug_has_contraindication as _drug_has_contraindication,
+    drug_has_indication as _drug_has_indication,
+    drug_has_side_effect as _drug_has_side_effect,
+    drug_has_target as _drug_has_target,
+    gene_associated_with_disorder as _gene_associated_with_disorder,
+    gene_expressed_in_tissue as _gene_expressed_in_tissue,
+    go_is_subtype_of_go as _go_is_subtype_of_go,
+    protein_encoded_by_gene as _protein_encoded_by_gene,
+    protein_expressed_in_tissue as _protein_expressed_in_tissue,
+    protein_has_go_annotation as _protein_has_go_annotation,
+    protein_in_pathway as _protein_in_pathway,
+    protein_interacts_with_protein as _protein_interacts_with_protein,
+    side_effect_same_as_phenotype as _side_effect_same_as_phenotype,
+    variant_affects_gene as _variant_affects_gene,
+    variant_associated_with_disorder as _variant_associated_with_disorder,
+)
+
+SCALAR_TYPES = ("string", "int", "double", "boolean")
+
+_PYTHON_TYPES = {str: "string", int: "int", float: "double", bool: "boolean"}
+
+# class-level model attributes that are not stored in the documents
+_NON_DOCUMENT_FIELDS = {"collection_name", "node_type", "edge_type"}
+
+# Several models may write to the same collection (e.g., the drug subtypes).
+_MODELS = [
+    _disorder.Disorder,
+    _drug.Drug,
+    _drug.BiotechDrug,
+    _drug.SmallMoleculeDrug,
+    _gene.Gene,
+    _genomic_variant.GenomicVariant,
+    _go.GO,
+    _pathway.Pathway,
+    _phenotype.Phenotype,
+    _protein.Protein,
+    _side_effect.SideEffect,
+    _tissue.Tissue,
+    _disorder_has_phenotype.DisorderHasPhenotype,
+    _disorder_is_subtype_of_disorder.DisorderIsSubtypeOfDisorder,
+    _drug_has_contraindication.DrugHasContraindication,
+    _drug_has_indication.DrugHasIndication,
+    _drug_has_side_effect.DrugHasSideEffect,
+    _drug_has_target.DrugHasTarget,
+    _gene_associated_with_disorder.GeneAssociatedWithDisorder,
+    _gene_expressed_in_tissue.GeneExpressedInTissue,
+    _go_is_subtype_of_go.GOIsSubtypeOfGO,
+    _protein_encoded_by_gene.ProteinEncodedByGene,
+    _protein_expressed_in_tissue.ProteinExpressedInTissue,
+    _protein_has_go_annotation.ProteinHasGOAnnotation,
+    _protein_in_pathway.ProteinInPathway,
+    _protein_interacts_with_protein.ProteinInteractsWithProtein,
+    _side_effect_same_as_phenotype.SideEffectSameAsPhenotype,
+    _variant_affects_gene.VariantAffectsGene,
+    _variant_associated_with_disorder.VariantAssociatedWithDisorder,
+]
+
+# Collections that are written without a pydantic model.
+_UNMODELLED_COLLECTIONS = {
+    "signature": {
+        "primaryDomainId": "string",
+        "domainIds": "string[]",
+        "database": "string",
+        "displayName": "string",
+        "dataSources": "string[]",
+    },
+    "protein_has_signature": {
+        "sourceDomainId": "string",
+        "targetDomainId": "string",
+        "dataSources": "string[]",
+    },
+    "molecule_similarity_molecule": {
+        "memberOne": "string",
+        "memberTwo": "string",
+        "dataSources": "string[]",
+        "morgan_r1": "double",
+        "morgan_r2": "double",
+        "morgan_r3": "double",
+        "morgan_r4": "double",
+        "maccs": "double",
+    },
+}
+
+
+def annotation_type(annotation):
+    """Maps a pydantic field annotation to a Neo4j import type (None if it has no equivalent)."""
+    origin = _typing.get_origin(annotation)
+
+    if origin is _typing.Annotated:
+        return annotation_type(_typing.get_args(annotation)[0])
+    if origin in (_typing.Union, _types.UnionType):
+        args = [arg for arg in _typing.get_args(annotation) if arg is not type(None)]
+        return annotation_type(args[0]) if len(args) == 1 else None
+    if origin is list:
+        (item,) = _typing.get_args(annotation)
+        item_type = annotation_type(item)
+        return f"{item_type}[]" if item_type in SCALAR_TYPES else None
+
+    return _PYTHON_TYPES.get(annotation)
+
+
+def model_column_types(model):
+    column_types = {}
+    for name, field in model.model_fields.items():
+        if name in _NON_DOCUMENT_FIELDS:
+            continue
+        data_type = annotation_type(field.annotation)
+        if data_type is not None:
+            column_types[name] = data_type
+    return column_types
+
+
+def _validate(collection, field, data_type):
+    if data_type is False:
+        return
+    if not isinstance(data_type, str) or data_type.removesuffix("[]") not in SCALAR_TYPES:
+        raise _ConfigError(f"invalid export type {data_type!r} for {collection}.{field}")
+
+
+def get_column_types(collection):
+    """Returns the declared column types of a collection, or None if nothing is declared.
+
+    Fields overridden with `false` in the config are not exported.
+    """
+    column_types = {}
+    for model in _MODELS:
+        if model.collection_name == collection:
+            for name, data_type in model_column_types(model).items():
+                column_types.setdefault(name, data_type)
+    column_types.update(_UNMODELLED_COLLECTIONS.get(collection, {}))
+
+    overrides = (_config.get("export_schema") or {}).get(collection, {})
+    for field, data_type in overrides.items():
+        _validate(collection, field, data_type)
+        column_types[field] = data_type
+
+    if not column_types:
+        return None
+
+    column_types["type"] = "string"
+    return {field: data_type for field, data_type in column_types.items() if data_type is not False}
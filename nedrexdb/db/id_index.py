@@ -0,0 +1,110 @@
+"""Process-wide cache of the ID lookups that parsers build from node collections.
+
+Parsers used to scan whole collections (including, e.g., protein sequences)
+to build sets of primaryDomainIds or maps of domainIds. The lookups here are
+loaded once with projections and shared by all parsers running in the same
+process.
+
+A parser writing to a collection calls `invalidate` afterwards. Besides, the
+command listener of build_cache reports every completed write (`written`),
+so the lookups of a collection are also dropped when a parser does not call
+`invalidate`. When the parsers run in several processes, the scheduler
+passes the written collections on (see `written_collections` and `sync`),
+so that the other processes reload the lookups of those collections as well.
+"""
+
+import threading as _threading
+
+from nedrexdb.db import MongoInstance
+from nedrexdb.logger import logger
+
+_BATCH_SIZE = 10_000
+
+# (collection, field, prefix) -> lookup; field is None for the set of primaryDomainIds
+_CACHE = {}
+# collection -> number of writes (by any process) the cached lookups are up to date with
+_VERSIONS = {}
+# collections written by this process since the last call to written_collections()
+_WRITTEN = set()
+# writes are reported from the writer threads
+_LOCK = _threading.RLock()
+
+
+def _cached(key, load):
+    with _LOCK:
+        lookup = _CACHE.get(key)
+    if lookup is None:
+        logger.debug(f"Loading ID lookup {key}")
+        lookup = load()
+        with _LOCK:
+            _CACHE[key] = lookup
+    return lookup
+
+
+def _drop(collection):
+    with _LOCK:
+        for key in [key for key in _CACHE if key[0] == collection]:
+            del _CACHE[key]
+
+
+def primary_ids(model):
+    """Returns the primaryDomainIds of a collection. The set must not be modified."""
+    collection = model.collection_name
+
+    def load():
+        return frozenset(model.find_field(MongoInstance.DB, "primaryDomainId"))
+
+    return _cached((collection, None, None), load)
+
+
+def id_map(model, field="domainIds", prefix=""):
+    """Returns a map of `field` values (starting with `prefix`) to the primaryDomainIds having them.
+
+    `field` may hold a single value or a list of values. The map must not be modified.
+    """
+    collection = model.collection_name
+
+    def load():
+        mapping = {}
+        projection = {"_id": 0, "primaryDomainId": 1, field: 1}
+        for doc in model.find(MongoInstance.DB, projection=projection, batch_size=_BATCH_SIZE):
+            values = doc.get(field)
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                if value and value.startswith(prefix):
+                    mapping.setdefault(value, []).append(doc["primaryDomainId"])
+        return mapping
+
+    return _cached((collection, field, prefix), load)
+
+
+def invalidate(model):
+    """Drops the cached lookups of a collection after writing to it."""
+    written(model.collection_name)
+
+
+def written(collection):
+    """Drops the cached lookups of a collection (by name) that was written to."""
+    with _LOCK:
+        _WRITTEN.add(collection)
+        _drop(collection)
+
+
+def written_collections():
+    """Returns (and resets) the collections this process wrote to since the last call."""
+    with _LOCK:
+        collections = set(_WRITTEN)
+        _WRITTEN.clear()
+    return collections
+
+
+def sync(versions):
+    """Drops the lookups of collections that were written by other processes.
+
+    `versions` maps collection names to the number of writes to them so far.
+    """
+    for collection, version in versions.items():
+        if _VERSIONS.get(collection, 0) != version:
+            _drop(collection)
+            _VERSIONS[collection] = version
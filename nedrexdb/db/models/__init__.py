@@ -1,12 +1,53 @@
+import numpy as _np
+from bson.codec_options import CodecOptions as _CodecOptions
+from bson.raw_bson import RawBSONDocument as _RawBSONDocument
+
+_RAW_CODEC_OPTIONS = _CodecOptions(document_class=_RawBSONDocument)
+
+
 class MongoMixin:
     @classmethod
-    def find(cls, db, query=None):
+    def load_indexes(cls):
+        """Returns the indexes needed while the parsers write the collection (e.g., the keys of upserts)."""
+        return []
+
+    @classmethod
+    def query_indexes(cls):
+        """Returns the indexes only needed to query the finished collection, created after ingestion."""
+        return []
+
+    @classmethod
+    def set_indexes(cls, db, load=True, query=True):
+        indexes = (cls.load_indexes() if load else []) + (cls.query_indexes() if query else [])
+        if indexes:
+            db[cls.collection_name].create_indexes(indexes)
+
+    @classmethod
+    def find(cls, db, query=None, projection=None, batch_size=None, raw=False):
+        """Finds documents of the model's collection.
+
+        `projection` limits the fields returned (as in pymongo), `batch_size`
+        sets the number of documents per round trip, and with `raw` the
+        documents are returned as RawBSONDocuments, which only decode the
+        fields that are accessed.
+        """
         if query is None:
             query = {}
-        return db[cls.collection_name].find(query)
+        coll = db[cls.collection_name]
+        if raw:
+            coll = coll.with_options(codec_options=_RAW_CODEC_OPTIONS)
+        return coll.find(query, projection, batch_size=batch_size or 0)
 
     @classmethod
     def find_one(cls, db, query=None):
         if query is None:
             query = {}
         return db[cls.collection_name].find_one(query)
+
+    @classmethod
+    def find_field(cls, db, field, query=None, batch_size=10_000):
+        """Returns the values of a single (top-level) field as an array, skipping documents without it."""
+        cursor = cls.find(db, query, {"_id": 0, field: 1}, batch_size=batch_size, raw=True)
+        values = [doc[field] for doc in cursor if field in doc]
+        # fromiter keeps list values as elements instead of building a 2D array
+        return _np.fromiter(values, dtype=object, count=len(values))
@@ -1,7 +1,7 @@
 import datetime as _datetime
 
 from pydantic import BaseModel as _BaseModel, StrictStr as _StrictStr, Field as _Field
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -11,10 +11,15 @@ class DrugHasContraindicationBase(models.MongoMixin):
     collection_name: str = "drug_has_contraindication"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("sourceDomainId")
-        db[cls.collection_name].create_index("targetDomainId")
-        db[cls.collection_name].create_index([("sourceDomainId", 1), ("targetDomainId", 1)], unique=True)
+    def load_indexes(cls):
+        return [_IndexModel([("sourceDomainId", 1), ("targetDomainId", 1)], unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [
+            _IndexModel("sourceDomainId"),
+            _IndexModel("targetDomainId"),
+        ]
 
 
 class DrugHasContraindication(_BaseModel, DrugHasContraindicationBase):
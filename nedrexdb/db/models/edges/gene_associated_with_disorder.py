@@ -2,7 +2,7 @@ import datetime as _datetime
 from typing import Optional as _Optional
 
 from pydantic import BaseModel as _BaseModel, StrictStr as _StrictStr
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -12,10 +12,15 @@ class GeneAssociatedWithDisorderBase(models.MongoMixin):
     collection_name: str = "gene_associated_with_disorder"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("sourceDomainId")
-        db[cls.collection_name].create_index("targetDomainId")
-        db[cls.collection_name].create_index([("sourceDomainId", 1), ("targetDomainId", 1)], unique=True)
+    def load_indexes(cls):
+        return [_IndexModel([("sourceDomainId", 1), ("targetDomainId", 1)], unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [
+            _IndexModel("sourceDomainId"),
+            _IndexModel("targetDomainId"),
+        ]
 
 
 class GeneAssociatedWithDisorder(_BaseModel, GeneAssociatedWithDisorderBase):
@@ -1,21 +1,49 @@
 import datetime as _datetime
 
+from more_itertools import chunked as _chunked
 from pydantic import BaseModel as _BaseModel, StrictStr as _StrictStr
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
 
+def methods_score(methods, method_scores) -> float:
+    return float(sum(method_scores.get(method, 0) for method in set(methods)))
+
+
 class ProteinInteractsWithProteinBase(models.MongoMixin):
     edge_type: str = "ProteinInteractsWithProtein"
     collection_name: str = "protein_interacts_with_protein"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("memberOne")
-        db[cls.collection_name].create_index("memberTwo")
-        db[cls.collection_name].create_index("evidenceTypes")
-        db[cls.collection_name].create_index([("memberOne", 1), ("memberTwo", 1)], unique=True)
+    def load_indexes(cls):
+        return [_IndexModel([("memberOne", 1), ("memberTwo", 1)], unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [
+            _IndexModel("memberOne"),
+            _IndexModel("memberTwo"),
+            _IndexModel("evidenceTypes"),
+        ]
+
+    @classmethod
+    def set_methods_scores(cls, db, method_scores):
+        """Sets hippie_methods_score on every PPI from its merged set of methods.
+
+        Run once after all PPI sources have been parsed, so that each edge is
+        scored a single time instead of on every upsert.
+        """
+        cursor = db[cls.collection_name].find({}, {"methods": 1})
+        updates = (
+            _UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"hippie_methods_score": methods_score(doc.get("methods", []), method_scores)}},
+            )
+            for doc in cursor
+        )
+        for chunk in _chunked(updates, 1_000):
+            db[cls.collection_name].bulk_write(chunk, ordered=False)
 
 
 class ProteinInteractsWithProtein(_BaseModel, ProteinInteractsWithProteinBase):
@@ -35,30 +63,23 @@ class ProteinInteractsWithProtein(_BaseModel, ProteinInteractsWithProteinBase):
     subcellularLocations: list[str] = []
     hippie_methods_score: float = 0.0
 
-    def generate_update(self, method_scores, db):
+    def generate_update(self):
         tnow = _datetime.datetime.utcnow()
 
         m1, m2 = sorted([self.memberOne, self.memberTwo])
 
         query = {"memberOne": m1, "memberTwo": m2}
-        
-        existing_doc = db[self.collection_name].find_one(query)
-        if existing_doc and "methods" in existing_doc:
-            all_methods = set(existing_doc["methods"])
-        else:
-            all_methods = set()
-        all_methods.update(self.methods)
-        methods_score = sum(method_scores.get(method, 0) for method in all_methods)
-
 
+        # hippie_methods_score depends on the methods merged from all PPI
+        # sources, so it is set afterwards by set_methods_scores().
         update = {
             "$setOnInsert": {
                 "created": tnow,
+                "hippie_methods_score": self.hippie_methods_score,
             },
             "$set": {
                 "updated": tnow,
                 "type": self.edge_type,
-                "hippie_methods_score": methods_score,
             },
             "$addToSet": {
                 "methods": {"$each": self.methods},
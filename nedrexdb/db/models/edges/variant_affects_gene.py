@@ -1,7 +1,7 @@
 import datetime as _datetime
 
 from pydantic import BaseModel as _BaseModel, StrictStr as _StrictStr, Field as _Field
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -11,9 +11,12 @@ class VariantAffectsGeneBase(models.MongoMixin):
     collection_name = "variant_affects_gene"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("targetDomainId")
-        db[cls.collection_name].create_index("sourceDomainId")
+    def load_indexes(cls):
+        return [_IndexModel("sourceDomainId")]
+
+    @classmethod
+    def query_indexes(cls):
+        return [_IndexModel("targetDomainId")]
 
 
 class VariantAffectsGene(_BaseModel, VariantAffectsGeneBase):
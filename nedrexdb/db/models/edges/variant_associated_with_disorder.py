@@ -1,7 +1,7 @@
 import datetime as _datetime
 
 from pydantic import BaseModel as _BaseModel, StrictStr as _StrictStr, Field as _Field
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -11,10 +11,15 @@ class VariantAssociatedWithDisorderBase(models.MongoMixin):
     collection_name = "variant_associated_with_disorder"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("accession", unique=True)
-        db[cls.collection_name].create_index("targetDomainId")
-        db[cls.collection_name].create_index("sourceDomainId")
+    def load_indexes(cls):
+        return [_IndexModel("accession", unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [
+            _IndexModel("targetDomainId"),
+            _IndexModel("sourceDomainId"),
+        ]
 
 
 class VariantAssociatedWithDisorder(_BaseModel, VariantAssociatedWithDisorderBase):
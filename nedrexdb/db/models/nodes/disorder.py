@@ -6,7 +6,7 @@ from pydantic import (
     Field as _Field,
     StrictStr as _StrictStr,
 )
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -16,9 +16,11 @@ class DisorderBase(models.MongoMixin):
     collection_name: str = "disorder"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
-        db[cls.collection_name].create_index("domainIds")
+    def load_indexes(cls):
+        return [
+            _IndexModel("primaryDomainId", unique=True),
+            _IndexModel("domainIds"),
+        ]
 
 
 class Disorder(_BaseModel, DisorderBase):
@@ -6,7 +6,7 @@ from pydantic import (
     Field as _Field,
     StrictStr as _StrictStr,
 )
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -15,8 +15,11 @@ class DrugBase(models.MongoMixin):
     collection_name: str = "drug"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
+    def load_indexes(cls):
+        return [
+            _IndexModel("primaryDomainId", unique=True),
+            _IndexModel("domainIds"),
+        ]
 
 
 class Drug(_BaseModel, DrugBase):
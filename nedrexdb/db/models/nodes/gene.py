@@ -6,7 +6,7 @@ from pydantic import (
     Field as _Field,
     StrictStr as _StrictStr,
 )
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -16,11 +16,16 @@ class GeneBase(models.MongoMixin):
     collection_name: str = "gene"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
-        db[cls.collection_name].create_index("domainId")
-        db[cls.collection_name].create_index("approvedSymbol")
-        db[cls.collection_name].create_index("symbols")
+    def load_indexes(cls):
+        return [
+            _IndexModel("primaryDomainId", unique=True),
+            _IndexModel("approvedSymbol"),
+            _IndexModel("symbols"),
+        ]
+
+    @classmethod
+    def query_indexes(cls):
+        return [_IndexModel("domainIds")]
 
 
 class Gene(_BaseModel, GeneBase):
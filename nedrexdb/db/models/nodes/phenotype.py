@@ -3,7 +3,7 @@ from typing import List as _List
 
 from pydantic import BaseModel as _BaseModel, Field as _Field, StrictStr as _StrictStr
 
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -13,8 +13,8 @@ class PhenotypeBase(models.MongoMixin):
     collection_name: str = "phenotype"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
+    def load_indexes(cls):
+        return [_IndexModel("primaryDomainId", unique=True)]
 
 
 class Phenotype(_BaseModel, PhenotypeBase):
@@ -5,7 +5,7 @@ from pydantic import (
     Field as _Field,
     StrictStr as _StrictStr,
 )
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -15,10 +15,15 @@ class ProteinBase(models.MongoMixin):
     collection_name: str = "protein"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
-        db[cls.collection_name].create_index("domainIds")
-        db[cls.collection_name].create_index("taxid")
+    def load_indexes(cls):
+        return [_IndexModel("primaryDomainId", unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [
+            _IndexModel("domainIds"),
+            _IndexModel("taxid"),
+        ]
 
 
 class Protein(_BaseModel, ProteinBase):
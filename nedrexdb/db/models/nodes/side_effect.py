@@ -1,7 +1,7 @@
 import datetime as _datetime
 
 from pydantic import BaseModel as _BaseModel, Field as _Field, StrictStr as _StrictStr
-from pymongo import UpdateOne as _UpdateOne
+from pymongo import IndexModel as _IndexModel, UpdateOne as _UpdateOne
 
 from nedrexdb.db import models
 
@@ -11,9 +11,12 @@ class SideEffectBase(models.MongoMixin):
     collection_name: str = "side_effect"
 
     @classmethod
-    def set_indexes(cls, db):
-        db[cls.collection_name].create_index("primaryDomainId", unique=True)
-        db[cls.collection_name].create_index("domainIds")
+    def load_indexes(cls):
+        return [_IndexModel("primaryDomainId", unique=True)]
+
+    @classmethod
+    def query_indexes(cls):
+        return [_IndexModel("domainIds")]
 
 
 class SideEffect(_BaseModel, SideEffectBase):
@@ -1,16 +1,36 @@
+import csv as _csv
+import gzip as _gzip
+import multiprocessing as _mp
 import os as _os
 import subprocess as _subprocess
 from collections.abc import MutableMapping as _MutableMapping
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
 from pathlib import Path as _Path
 
-import numpy as _np
-import pandas as _pd
+from more_itertools import chunked as _chunked, ichunked as _ichunked
+from pymongo import MongoClient as _MongoClient
 import time as _time
 
 from nedrexdb import config as _config
+from nedrexdb.db import client_options as _client_options, columnar as _columnar
+from nedrexdb.db.export_schema import get_column_types as _get_column_types
+from nedrexdb.exceptions import ProcessError as _ProcessError
 from nedrexdb.logger import logger
 
 _TYPE_MAP = {bool: "boolean", int: "int", float: "double", str: "string"}
+_CASTS = {"boolean": bool, "int": int, "double": float, "string": str}
+
+_DELIMITER = "|"
+_CHUNK_SIZE = 10_000
+# fast compression; the files are only read once by neo4j-admin
+_GZIP_LEVEL = 1
+_READY_TIMEOUT = 600
+_READY_INTERVAL = 5
+
+_NODE_EXCLUDED_KEYS = ("_id", "_cls", "created", "updated")
+_EDGE_EXCLUDED_KEYS = ("_id", "created", "updated")
+_START_ID_KEYS = {"sourceDomainId", "memberOne"}
+_END_ID_KEYS = {"targetDomainId", "memberTwo"}
 
 
 def flatten(d, parent_key="", sep="."):
@@ -24,22 +44,22 @@ def flatten(d, parent_key="", sep="."):
     return dict(items)
 
 
-def determine_series_type(series_main):
-    series = series_main.copy()
-    series = series.dropna()
+def value_type(item):
+    """Returns the Neo4j import type of a single value, or None if the value has no content."""
+    # skip items with no content (and NaN)
+    if not item or item != item:
+        return None
 
-    s = set()
-    for item in series:
-        # skip items with no content
-        if not item:
-            continue
+    # is the item a container?
+    if isinstance(item, list):
+        q = set(type(i) for i in item)
+        return f"{_TYPE_MAP[q.pop()]}[]"
+    return _TYPE_MAP[type(item)]
 
-        # is the item a container?
-        if isinstance(item, list):
-            q = set(type(i) for i in item)
-            s.add(f"{_TYPE_MAP[q.pop()]}[]")
-        else:
-            s.add(_TYPE_MAP[type(item)])
+
+def determine_series_type(series_main):
+    s = {value_type(item) for item in series_main.dropna()}
+    s.discard(None)
 
     if len(s) == 1:
         return s.pop()
@@ -47,90 +67,251 @@ def determine_series_type(series_main):
         return False
 
 
+def infer_column_types(docs, excluded_keys=()):
+    """First export pass: determines the type of every flattened column.
+
+    Only used for collections without a declared schema (see export_schema).
+    Only the set of types seen per column is kept, so memory does not grow
+    with the number of documents. Columns are returned in order of first
+    appearance; columns with mixed types are coerced to string (or string[] if
+    any value is a list), columns without any content map to False.
+    """
+    seen = {}
+    for doc in docs:
+        for key, value in flatten(doc).items():
+            if key in excluded_keys:
+                continue
+            types = seen.setdefault(key, set())
+            data_type = value_type(value)
+            if data_type is not None:
+                types.add(data_type)
+
+    column_types = {}
+    for key, types in seen.items():
+        if not types:
+            column_types[key] = False
+        elif len(types) == 1:
+            column_types[key] = types.pop()
+        else:
+            logger.debug(f"coercing column {key!r} with mixed types {sorted(types)}")
+            column_types[key] = "string[]" if any(t.endswith("[]") for t in types) else "string"
+    return column_types
+
+
+def csv_columns(column_types, kind):
+    """Maps typed columns to (column, header, type) triples for neo4j-admin import.
+
+    `kind` is either "node" or "edge". Columns without a type are dropped.
+    """
+    if kind not in ("node", "edge"):
+        raise ValueError(f"kind given ({kind!r}) should be 'node' or 'edge'")
+
+    columns = []
+    for col, data_type in column_types.items():
+        if kind == "node" and col == "primaryDomainId":
+            columns.append((col, f"{col}:ID", "string"))
+        elif kind == "edge" and col in _START_ID_KEYS:
+            columns.append((col, f"{col}:START_ID", "string"))
+        elif kind == "edge" and col in _END_ID_KEYS:
+            columns.append((col, f"{col}:END_ID", "string"))
+        elif col == "type":
+            continue
+        elif data_type is False:
+            logger.debug(f"dropping column {col!r} without content")
+        else:
+            columns.append((col, f"{col}:{data_type}", data_type))
+
+    if "type" in column_types:
+        columns.append(("type", "type:string", "string"))
+        columns.append(("type", ":LABEL" if kind == "node" else ":TYPE", "string"))
+
+    return columns
+
+
+def _cast(value, cast):
+    if type(value) is cast:
+        return value
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def coerce_value(value, data_type):
+    """Formats a value as a CSV cell of the column type, coercing values of other types.
+
+    Scalars in array columns become single-item arrays, arrays in string
+    columns are joined, and values that cannot be cast are left empty.
+    """
+    if value is None or value != value:
+        return ""
+
+    cast = _CASTS[data_type.removesuffix("[]")]
+    if data_type.endswith("[]"):
+        items = value if isinstance(value, list) else [value]
+        return _DELIMITER.join(str(item) for item in (_cast(i, cast) for i in items) if item is not None)
+    if isinstance(value, list):
+        return _DELIMITER.join(str(i) for i in value) if cast is str else ""
+
+    value = _cast(value, cast)
+    return "" if value is None else value
+
+
+def write_csv(docs, columns, f, chunk_size=_CHUNK_SIZE, header=True):
+    """Second export pass: writes documents as CSV rows, `chunk_size` rows at a time."""
+    writer = _csv.writer(f, lineterminator="\n")
+    if header:
+        writer.writerow([name for _, name, _ in columns])
+
+    rows = (
+        [coerce_value(doc.get(col), data_type) for col, _, data_type in columns] for doc in map(flatten, docs)
+    )
+    for chunk in _chunked(rows, chunk_size):
+        writer.writerows(chunk)
+
+
+def _use_columnar(collection):
+    return bool(_config.get("db.columnar") and _columnar.parts(collection))
+
+
+def export_collection(db, collection, workdir, kind, rows_per_file=None):
+    """Streams a collection into gzip-compressed neo4j-admin import files with constant memory.
+
+    The column types come from the declared export schema; collections
+    without one have their types inferred in an extra pass over the data.
+    The documents are read from the Parquet copy of the collection, if there
+    is one (see columnar).
+    The header is written to its own file, followed by one or more part files
+    of at most `rows_per_file` rows each (a single part if not set), so that
+    neo4j-admin can read the parts in parallel. Returns the file names, header
+    first.
+    """
+    column_types = _get_column_types(collection)
+    if column_types is None:
+        logger.warning(f"No export schema for {collection!r}, inferring column types from the data")
+        excluded_keys = _NODE_EXCLUDED_KEYS if kind == "node" else _EDGE_EXCLUDED_KEYS
+        if _use_columnar(collection):
+            docs = ({k: v for k, v in doc.items() if k not in excluded_keys} for doc in _columnar.read(collection))
+        else:
+            docs = db[collection].find({}, {key: 0 for key in excluded_keys}, batch_size=_CHUNK_SIZE)
+        column_types = infer_column_types(docs, excluded_keys)
+    columns = csv_columns(column_types, kind)
+
+    files = [f"{collection}.header.csv.gz"]
+    with _gzip.open(workdir / files[0], "wt", newline="", compresslevel=_GZIP_LEVEL) as f:
+        write_csv([], columns, f)
+
+    # only fetch the (top-level) fields that end up in the file
+    projection = {col.split(".", 1)[0]: 1 for col, _, _ in columns}
+    if _use_columnar(collection):
+        cursor = _columnar.read(collection, list(projection))
+    else:
+        projection["_id"] = 0
+        cursor = db[collection].find({}, projection, batch_size=_CHUNK_SIZE)
+
+    parts = _ichunked(cursor, rows_per_file) if rows_per_file else [cursor]
+    for idx, docs in enumerate(parts):
+        files.append(f"{collection}.part{idx:03d}.csv.gz")
+        with _gzip.open(workdir / files[-1], "wt", newline="", compresslevel=_GZIP_LEVEL) as f:
+            write_csv(docs, columns, f, header=False)
+
+    return files
+
+
+_WORKER_DB = None
+
+
+def _init_export_worker(host, port, dbname):
+    # every worker process needs its own MongoClient
+    global _WORKER_DB
+    _WORKER_DB = _MongoClient(host=host, port=port, connect=False, **_client_options())[dbname]
+
+
+def _export_in_worker(collection, workdir, kind, rows_per_file):
+    return export_collection(_WORKER_DB, collection, workdir, kind, rows_per_file)
+
+
+def export_collections(db, collections, workdir, workers=1, rows_per_file=None):
+    """Exports (collection, kind) pairs, one collection per worker process.
+
+    Returns a dict of collection -> exported file names.
+    """
+    if workers <= 1:
+        return {
+            collection: export_collection(db, collection, workdir, kind, rows_per_file)
+            for collection, kind in collections
+        }
+
+    host, port = db.client.address
+    context = _mp.get_context("fork")
+    with _ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_export_worker, initargs=(host, port, db.name)
+    ) as executor:
+        futures = {
+            collection: executor.submit(_export_in_worker, collection, workdir, kind, rows_per_file)
+            for collection, kind in collections
+        }
+        return {collection: future.result() for collection, future in futures.items()}
+
+
+def _wait_until(check, description, timeout=_READY_TIMEOUT, interval=_READY_INTERVAL):
+    """Polls `check` until it returns True, instead of sleeping for a fixed time."""
+    deadline = _time.monotonic() + timeout
+    while not check():
+        if _time.monotonic() > deadline:
+            raise _ProcessError(f"timed out after {timeout}s waiting for {description}")
+        logger.debug(f"Waiting for {description}...")
+        _time.sleep(interval)
+
+
+def _docker_exec_succeeds(container, *command):
+    return _subprocess.call(
+        ["docker", "exec", "-u", "neo4j", container, *command],
+        stdout=_subprocess.DEVNULL,
+        stderr=_subprocess.DEVNULL,
+    ) == 0
+
+
 def mongo_to_neo(nedrex_instance, db):
     collections = db.list_collection_names()
 
     nodes = [node for node in _config["api.node_collections"] if node in collections]
     edges = [edge for edge in _config["api.edge_collections"] if edge in collections]
 
-    delimiter = "|"
+    delimiter = _DELIMITER
 
     workdir = _Path("/tmp")
+    workers = _config.get("db.export_workers") or 1
+    rows_per_file = _config.get("db.export_rows_per_file")
 
-    for node in nodes:
-        logger.debug(node)
-        cursor = db[node].find()
-        df = _pd.DataFrame(flatten(i) for i in cursor)
-        # replace NaN with empty strings
-        df = df.replace(_np.nan, "", regex=True)
-        for key in ["_id", "_cls", "created", "updated"]:
-            if key in df.columns:
-                del df[key]
-
-        for col in df.columns:
-            if col == "primaryDomainId":
-                df = df.rename(columns={col: f"{col}:ID"})
-            elif col == "type":
-                df["type:string"] = df["type"]
-                df = df.rename(columns={col: ":LABEL"})
-            else:
-                data_type = determine_series_type(df[col])
-                if data_type is False:
-                    df.drop(columns=[col], inplace=True)
-                else:
-                    if data_type.endswith("[]"):
-                        df[col] = df[col].apply(delimiter.join)
-                    df = df.rename(columns={col: f"{col}:{data_type}"})
-
-        df.to_csv(f"{workdir}/{node}.csv", index=False)
-
-    for edge in edges:
-        logger.debug(edge)
-        cursor = db[edge].find()
-        df = _pd.DataFrame(flatten(i) for i in cursor)
-        # replace NaN with empty strings
-        df = df.replace(_np.nan, "", regex=True)
-        for key in ["_id", "created", "updated"]:
-            if key in df.columns:
-                del df[key]
-
-        for col in df.columns:
-            if col in {"sourceDomainId", "memberOne"}:
-                df = df.rename(columns={col: f"{col}:START_ID"})
-            elif col in {"targetDomainId", "memberTwo"}:
-                df = df.rename(columns={col: f"{col}:END_ID"})
-            elif col == "type":
-                df["type:string"] = df["type"]
-                df = df.rename(columns={col: ":TYPE"})
-            else:
-                data_type = determine_series_type(df[col])
-                if data_type is False:
-                    df.drop(columns=[col], inplace=True)
-                else:
-                    if data_type.endswith("[]"):
-                        df[col] = df[col].apply(delimiter.join)
-
-                    df = df.rename(columns={col: f"{col}:{data_type}"})
-
-        cols = list(df.columns)
-        cols.remove(":TYPE")
-        cols.append(":TYPE")
-        df.to_csv(f"{workdir}/{edge}.csv", columns=cols, index=False)
+    logger.info(f"Exporting {len(nodes)} node and {len(edges)} edge collections with {workers} worker(s)")
+    files = export_collections(
+        db,
+        [(node, "node") for node in nodes] + [(edge, "edge") for edge in edges],
+        workdir,
+        workers=workers,
+        rows_per_file=rows_per_file,
+    )
 
     #logger.debug(
     #    f"calling 'docker exec {nedrex_instance.neo4j_container_name} chown -R neo4j:neo4j /data /import /logs "
     #    f"/var/lib/neo4j/plugins /app'")
+    container = nedrex_instance.neo4j_container_name
     _subprocess.call([
-        "docker", "exec", nedrex_instance.neo4j_container_name,
+        "docker", "exec", container,
         "chown", "-R", "neo4j:neo4j", "/data", "/logs", "/var/lib/neo4j/plugins", "/app"
     ])
-    _time.sleep(30)
+    import_files = [f"/import/{name}" for names in files.values() for name in names]
+    _wait_until(
+        lambda: _docker_exec_succeeds(container, "sh", "-c", " && ".join(f"test -r {f}" for f in import_files)),
+        "import files to be readable in the Neo4j container",
+    )
     command = [
         "docker",
         "exec",
         "-u",
         "neo4j",
-        nedrex_instance.neo4j_container_name,
+        container,
         "neo4j-admin",
         "database",
         "import",
@@ -144,19 +325,21 @@ def mongo_to_neo(nedrex_instance, db):
         "--skip-duplicate-nodes=true",
     ]
     for node in nodes:
-        command += ["--nodes=/import/" + node + ".csv"]
+        command += ["--nodes=" + ",".join(f"/import/{name}" for name in files[node])]
     for edge in edges:
-        command += ["--relationships=/import/" + edge + ".csv"]
+        command += ["--relationships=" + ",".join(f"/import/{name}" for name in files[edge])]
     # command += ["--database=nedrex"]
 
     logger.info("Importing files into Neo4j...")
     logger.debug("Running: "+" ".join(command))
-    _subprocess.call(command)
-    logger.info("Waiting 60s for Neo4j to run internal processes...")
-    _time.sleep(60)
+    if _subprocess.call(command) != 0:
+        logger.error("neo4j-admin import returned a non-zero exit code")
+    _wait_until(
+        lambda: _docker_exec_succeeds(container, "neo4j-admin", "database", "info", "neo4j"),
+        "the imported Neo4j database to be readable",
+    )
     # clean up
-    for node in nodes:
-       _os.remove(f"{workdir}/{node}.csv")
-    for edge in edges:
-       _os.remove(f"{workdir}/{edge}.csv")
-    logger.info("Neo4j import done!")
\ No newline at end of file
+    for names in files.values():
+        for name in names:
+            _os.remove(workdir / name)
+    logger.info("Neo4j import done!")
@@ -1,7 +1,13 @@
 from pathlib import Path as _Path
 
+from lxml import etree as _let
+
 from nedrexdb import config as _config
 
+# elements are sent to parser workers in chunks of roughly this many bytes
+XML_CHUNK_SIZE = 8 * 1024 * 1024
+_CHUNK_ROOT = (b'<chunk xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">', b"</chunk>")
+
 
 def _get_file_location_factory(database):
     def inner(label):
@@ -19,3 +25,78 @@ def _get_file_location_factory(database):
         return path
 
     return inner
+
+
+def _find_start_tag(data, start_tag, pos, end=None):
+    """Returns the index of the next start tag in data[pos:end] (not of a longer tag with the same prefix), or -1."""
+    end = len(data) if end is None else end
+    while True:
+        idx = data.find(start_tag, pos, end)
+        if idx == -1 or idx + len(start_tag) == len(data) or data[idx + len(start_tag)] in b" \t\r\n>":
+            return idx
+        pos = idx + len(start_tag)
+
+
+def _find_element_end(data, start_tag, end_tag, start):
+    """Returns the index after the end tag of the element starting at `start` (counting nested elements), or -1."""
+    depth = 0
+    pos = start
+    while True:
+        end = data.find(end_tag, pos)
+        if end == -1:
+            return -1
+        nested = _find_start_tag(data, start_tag, pos, end)
+        if nested != -1:
+            depth += 1
+            pos = nested + len(start_tag)
+            continue
+        depth -= 1
+        pos = end + len(end_tag)
+        if depth == 0:
+            return pos
+
+
+def iter_element_chunks(f, tag, accept=None, block_size=XML_CHUNK_SIZE):
+    """Splits an XML file (opened in binary mode) into chunks of complete `tag` elements.
+
+    The elements are found by their start and end tags, without parsing. An
+    element nested in another one stays part of the outer element (the tag
+    must not be used in self-closing elements, though). If given,
+    `accept(start_tag)` is called with the bytes of each element's start tag
+    and the element is dropped unless it returns True. Use parse_element_chunk
+    to parse a chunk.
+    """
+    start_tag = f"<{tag}".encode()
+    end_tag = f"</{tag}>".encode()
+    rest = b""
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        elements = []
+        pos = 0
+        while True:
+            start = _find_start_tag(data, start_tag, pos)
+            # the end of the data may be the beginning of a start tag
+            if start == -1 or start + len(start_tag) == len(data):
+                rest = data[max(pos, len(data) - len(start_tag)) :]
+                break
+            end = _find_element_end(data, start_tag, end_tag, start)
+            if end == -1:
+                rest = data[start:]
+                break
+            pos = end
+            if accept is None or accept(data[start : data.find(b">", start) + 1]):
+                elements.append(data[start:end])
+        if elements:
+            yield b"".join(elements)
+
+
+def parse_element_chunk(chunk, namespace=None):
+    """Parses a chunk of iter_element_chunks; returns an (lxml) element whose children are the chunk's elements.
+
+    `namespace` is the default namespace of the elements, if the document declares one.
+    """
+    root = _CHUNK_ROOT[0] if namespace is None else _CHUNK_ROOT[0].replace(b">", f' xmlns="{namespace}">'.encode())
+    return _let.fromstring(root + chunk + _CHUNK_ROOT[1], parser=_let.XMLParser(huge_tree=True))
@@ -4,7 +4,7 @@ from itertools import chain as _chain, product as _product
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.protein import Protein
 from nedrexdb.db.models.edges.protein_interacts_with_protein import ProteinInteractsWithProtein
@@ -103,24 +103,24 @@ class BioGridParser:
         "Organism Name Interactor B",
     )
 
-    def __init__(self, f, method_scores):
+    def __init__(self, f):
         self._f = f
-        self.method_scores = method_scores
 
     def parse(self):
-        proteins = {i["primaryDomainId"] for i in Protein.find(MongoInstance.DB)}
+        proteins = id_index.primary_ids(Protein)
 
         with open(self._f, "r") as f:
             reader = _DictReader(f, fieldnames=self.fieldnames, delimiter="\t")
             members = (BioGridRow(row).parse(proteins_allowed=proteins) for row in reader)
 
-            for chunk in _tqdm(_chunked(members, 1_000), leave=False, desc="Parsing BioGRID"):
-                updates = [ppi.generate_update(self.method_scores, db=MongoInstance.DB) for ppi in _chain(*chunk)]
-                if updates:
-                    MongoInstance.DB[ProteinInteractsWithProtein.collection_name].bulk_write(updates)
+            with bulk_load.loader(ProteinInteractsWithProtein.collection_name) as writer:
+                for chunk in _tqdm(_chunked(members, 1_000), leave=False, desc="Parsing BioGRID"):
+                    updates = [ppi.generate_update() for ppi in _chain(*chunk)]
+                    if updates:
+                        writer.write(updates)
 
 
-def parse_ppis(method_scores):
+def parse_ppis():
     logger.info("Parsing Biogrid")
     filename = get_file_location("human_data")
-    BioGridParser(filename, method_scores).parse()
+    BioGridParser(filename).parse()
@@ -2,7 +2,7 @@ import json
 
 from more_itertools import chunked
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.phenotype import Phenotype
 from nedrexdb.db.models.nodes.side_effect import SideEffect
@@ -35,11 +35,13 @@ def parse():
                 )
 
     updates = (se.generate_update() for se in meddra_items.values())
-    for chunk in chunked(updates, 1_000):
-        MongoInstance.DB[SideEffect.collection_name].bulk_write(chunk)
+    with bulk_load.loader(SideEffect.collection_name) as writer:
+        for chunk in chunked(updates, 1_000):
+            writer.write(chunk)
+    id_index.invalidate(SideEffect)
 
     # Parse SideEffect-(SameAs)-Phenoyype edges.
-    nedrex_phenotypes = {i["primaryDomainId"] for i in Phenotype.find(MongoInstance.DB)}
+    nedrex_phenotypes = id_index.primary_ids(Phenotype)
     se_pheno_relations = []
 
     for cui in data:
@@ -53,5 +55,6 @@ def parse():
             ]
 
     updates = (rel.generate_update() for rel in se_pheno_relations)
-    for chunk in chunked(updates, 1_000):
-        MongoInstance.DB[SideEffectSameAsPhenotype.collection_name].bulk_write(chunk)
+    with bulk_load.loader(SideEffectSameAsPhenotype.collection_name) as writer:
+        for chunk in chunked(updates, 1_000):
+            writer.write(chunk)
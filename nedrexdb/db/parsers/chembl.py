@@ -2,7 +2,7 @@ import gzip as _gzip
 import sqlite3
 import subprocess as _sp
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import MongoInstance, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.drug import Drug
 from nedrexdb.downloaders import get_latest_chembl_version
@@ -57,3 +57,4 @@ def parse_chembl():
             query = {"primaryDomainId": f"drugbank.{drugbank_id}"}
             update = {"$addToSet": {"drugGroups": "approved", "dataSources": "chembl"}}
             MongoInstance.DB[Drug.collection_name].update_one(query, update)
+    id_index.invalidate(Drug)
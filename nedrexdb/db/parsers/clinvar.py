@@ -1,20 +1,29 @@
 import gzip as _gzip
+import io as _io
+import multiprocessing as _mp
+import os as _os
+import re as _re
+import struct as _struct
 from itertools import chain
-from lxml import etree as _let
 from collections import defaultdict as _defaultdict
-from csv import DictReader as _DictReader
 from functools import lru_cache as _lru_cache
 
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb import config as _config
+from nedrexdb.db import MongoInstance, bulk_load, id_index
 from nedrexdb.db.models.edges.variant_affects_gene import VariantAffectsGene
 from nedrexdb.db.models.edges.variant_associated_with_disorder import VariantAssociatedWithDisorder
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.nodes.gene import Gene
 from nedrexdb.db.models.nodes.genomic_variant import GenomicVariant
-from nedrexdb.db.parsers import _get_file_location_factory
+from nedrexdb.db.parsers import (
+    XML_CHUNK_SIZE as _XML_CHUNK_SIZE,
+    _get_file_location_factory,
+    iter_element_chunks as _iter_element_chunks,
+    parse_element_chunk as _parse_element_chunk,
+)
 from nedrexdb.logger import logger
 
 get_file_location = _get_file_location_factory("clinvar")
@@ -38,22 +47,18 @@ def xml_disorder_mapper(id, db):
 
 
 def disorder_domain_id_to_primary_id_map():
-    d = _defaultdict(list)
-    for doc in Disorder.find(MongoInstance.DB):
-        for domain_id in doc["domainIds"]:
-            d[domain_id].append(doc["primaryDomainId"])
-    return d
+    return _defaultdict(list, id_index.id_map(Disorder))
 
 
 def get_variant_list():
-    variants = {doc["primaryDomainId"] for doc in GenomicVariant.find(MongoInstance.DB)}
+    variants = id_index.primary_ids(GenomicVariant)
     return variants
 
 
 @_lru_cache(maxsize=None)
 def get_disorder_by_domain_id(domain_id: str):
     query = {"domainIds": domain_id}
-    return [doc["primaryDomainId"] for doc in Disorder.find(MongoInstance.DB, query)]
+    return list(Disorder.find_field(MongoInstance.DB, "primaryDomainId", query))
 
 
 @_lru_cache(maxsize=None)
@@ -62,146 +67,315 @@ def get_variant_by_primary_domain_id(pdid: str):
     return GenomicVariant.find_one(MongoInstance.DB, query)
 
 
+_VARIATION_ID = _re.compile(rb'VariationID="([^"]+)"')
+
+# set in the (forked) workers, see _init_xml_worker
+_disorder_domain_id_map = None
+
+
+def iter_archive_chunks(f, variant_ids, block_size=_XML_CHUNK_SIZE):
+    """Splits the XML into chunks of the VariationArchive elements of the variants in `variant_ids`.
+
+    The VariationID is read from the start tag, without parsing the archive.
+    """
+
+    def known(start_tag):
+        match = _VARIATION_ID.search(start_tag)
+        return match is not None and f"clinvar.{match.group(1).decode()}" in variant_ids
+
+    return _iter_element_chunks(f, "VariationArchive", known, block_size)
+
+
+def _init_xml_worker(disorder_domain_id_map):
+    global _disorder_domain_id_map
+    _disorder_domain_id_map = disorder_domain_id_map
+
+
+def _parse_archives(chunk):
+    """Returns the variant-disorder updates of a chunk of VariationArchives."""
+    updates = []
+    for archive in _parse_element_chunk(chunk):
+        variant_pdid = f"clinvar.{archive.get('VariationID')}"
+        for clinical_assertion in archive.iterfind("ClassifiedRecord/ClinicalAssertionList/ClinicalAssertion"):
+            clinvar_accession = clinical_assertion.find("ClinVarAccession")
+            acc = clinvar_accession.get("Accession") if clinvar_accession is not None else None
+            if not acc:
+                continue
+
+            xrefs = clinical_assertion.iterfind("TraitSet/Trait[@Type='Disease']/XRef")
+            traits = {xml_disorder_mapper(xref.get("ID"), xref.get("DB")) for xref in xrefs}
+            traits = set(chain(*[_disorder_domain_id_map.get(domain_id, []) for domain_id in traits if domain_id]))
+            traits.discard(None)
+            if not traits:
+                continue
+
+            effects_elem = clinical_assertion.find("Classification/GermlineClassification")
+            review_status_elem = clinical_assertion.find("Classification/ReviewStatus")
+            effects = [effects_elem.text] if effects_elem is not None and effects_elem.text else []
+            review_status = review_status_elem.text if review_status_elem is not None else "Unknown"
+
+            vawd = VariantAssociatedWithDisorder(
+                sourceDomainId=variant_pdid,
+                accession=acc,
+                effects=effects,
+                reviewStatus=review_status,
+                dataSources=["clinvar"],
+            )
+            for trait in traits:
+                vawd.targetDomainId = trait
+                updates.append(vawd.generate_update())
+    return updates
+
+
 class ClinVarXMLParser:
     def __init__(self, fname):
         self.fname = fname
 
-    def iter_parse(self):
+    def iter_chunks(self, variant_ids):
+        with _gzip.open(self.fname, "rb") as f:
+            yield from iter_archive_chunks(f, variant_ids)
+
+    def iter_updates(self, workers):
+        """Yields lists of variant-disorder updates, parsed by `workers` processes.
+
+        The parent only decompresses the file and splits it into chunks of the
+        VariationArchives of known variants.
+        """
         variant_ids = get_variant_list()
         disorder_domain_id_map = disorder_domain_id_to_primary_id_map()
+        chunks = self.iter_chunks(variant_ids)
+        if workers <= 1:
+            _init_xml_worker(disorder_domain_id_map)
+            yield from map(_parse_archives, chunks)
+            return
+
+        with _mp.get_context("fork").Pool(
+            workers, initializer=_init_xml_worker, initargs=(disorder_domain_id_map,)
+        ) as pool:
+            yield from pool.imap(_parse_archives, chunks)
+
+
+def _profile_collection(coll):
+    """Counts the documents and the documents with each attribute in a single pass over the collection."""
+    counts = {
+        row["_id"]: row["count"]
+        for row in coll.aggregate(
+            [
+                {"$project": {"attributes": {"$objectToArray": "$$ROOT"}}},
+                {"$unwind": "$attributes"},
+                {"$group": {"_id": "$attributes.k", "count": {"$sum": 1}}},
+            ],
+            allowDiskUse=True,
+        )
+    }
+    # every document has an _id
+    return counts.get("_id", 0), counts
+
+
+# a region of the index covers at most this many of its 16 kbp windows (8 Mbp)
+_REGION_WINDOWS = 512
+_TBI_WINDOW_SHIFT = 14
+_BATCH_SIZE = 10_000
+
+
+def _read_index(fname):
+    """Reads the tabix (.tbi) or CSI (.csi) index of a bgzip file.
+
+    Returns a list of (chromosome, start, linear index) for every reference
+    sequence, in file order: the virtual offset of its first record and the
+    virtual offsets of its 16 kbp windows (empty for CSI indexes, which have no
+    linear index). Returns None if the file has no index.
+    """
+    for suffix in (".tbi", ".csi"):
+        path = f"{fname}{suffix}"
+        if _os.path.exists(path):
+            break
+    else:
+        return None
+    if _os.path.getmtime(path) < _os.path.getmtime(fname):
+        logger.warning(f"{path} is older than {fname}, not using it")
+        return None
 
-        assert None not in variant_ids
-
-        with _gzip.open(self.fname, "rb") as f:
-            for _, elem in _let.iterparse(f, events=("end",), tag="VariationArchive"):
-                if elem.get('VariationID') is not None:
-                    variant_pdid = f"clinvar.{elem.get('VariationID')}"
-                else:
-                    variant_pdid = None
-                if variant_pdid in variant_ids:
-                    classified_record = elem.find("ClassifiedRecord")
-
-                    if classified_record is not None:
-
-                        clinical_assertion_list = classified_record.find("ClinicalAssertionList")
-
-                        if clinical_assertion_list is not None:
-                            clinical_assertions = clinical_assertion_list.findall("ClinicalAssertion")
-
-                            for clinical_assertion in clinical_assertions:
-
-                                trait_set = clinical_assertion.find("TraitSet")
-                                if trait_set is not None:
-                                    traits = trait_set.findall("Trait")
-                                    traits = chain(
-                                        *[
-                                            [xref.attrib for xref in trait.findall("XRef")]
-                                            for trait in traits
-                                            if trait.get("Type") == "Disease"
-                                        ]
-                                    )
-                                    traits = {xml_disorder_mapper(item["ID"], item["DB"]) for item in traits}
-                                    traits = set(
-                                        chain(
-                                            *[disorder_domain_id_map.get(domain_id, []) for domain_id in traits if
-                                              domain_id]
-                                        )
-                                    )
-                                    traits.discard(None)
-
-                                classification = clinical_assertion.find("Classification")
-                                if classification is not None:
-                                    effects_elem = classification.find(
-                                        "GermlineClassification")
-                                    review_status_elem = classification.find("ReviewStatus")
-
-                                    effects = [
-                                        effects_elem.text] if effects_elem is not None and effects_elem.text else []
-                                    review_status = review_status_elem.text if review_status_elem is not None else "Unknown"
-
-                                clinvar_accession = clinical_assertion.find("ClinVarAccession")
-                                if clinvar_accession is not None:
-                                    acc = clinvar_accession.get("Accession")
-                                else:
-                                    acc = None
-
-                                if traits and acc:
-                                    for trait in traits:
-                                        vawd = VariantAssociatedWithDisorder(
-                                            sourceDomainId=variant_pdid,
-                                            targetDomainId=trait,
-                                            accession=acc,
-                                            effects=effects,
-                                            reviewStatus=review_status,
-                                            dataSources=["clinvar"],
-                                        )
-                                        yield vawd
-
-                elem.clear()
+    with _gzip.open(path, "rb") as f:
+        data = f.read()
+
+    def unpack(fmt, offset):
+        return _struct.unpack_from(f"<{fmt}", data, offset), offset + _struct.calcsize(f"<{fmt}")
+
+    magic = data[:4]
+    if magic == b"TBI\1":
+        (n_ref, _, _, _, _, _, _, l_nm), offset = unpack("8i", 4)
+        names_offset, offset = offset, offset + l_nm
+        pseudo_bin = 37450
+    elif magic == b"CSI\1":
+        (_, depth, l_aux), offset = unpack("3i", 4)
+        # the auxiliary data has the tabix header (format, columns, meta, skip, names)
+        names_offset = offset + 28
+        l_nm = _struct.unpack_from("<i", data, offset + 24)[0]
+        offset += l_aux
+        (n_ref,), offset = unpack("i", offset)
+        pseudo_bin = ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+    else:
+        raise ValueError(f"{path} is not a tabix or CSI index")
+    names = data[names_offset : names_offset + l_nm].split(b"\0")
+
+    references = []
+    for idx in range(n_ref):
+        (n_bin,), offset = unpack("i", offset)
+        starts = []
+        for _ in range(n_bin):
+            if magic == b"TBI\1":
+                (bin_number, n_chunk), offset = unpack("Ii", offset)
+            else:
+                (bin_number, _, n_chunk), offset = unpack("IQi", offset)
+            chunks, offset = unpack(f"{2 * n_chunk}Q", offset)
+            # the pseudo-bin holds statistics, not chunks
+            if bin_number != pseudo_bin:
+                starts.extend(chunks[::2])
+        linear = ()
+        if magic == b"TBI\1":
+            (n_intv,), offset = unpack("i", offset)
+            linear, offset = unpack(f"{n_intv}Q", offset)
+        if starts:
+            references.append((names[idx].decode(), min(starts), list(linear)))
+    return sorted(references, key=lambda reference: reference[1])
+
+
+def _split_regions(references):
+    """Returns (chromosome, virtual offset, first position, end position) regions covering the references."""
+    regions = []
+    for chromosome, start, linear in references:
+        if len(linear) <= _REGION_WINDOWS:
+            regions.append((chromosome, start, None, None))
+            continue
+        for window in range(0, len(linear), _REGION_WINDOWS):
+            # records starting in the region may be after (but not before) this window's offset
+            offset = linear[window] or start
+            begin = (window << _TBI_WINDOW_SHIFT) + 1 if window else None
+            end = ((window + _REGION_WINDOWS) << _TBI_WINDOW_SHIFT) + 1
+            regions.append((chromosome, offset, begin, end if window + _REGION_WINDOWS < len(linear) else None))
+    return regions
 
 
 class ClinVarVCFParser:
-    fieldnames = (
-        "CHROM",
-        "POS",
-        "ID",
-        "REF",
-        "ALT",
-        "QUAL",
-        "FILTER",
-        "INFO",
-    )
-
     def __init__(self, fname):
         self.fname = fname
 
-    def iter_rows(self):
-        with _gzip.open(self.fname, "rt") as f:
-            f = (line for line in f if not line.startswith("#"))
-            reader = _DictReader(f, fieldnames=self.fieldnames, delimiter="\t")
-            for row in reader:
-                row["INFO"] = {k: v for k, v in [i.split("=", 1) for i in row["INFO"].split(";")]}
-                yield row
+    def regions(self):
+        """Returns the regions of the file that can be read separately, or None if it is not indexed."""
+        references = _read_index(self.fname)
+        return None if references is None else _split_regions(references)
+
+    def iter_rows(self, region=None):
+        """Yields the records (of a region, see regions) as ClinVarRows."""
+        if region is None:
+            with _gzip.open(self.fname, "rt") as f:
+                for line in f:
+                    if not line.startswith("#"):
+                        yield ClinVarRow(line.rstrip("\n").split("\t"))
+            return
+
+        chromosome, offset, begin, end = region
+        with open(self.fname, "rb") as raw:
+            # a virtual offset is the offset of a BGZF block and the offset within the block
+            raw.seek(offset >> 16)
+            with _gzip.GzipFile(fileobj=raw) as f:
+                f.read(offset & 0xFFFF)
+                for line in _io.TextIOWrapper(f):
+                    if line.startswith("#"):
+                        continue
+                    row = ClinVarRow(line.rstrip("\n").split("\t"))
+                    if row.chromosome != chromosome or (end is not None and row.position >= end):
+                        break
+                    if begin is None or row.position >= begin:
+                        yield row
+
+
+def _parse_rows(rows):
+    variants = []
+    variant_genes = []
+    for row in rows:
+        variants.append(row.parse_variant().generate_update())
+        variant_genes.extend(
+            (vag.targetDomainId, vag.generate_update()) for vag in row.parse_variant_gene_relationships()
+        )
+    return variants, variant_genes
+
+
+def _parse_region(args):
+    fname, region = args
+    return _parse_rows(ClinVarVCFParser(fname).iter_rows(region))
+
+
+def _iter_vcf_batches(parser, workers):
+    """Yields (variant updates, (gene, variant-gene update) pairs) for batches of the VCF records.
+
+    If the file is indexed, its regions are parsed by `workers` processes.
+    """
+    regions = parser.regions()
+    if regions is None or workers <= 1:
+        for rows in _chunked(parser.iter_rows(), _BATCH_SIZE):
+            yield _parse_rows(rows)
+        return
+
+    logger.debug(f"Parsing {len(regions)} regions of the ClinVar VCF with {workers} workers")
+    with _mp.get_context("fork").Pool(workers) as pool:
+        yield from pool.imap(_parse_region, ((parser.fname, region) for region in regions))
 
 
 class ClinVarRow:
-    def __init__(self, row):
-        self._row = row
+    """A VCF record (its fields); only the INFO keys used are looked up, when they are used."""
+
+    def __init__(self, fields):
+        self._fields = fields
+
+    def info(self, key):
+        info = self._fields[7]
+        idx = info.find(f"{key}=")
+        # the key has to start an entry (e.g., RS= and not ORIGIN_RS=)
+        while idx > 0 and info[idx - 1] != ";":
+            idx = info.find(f"{key}=", idx + 1)
+        if idx == -1:
+            return None
+        idx += len(key) + 1
+        end = info.find(";", idx)
+        return info[idx:] if end == -1 else info[idx:end]
 
     @property
     def identifier(self):
-        return f"clinvar.{self._row['ID']}"
+        return f"clinvar.{self._fields[2]}"
 
     def get_rs(self):
-        if self._row["INFO"].get("RS"):
-            return [f"dbsnp.{i}" for i in self._row["INFO"]["RS"].split("|")]
+        rs = self.info("RS")
+        if rs:
+            return [f"dbsnp.{i}" for i in rs.split("|")]
         else:
             return []
 
     @property
     def chromosome(self):
-        return self._row["CHROM"]
+        return self._fields[0]
 
     @property
     def position(self):
-        return int(self._row["POS"])
+        return int(self._fields[1])
 
     @property
     def reference(self):
-        return self._row["REF"]
+        return self._fields[3]
 
     @property
     def alternative(self):
-        return self._row["ALT"]
+        return self._fields[4]
 
     @property
     def variant_type(self):
-        variant_type = self._row["INFO"].get("CLNVC")
+        variant_type = self.info("CLNVC")
         return variant_type.replace("_", " ").title()
 
     @property
     def associated_genes(self):
-        gene_info = self._row["INFO"].get("GENEINFO")
+        gene_info = self.info("GENEINFO")
         if not gene_info:
             return []
 
@@ -228,47 +402,40 @@ class ClinVarRow:
 def parse():
     fname = get_file_location("human_data")
     parser = ClinVarVCFParser(fname)
+    workers = _config.get("db.clinvar_workers") or 1
+    gene_ids = id_index.primary_ids(Gene)
 
-    updates = (ClinVarRow(i).parse_variant().generate_update() for i in parser.iter_rows())
-    for chunk in _tqdm(_chunked(updates, 10_000), desc="Parsing ClinVar genomic variants", leave=False):
-        MongoInstance.DB[GenomicVariant.collection_name].bulk_write(chunk)
-
-    def iter_variant_gene_relationships():
-        for row in parser.iter_rows():
-            yield from ClinVarRow(row).parse_variant_gene_relationships()
-
-    gene_ids = {doc["primaryDomainId"] for doc in Gene.find(MongoInstance.DB)}
-
-    updates = (vgr.generate_update() for vgr in iter_variant_gene_relationships() if vgr.targetDomainId in gene_ids)
-    for chunk in _tqdm(
-        _chunked(updates, 10_000), desc="Parsing ClinVar genomic variant-gene relationships", leave=False
+    # a single pass over the VCF writes both the variants and their genes
+    with (
+        bulk_load.loader(GenomicVariant.collection_name) as variant_writer,
+        bulk_load.loader(VariantAffectsGene.collection_name) as variant_gene_writer,
     ):
-        MongoInstance.DB[VariantAffectsGene.collection_name].bulk_write(chunk)
-
+        for variants, variant_genes in _tqdm(
+            _iter_vcf_batches(parser, workers), desc="Parsing ClinVar genomic variants and their genes", leave=False
+        ):
+            variant_writer.write(variants)
+            variant_gene_writer.write(update for gene, update in variant_genes if gene in gene_ids)
+    id_index.invalidate(GenomicVariant)
 
     fname = get_file_location("human_data_xml")
-
     parser = ClinVarXMLParser(fname)
-    updates = (i.generate_update() for i in parser.iter_parse())
-    for chunk in _tqdm(
-        _chunked(updates, 10_000), desc="Parsing ClinVar genomic variant-disorder relationships", leave=False
-    ):
-        MongoInstance.DB[VariantAssociatedWithDisorder.collection_name].bulk_write(chunk)
-        db = MongoInstance.DB
-        coll = VariantAssociatedWithDisorder.collection_name
-        doc_count = db[coll].count_documents({})
-        sample_doc = db[coll].find_one()
-
-        if sample_doc:
-            attr_counts = {attr: db[coll].count_documents({attr: {"$exists": True}})
-                           for attr in sample_doc.keys()}
-            db["_collections"].replace_one(
-                {"collection": coll},
-                {
-                    "collection": coll,
-                    "document_count": doc_count,
-                    "unique_attributes": list(attr_counts.keys()),
-                    "attribute_counts": attr_counts
-                },
-                upsert=True
-            )
+    with bulk_load.loader(VariantAssociatedWithDisorder.collection_name) as writer:
+        for updates in _tqdm(
+            parser.iter_updates(workers), desc="Parsing ClinVar genomic variant-disorder relationships", leave=False
+        ):
+            writer.write(updates)
+
+    # the documents are only complete once the loader has written them
+    coll = VariantAssociatedWithDisorder.collection_name
+    doc_count, attr_counts = _profile_collection(MongoInstance.DB[coll])
+    if doc_count:
+        MongoInstance.DB["_collections"].replace_one(
+            {"collection": coll},
+            {
+                "collection": coll,
+                "document_count": doc_count,
+                "unique_attributes": list(attr_counts.keys()),
+                "attribute_counts": attr_counts
+            },
+            upsert=True
+        )
@@ -5,7 +5,7 @@ from pathlib import Path as _Path
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import MongoInstance, bulk_writer, id_index
 from nedrexdb.db.models.edges.variant_affects_gene import VariantAffectsGene
 from nedrexdb.db.models.edges.variant_associated_with_disorder import VariantAssociatedWithDisorder
 from nedrexdb.db.models.edges.gene_associated_with_disorder import GeneAssociatedWithDisorder
@@ -174,11 +174,11 @@ class COSMICParser:
 
         all_symbols = {row['Gene name'] for row in f_dict}
         symbol2entrez = {gene["approvedSymbol"]: gene["primaryDomainId"] for gene in
-                         Gene.find(MongoInstance.DB, {"approvedSymbol": {"$in": list(all_symbols)}})}
+                         Gene.find(MongoInstance.DB, {"approvedSymbol": {"$in": list(all_symbols)}},
+                                   {"_id": 0, "approvedSymbol": 1, "primaryDomainId": 1})}
         non_approved_symbols = all_symbols - symbol2entrez.keys()
         for symbol in non_approved_symbols:
-            genes = [gene["primaryDomainId"]
-                     for gene in Gene.find(MongoInstance.DB, {"symbols": symbol})]
+            genes = list(Gene.find_field(MongoInstance.DB, "primaryDomainId", {"symbols": symbol}))
             assert len(genes) == 1, f"Multiple genes found for the symbol {symbol}"
             symbol2entrez.update({symbol: genes[0]})
         assert not (non_approved_symbols - symbol2entrez.keys()), \
@@ -196,37 +196,42 @@ class COSMICParser:
             get_clinvar_file_location("human_data"))
         cancer2mondo = get_cancer2mondo(mapping_fname)
         # get mondo ids in NeDRex
-        nedrex_mondo_ids = {dis["primaryDomainId"] for dis in Disorder.find(MongoInstance.DB)}
+        nedrex_mondo_ids = id_index.primary_ids(Disorder)
 
         updates = (
             COSMICRow(row).parse(gdot2clinvar, symbol2entrez, cancer2mondo, nedrex_mondo_ids) 
             for row in f_dict
         )
 
-        for chunk in _tqdm(_chunked(updates, 10_000), leave=False, desc="Parsing COSMIC"):
-            if not chunk:
-                continue
-            genomic_variant_updates, variant_gene_updates, variant_disorder_updates, gene_disorder_updates = [], [], [], []
-            for genomic_variant, variant_gene, variant_disorder in chunk:
-                if genomic_variant:
-                    genomic_variant_updates.append(
-                        genomic_variant.generate_update())
-                    variant_gene_updates.append(variant_gene.generate_update())
-                    if variant_disorder:
-                        variant_disorder_updates.append(
-                            variant_disorder.generate_update())
-                        gene_disorder = GeneAssociatedWithDisorder(dataSources=["cosmic"],
-                                                             sourceDomainId=variant_gene.targetDomainId,
-                                                             targetDomainId=variant_disorder.targetDomainId)
-                        gene_disorder_updates.append(gene_disorder.generate_update())
-
-            for this_collection_name, these_updates in zip([GenomicVariant.collection_name, VariantAffectsGene.collection_name, VariantAssociatedWithDisorder.collection_name, GeneAssociatedWithDisorder.collection_name],
-                                                           [genomic_variant_updates, variant_gene_updates, variant_disorder_updates, gene_disorder_updates]):
-                bulk_write_results = MongoInstance.DB[this_collection_name].bulk_write(
-                    these_updates)
-                if bulk_write_results.bulk_api_result['writeErrors'] or bulk_write_results.bulk_api_result['writeConcernErrors']:
-                    logger.debug(bulk_write_results.bulk_api_result)
-
+        with (
+            bulk_writer.writer(GenomicVariant.collection_name) as variant_writer,
+            bulk_writer.writer(VariantAffectsGene.collection_name) as variant_gene_writer,
+            bulk_writer.writer(VariantAssociatedWithDisorder.collection_name) as variant_disorder_writer,
+            bulk_writer.writer(GeneAssociatedWithDisorder.collection_name) as gene_disorder_writer,
+        ):
+            writers = (variant_writer, variant_gene_writer, variant_disorder_writer, gene_disorder_writer)
+            for chunk in _tqdm(_chunked(updates, 10_000), leave=False, desc="Parsing COSMIC"):
+                if not chunk:
+                    continue
+                genomic_variant_updates, variant_gene_updates = [], []
+                variant_disorder_updates, gene_disorder_updates = [], []
+                for genomic_variant, variant_gene, variant_disorder in chunk:
+                    if genomic_variant:
+                        genomic_variant_updates.append(
+                            genomic_variant.generate_update())
+                        variant_gene_updates.append(variant_gene.generate_update())
+                        if variant_disorder:
+                            variant_disorder_updates.append(
+                                variant_disorder.generate_update())
+                            gene_disorder = GeneAssociatedWithDisorder(dataSources=["cosmic"],
+                                                                 sourceDomainId=variant_gene.targetDomainId,
+                                                                 targetDomainId=variant_disorder.targetDomainId)
+                            gene_disorder_updates.append(gene_disorder.generate_update())
+
+                for writer, these_updates in zip(writers, [genomic_variant_updates, variant_gene_updates,
+                                                           variant_disorder_updates, gene_disorder_updates]):
+                    writer.write(these_updates)
+        id_index.invalidate(GenomicVariant)
 
 
 def parse_gene_disease_associations():
@@ -6,7 +6,7 @@ import gzip as _gzip
 
 from more_itertools import chunked as _chunked
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.nodes.drug import Drug
@@ -44,23 +44,11 @@ class CTDDrugChemicalRow:
 
 
 def mesh_to_nedrex_map() -> dict[str, list[str]]:
-    mn_map = _defaultdict(list)
-
-    for doc in Disorder.find(MongoInstance.DB):
-        mesh_ids = [mid for mid in doc["domainIds"] if mid.startswith("mesh.")]
-        for mid in mesh_ids:
-            mn_map[mid].append(doc["primaryDomainId"])
-
-    return mn_map
+    return _defaultdict(list, id_index.id_map(Disorder, prefix="mesh."))
 
 
 def cas_rn_to_nedrex_map() -> dict[str, list[str]]:
-    casn_map = _defaultdict(list)
-
-    for doc in Drug.find(MongoInstance.DB):
-        casn_map[doc["casNumber"]].append(doc["primaryDomainId"])
-
-    return casn_map
+    return _defaultdict(list, id_index.id_map(Drug, field="casNumber"))
 
 
 def parse():
@@ -86,6 +74,7 @@ def parse():
             CTDDrugChemicalRow(row).parse(casn_map, mn_map) for row in reader if row["DirectEvidence"] == "therapeutic"
         )
 
-        for chunk in _chunked(updates, 1_000):
-            chunk = [i.generate_update() for i in _chain(*chunk)]
-            MongoInstance.DB[DrugHasIndication.collection_name].bulk_write(chunk)
+        with bulk_load.loader(DrugHasIndication.collection_name) as writer:
+            for chunk in _chunked(updates, 1_000):
+                chunk = [i.generate_update() for i in _chain(*chunk)]
+                writer.write(chunk)
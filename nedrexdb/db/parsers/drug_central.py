@@ -17,7 +17,7 @@ from pymongo import UpdateOne as _UpdateOne
 from sqlalchemy import create_engine as _create_engine, text as _text
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, bulk_writer, id_index
 from nedrexdb.db.models.edges.drug_has_contraindication import DrugHasContraindication
 from nedrexdb.db.models.edges.drug_has_indication import DrugHasIndication
 from nedrexdb.db.models.edges.drug_has_target import DrugHasTarget
@@ -33,13 +33,7 @@ _client = _docker.from_env()
 
 
 def _generate_snomed_to_nedrex_map() -> dict[str, list[str]]:
-    d = _defaultdict(list)
-    for dis in Disorder.find(MongoInstance.DB):
-        snomed_ids = [acc for acc in dis["domainIds"] if acc.startswith("snomedct.")]
-        for snomed_id in snomed_ids:
-            d[snomed_id].append(dis["primaryDomainId"])
-
-    return d
+    return _defaultdict(list, id_index.id_map(Disorder, prefix="snomedct."))
 
 
 @_dataclass
@@ -286,25 +280,29 @@ def parse_drug_central():
 
         dc_to_db_map = p._get_drug_central_to_drugbank_map()
         snomed_to_nedrex_map = _generate_snomed_to_nedrex_map()
-        nedrex_drugs = {drug["primaryDomainId"] for drug in Drug.find(MongoInstance.DB)}
-        nedrex_proteins = {pro["primaryDomainId"] for pro in Protein.find(MongoInstance.DB)}
+        nedrex_drugs = id_index.primary_ids(Drug)
+        nedrex_proteins = id_index.primary_ids(Protein)
 
         updates = (dht.generate_update() for dht in p.iter_targets(dc_to_db_map, nedrex_proteins))
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central targets"):
-            MongoInstance.DB[DrugHasTarget.collection_name].bulk_write(chunk)
+        with bulk_load.loader(DrugHasTarget.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central targets"):
+                writer.write(chunk)
 
-        updates = (update for update in _drug_central_xref_updates(dc_to_db_map, nedrex_drugs))
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central ID mapping file"):
-            MongoInstance.DB[Drug.collection_name].bulk_write(chunk)
+        updates = _drug_central_xref_updates(dc_to_db_map, nedrex_drugs)
+        with bulk_writer.writer(Drug.collection_name) as writer:
+            writer.write(_tqdm(updates, leave=False, desc="Parsing Drug Central ID mapping file"))
+        id_index.invalidate(Drug)
 
         updates = (
             dhi.generate_update() for dhi in p.iter_indications(dc_to_db_map, snomed_to_nedrex_map, nedrex_drugs)
         )
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central indications"):
-            MongoInstance.DB[DrugHasIndication.collection_name].bulk_write(chunk)
+        with bulk_load.loader(DrugHasIndication.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central indications"):
+                writer.write(chunk)
 
         updates = (
             dhc.generate_update() for dhc in p.iter_contraindications(dc_to_db_map, snomed_to_nedrex_map, nedrex_drugs)
         )
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central contraindications"):
-            MongoInstance.DB[DrugHasContraindication.collection_name].bulk_write(chunk)
+        with bulk_load.loader(DrugHasContraindication.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing Drug Central contraindications"):
+                writer.write(chunk)
@@ -1,63 +1,63 @@
-import xml.etree.cElementTree as _et
-from collections import OrderedDict as _OrderedDict
+import multiprocessing as _mp
+import os as _os
 from csv import DictReader as _DictReader
-from itertools import chain
-from multiprocessing import Pool as _Pool
 from typing import Optional as _Optional
 from uuid import uuid4 as _uuid4
-from zipfile import ZipFile as _ZipFile
+from zipfile import ZipFile as _ZipFile, is_zipfile as _is_zipfile
 
+from lxml import etree as _let
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
-from xmljson import badgerfish as _bf
 
-from nedrexdb.db import MongoInstance
-from nedrexdb.db.parsers import _get_file_location_factory
+from nedrexdb import config as _config
+from nedrexdb.db import bulk_load, id_index
+from nedrexdb.db.parsers import _get_file_location_factory, iter_element_chunks, parse_element_chunk
 from nedrexdb.db.models.nodes.drug import Drug, BiotechDrug, SmallMoleculeDrug
 from nedrexdb.db.models.nodes.protein import Protein
 from nedrexdb.db.models.edges.drug_has_target import DrugHasTarget
 from nedrexdb.exceptions import AssumptionError as _AssumptionError
+from nedrexdb.logger import logger
 
 get_file_location = _get_file_location_factory("drugbank")
 
+_NAMESPACE = "http://www.drugbank.ca"
 
-def _recursive_yield(elem):
-    if isinstance(elem, _OrderedDict):
-        yield elem
-    else:
-        for i in elem:
-            yield from _recursive_yield(i)
 
+def _xpath(path):
+    return _let.XPath(path, namespaces={"db": _NAMESPACE}, smart_strings=False)
 
-class DrugBankDrugTarget:
-    def __init__(self, entry):
-        self._entry = entry
 
-    def iter_targets(self):
-        targets = self._entry.get(ns("targets"))
-        if not targets:
-            return []
-
-        targets = targets.get(ns("target"))
-        if not targets:
-            return []
+# the paths are relative to a drug element
+_DRUGBANK_IDS = _xpath("db:drugbank-id/text()")
+_PRIMARY_IDS = _xpath("db:drugbank-id[@primary]/text()")
+_NAME = _xpath("string(db:name)")
+_INDICATION = _xpath("string(db:indication)")
+_CAS_NUMBER = _xpath("string(db:cas-number)")
+_DESCRIPTION = _xpath("string(db:description)")
+_SYNONYMS = _xpath("db:synonyms/db:synonym/text()")
+_CATEGORIES = _xpath("db:categories/db:category/db:category/text()")
+_GROUPS = _xpath("db:groups/db:group/text()")
+_PROPERTIES = _xpath("db:calculated-properties/db:property")
+_PROPERTY_KIND = _xpath("string(db:kind)")
+_PROPERTY_VALUE = _xpath("string(db:value)")
+_FASTA_SEQUENCES = _xpath("db:sequences/db:sequence[@format='FASTA']/text()")
+_TARGETS = _xpath("db:targets/db:target")
+_TARGET_ACTIONS = _xpath("db:actions/db:action/text()")
+_TARGET_PROTEINS = _xpath("db:polypeptide[@source='TrEMBL' or @source='Swiss-Prot']/@id")
 
-        for target in _recursive_yield(targets):
-            actions = target.get(ns("actions"))
-            if actions:
-                actions = [i["$"] for i in _recursive_yield(actions[ns("action")])]
-            else:
-                actions = []
+# the known proteins, set in the (forked) workers, see _init_worker
+_proteins = None
 
-            polypeptide = target.get(ns("polypeptide"))
-            if not polypeptide:
-                continue
 
-            for item in _recursive_yield(polypeptide):
-                if not item["@source"] in {"TrEMBL", "Swiss-Prot"}:
-                    continue
+class DrugBankDrugTarget:
+    def __init__(self, entry):
+        self._entry = entry
 
-                yield (f"uniprot.{item['@id']}", actions)
+    def iter_targets(self):
+        for target in _TARGETS(self._entry):
+            actions = _TARGET_ACTIONS(target)
+            for protein in _TARGET_PROTEINS(target):
+                yield (f"uniprot.{protein}", actions)
 
     def get_drug(self):
         return DrugBankEntry(self._entry).get_primary_domain_id()
@@ -88,22 +88,14 @@ class DrugBankEntry:
     #       time around.
     @property
     def _calculated_properties(self):
-        if self.__calculated_properties is not None:
-            return self.__calculated_properties
-
-        properties = self._entry[ns("calculated-properties")]
-        if ns("property") not in properties.keys():
-            self.__calculated_properties = {}
-            return self.__calculated_properties
-
-        properties = properties[ns("property")]
-        if isinstance(properties, _OrderedDict):
-            properties = [properties]
-        self.__calculated_properties = {prop[ns("kind")]["$"]: prop[ns("value")]["$"] for prop in properties}
+        if self.__calculated_properties is None:
+            self.__calculated_properties = {
+                _PROPERTY_KIND(prop): _PROPERTY_VALUE(prop) for prop in _PROPERTIES(self._entry)
+            }
         return self.__calculated_properties
 
     def get_drug_type(self) -> str:
-        drug_type = self._entry["@type"]
+        drug_type = self._entry.get("type")
 
         if drug_type == "biotech":
             return "BiotechDrug"
@@ -113,91 +105,35 @@ class DrugBankEntry:
             raise _AssumptionError("encountered unexpected DrugBank drug type")
 
     def get_primary_domain_id(self) -> str:
-        drug_ids = self._entry[ns("drugbank-id")]
-        if isinstance(drug_ids, _OrderedDict):
-            drug_ids = [drug_ids]
-
-        primary_ids = [drug_id for drug_id in drug_ids if "@primary" in drug_id]
+        primary_ids = _PRIMARY_IDS(self._entry)
         if len(primary_ids) != 1:
             raise _AssumptionError("expected only one primary ID for DrugBank drug")
 
-        return f"drugbank.{primary_ids.pop()['$']}"
+        return f"drugbank.{primary_ids.pop()}"
 
     def get_domain_ids(self) -> list[str]:
-        drug_ids = self._entry[ns("drugbank-id")]
-        if isinstance(drug_ids, _OrderedDict):
-            drug_ids = [drug_ids]
-
-        drug_ids = [f"drugbank.{drug_id['$']}" for drug_id in drug_ids]
-        return drug_ids
+        return [f"drugbank.{drug_id}" for drug_id in _DRUGBANK_IDS(self._entry)]
 
     def get_display_name(self) -> str:
-        return self._entry[ns("name")]["$"]
+        return _NAME(self._entry)
 
     def get_indications(self) -> str:
-        indications = self._entry[ns("indication")]
-        if "$" in indications.keys():
-            return indications["$"]
-        else:
-            return ""
+        return _INDICATION(self._entry)
 
     def get_cas_number(self) -> str:
-        cas_number = self._entry[ns("cas-number")]
-        if "$" in cas_number:
-            return cas_number["$"]
-        else:
-            return ""
+        return _CAS_NUMBER(self._entry)
 
     def get_description(self) -> str:
-        description = self._entry[ns("description")]
-        if "$" in description:
-            return description["$"]
-        else:
-            return ""
+        return _DESCRIPTION(self._entry)
 
     def get_synonyms(self) -> list[str]:
-        synonyms: list[str] = []
-
-        syns = self._entry[ns("synonyms")]
-        if not ns("synonym") in syns.keys():
-            return synonyms
-
-        syns = syns[ns("synonym")]
-        if isinstance(syns, _OrderedDict):
-            syns = [syns]
-        for synonym in syns:
-            synonyms.append(synonym["$"])
-
-        return synonyms
+        return _SYNONYMS(self._entry)
 
     def get_drug_categories(self) -> list[str]:
-        categories: list[str] = []
-
-        cats = self._entry[ns("categories")]
-        if not ns("category") in cats:
-            return categories
-
-        cats = cats[ns("category")]
-        if isinstance(cats, _OrderedDict):
-            cats = [cats]
-        for cat in cats:
-            categories.append(cat[ns("category")]["$"])
-
-        return categories
+        return _CATEGORIES(self._entry)
 
     def get_drug_groups(self) -> list[str]:
-        groups: list[str] = []
-
-        if ns("groups") not in self._entry.keys():
-            return groups
-
-        grps = self._entry[ns("groups")][ns("group")]
-        if isinstance(grps, _OrderedDict):
-            grps = [grps]
-        for grp in grps:
-            groups.append(grp["$"])
-
-        return groups
+        return _GROUPS(self._entry)
 
     def get_smiles(self) -> _Optional[str]:
         return self._calculated_properties.get("SMILES")
@@ -212,18 +148,7 @@ class DrugBankEntry:
         return self._calculated_properties.get("Molecular Formula")
 
     def get_sequences(self) -> list[str]:
-        sequences: list[str] = []
-
-        seqs = self._entry[ns("sequences")]
-        if not ns("sequence") in seqs.keys():
-            return sequences
-
-        seqs = seqs[ns("sequence")]
-        if isinstance(seqs, _OrderedDict):
-            seqs = [seqs]
-
-        seqs = [seq for seq in seqs if seq["@format"] == "FASTA"]
-        seqs = [seq["$"].split("\n", 1) for seq in seqs]
+        seqs = [seq.split("\n", 1) for seq in _FASTA_SEQUENCES(self._entry)]
         seqs = [(name[1:], seq.replace("\n", "")) for name, seq in seqs]
         sequences = [">{} {}\n{}".format(_uuid4(), name, seq) for name, seq in seqs]
         return sequences
@@ -256,20 +181,6 @@ class DrugBankEntry:
         return d
 
 
-# ns = namespace
-def ns(string) -> str:
-    return "{http://www.drugbank.ca}" + string
-
-
-def _entry_to_update(entry):
-    # NOTE: This function parses both drugs and drug targets, which means that
-    #       there is no need to iterate over the file a second time.
-    entry_as_json = _bf.data(entry)[ns("drug")]
-    db = DrugBankEntry(entry_as_json).parse().generate_update()
-    dht = [i.generate_update() for i in DrugBankDrugTarget(entry_as_json).parse()]
-    return db, dht
-
-
 def parse_drugbank_open():
     filename = get_file_location("open")
     zf = _ZipFile(filename)
@@ -288,45 +199,76 @@ def parse_drugbank_open():
 
 def parse_drugbank():
     updates = (drug.generate_update() for drug in parse_drugbank_open())
-    for chunk in _chunked(updates, 1_000):
-        MongoInstance.DB[Drug.collection_name].bulk_write(chunk)
+    with bulk_load.loader(Drug.collection_name) as writer:
+        for chunk in _chunked(updates, 1_000):
+            writer.write(chunk)
+    id_index.invalidate(Drug)
 
 
-def _parse_drugbank():
-    filename = get_file_location("all")
+def _open_full_database(filename):
+    """Opens the full database XML in binary mode, also if it is (still) in the ZIP archive of the download."""
+    if not _is_zipfile(filename):
+        return open(filename, "rb")
+
+    zf = _ZipFile(filename)
+    (member,) = [name for name in zf.namelist() if name.endswith(".xml")]
+    return zf.open(member)
 
-    def db_iter():
-        with open(filename, "r") as handle:
-            depth = 0
 
-            # Iterate through and yield drugs.
-            for event, elem in _et.iterparse(handle, events=["start", "end"]):
-                if elem.tag != ns("drug"):
-                    continue
+def iter_drug_chunks(filename):
+    """Yields chunks of (unparsed) top-level drug elements, see iter_element_chunks.
 
-                if event == "start":
-                    depth += 1
-                elif event == "end":
-                    depth -= 1
+    The drugs listed in pathways are drug elements, too; they stay part of their top-level drug.
+    """
+    with _open_full_database(filename) as f:
+        yield from iter_element_chunks(f, "drug")
 
-                if event == "end" and depth == 0:
-                    yield elem
 
-    proteins = {protein["primaryDomainId"] for protein in Protein.find(MongoInstance.DB)}
+def _init_worker(proteins):
+    global _proteins
+    _proteins = proteins
 
-    with _Pool(2) as pool:
-        updates = pool.imap_unordered(_entry_to_update, db_iter(), chunksize=10)
-        for chunk in _tqdm(_chunked(updates, 100), leave=False, desc="Parsing DrugBank"):
-            chunk = [item for item in chunk if item]
-            drugs, drug_targets = zip(*chunk)
 
-            drugs = list(drugs)
-            MongoInstance.DB[Drug.collection_name].bulk_write(drugs)
+def _parse_drugs(chunk):
+    # NOTE: This function parses both drugs and drug targets, which means that
+    #       there is no need to iterate over the file a second time.
+    drugs = []
+    drug_targets = []
+    for entry in parse_element_chunk(chunk, namespace=_NAMESPACE):
+        drugs.append(DrugBankEntry(entry).parse().generate_update())
+        drug_targets.extend(
+            dht.generate_update() for dht in DrugBankDrugTarget(entry).parse() if dht.targetDomainId in _proteins
+        )
+    return drugs, drug_targets
+
 
-            drug_targets = list(chain(*drug_targets))
-            drug_targets = [update for update in drug_targets if update._filter["targetDomainId"] in proteins]
+def _iter_drug_updates(filename, workers):
+    """Yields (drug updates, drug-target updates) for chunks of drugs, parsed by `workers` processes.
 
-            # NOTE: In testing, it was possible to get an empty list for drug
-            #       targets, which causes the bulk_write method to fail.
-            if drug_targets:
-                MongoInstance.DB[DrugHasTarget.collection_name].bulk_write(drug_targets)
+    The parent only reads the file and splits it into chunks of drugs.
+    """
+    proteins = id_index.primary_ids(Protein)
+    chunks = iter_drug_chunks(filename)
+    if workers <= 1:
+        _init_worker(proteins)
+        yield from map(_parse_drugs, chunks)
+        return
+
+    logger.debug(f"Parsing DrugBank with {workers} workers")
+    with _mp.get_context("fork").Pool(workers, initializer=_init_worker, initargs=(proteins,)) as pool:
+        yield from pool.imap(_parse_drugs, chunks)
+
+
+def _parse_drugbank():
+    filename = get_file_location("all")
+    # all CPUs by default
+    workers = _config.get("db.drugbank_workers") or _os.cpu_count() or 1
+
+    with (
+        bulk_load.loader(Drug.collection_name) as drug_writer,
+        bulk_load.loader(DrugHasTarget.collection_name) as target_writer,
+    ):
+        for drugs, drug_targets in _tqdm(_iter_drug_updates(filename, workers), leave=False, desc="Parsing DrugBank"):
+            drug_writer.write(drugs)
+            target_writer.write(drug_targets)
+    id_index.invalidate(Drug)
@@ -7,7 +7,7 @@ from more_itertools import chunked as _chunked
 from rdflib import Graph as _Graph, term as _term
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.go import GO
 from nedrexdb.db.models.nodes.protein import Protein
@@ -154,20 +154,23 @@ def parse_go():
     logger.info("Parsing and storing GO terms")
     updates = (GORelations(value) for value in details.values())
     updates = (go_rel.parse_go_term().generate_update() for go_rel in updates if not go_rel.is_deprecated)
-    for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing GO terms"):
-        MongoInstance.DB[GO.collection_name].bulk_write(chunk)
+    with bulk_load.loader(GO.collection_name) as writer:
+        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing GO terms"):
+            writer.write(chunk)
+    id_index.invalidate(GO)
 
     logger.info("Parsing and storing relationships between GO terms")
     updates = (GORelations(value).parse_go_relationships() for value in details.values())
-    for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing relationships between GO terms"):
-        chunk = [rel.generate_update() for rel in _chain(*chunk)]
-        MongoInstance.DB[GOIsSubtypeOfGO.collection_name].bulk_write(chunk)
+    with bulk_load.loader(GOIsSubtypeOfGO.collection_name) as writer:
+        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing relationships between GO terms"):
+            chunk = [rel.generate_update() for rel in _chain(*chunk)]
+            writer.write(chunk)
 
 
 def parse_goa():
     logger.info("Parsing GO")
-    go_terms = {doc["primaryDomainId"] for doc in GO.find(MongoInstance.DB)}
-    proteins = {doc["primaryDomainId"] for doc in Protein.find(MongoInstance.DB)}
+    go_terms = id_index.primary_ids(GO)
+    proteins = id_index.primary_ids(Protein)
 
     file = get_file_location("go_annotations")
 
@@ -176,6 +179,7 @@ def parse_goa():
     go_associations = (assoc for assoc in go_associations if assoc.source_domain_id in proteins)
     go_associations = (assoc for assoc in go_associations if assoc.target_domain_id in go_terms)
 
-    for chunk in _tqdm(_chunked(go_associations, 1_000), leave=False, desc="Parsing GO annotations for proteins"):
-        update = [assoc.parse().generate_update() for assoc in chunk]
-        MongoInstance.DB[ProteinHasGOAnnotation.collection_name].bulk_write(update)
+    with bulk_load.loader(ProteinHasGOAnnotation.collection_name) as writer:
+        for chunk in _tqdm(_chunked(go_associations, 1_000), leave=False, desc="Parsing GO annotations for proteins"):
+            update = [assoc.parse().generate_update() for assoc in chunk]
+            writer.write(update)
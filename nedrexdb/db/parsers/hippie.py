@@ -1,4 +1,7 @@
+from nedrexdb.db import MongoInstance
+from nedrexdb.db.models.edges.protein_interacts_with_protein import ProteinInteractsWithProtein
 from nedrexdb.db.parsers import _get_file_location_factory
+from nedrexdb.logger import logger
 import pandas as pd
 
 get_file_location = _get_file_location_factory("hippie")
@@ -8,4 +11,9 @@ def parse_perplexity_techinque_scores():
     method_scores_file = get_file_location("perplexity_scores")
     method_scores = pd.read_csv(method_scores_file, sep='\t', usecols=['methods', 'score'])
     method_scores_dict = dict(zip(method_scores['methods'], method_scores['score']))
-    return method_scores_dict
\ No newline at end of file
+    return method_scores_dict
+
+
+def score_ppis(method_scores):
+    logger.info("Scoring PPIs with HIPPIE method scores")
+    ProteinInteractsWithProtein.set_methods_scores(MongoInstance.DB, method_scores)
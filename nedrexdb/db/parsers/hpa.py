@@ -1,12 +1,11 @@
 import gzip
-import xml.etree.cElementTree as et
-from itertools import chain
+import multiprocessing as _mp
 
 from tqdm import tqdm
-from more_itertools import chunked
 
-from nedrexdb.db import MongoInstance
-from nedrexdb.db.parsers import _get_file_location_factory
+from nedrexdb import config as _config
+from nedrexdb.db import bulk_load, id_index
+from nedrexdb.db.parsers import _get_file_location_factory, iter_element_chunks, parse_element_chunk
 from nedrexdb.db.models.nodes.tissue import Tissue
 from nedrexdb.db.models.nodes.gene import Gene
 from nedrexdb.db.models.nodes.protein import Protein
@@ -16,6 +15,23 @@ from nedrexdb.logger import logger
 
 get_file_location = _get_file_location_factory("hpa")
 
+_RNA_LEVELS = {
+    "normalizedRNAExpression": "nTPM",
+    "proteinCodingRNAExpression": "pTPM",
+    "RNAExpression": "TPM",
+}
+
+# the known (tissue, gene, protein) IDs, set in the (forked) workers, see _init_worker
+_known_ids = None
+
+
+def _child(elem, tag):
+    """Returns the first child with the tag (like find, but without parsing a path)."""
+    for child in elem:
+        if child.tag == tag:
+            return child
+    return None
+
 
 class HPAEntry:
     def __init__(self, entry):
@@ -25,51 +41,51 @@ class HPAEntry:
         self.__rna_expression = None
         self.__protein_expression = None
 
+    def _xrefs(self, db):
+        identifier = _child(self.__entry, "identifier")
+        if identifier is None:
+            return []
+        return [xref.get("id") for xref in identifier if xref.tag == "xref" and xref.get("db") == db]
+
     @property
     def proteins(self):
         if self.__proteins is None:
-            self.__proteins = [
-                f"uniprot.{i.get('id')}"
-                for i in self.__entry.find("identifier").findall("xref")
-                if i.get("db") == "Uniprot/SWISSPROT"
-            ]
+            self.__proteins = [f"uniprot.{i}" for i in self._xrefs("Uniprot/SWISSPROT")]
         return self.__proteins
 
     @property
     def genes(self):
         if self.__genes is None:
-            self.__genes = [
-                f"entrez.{i.get('id')}"
-                for i in self.__entry.find("identifier").findall("xref")
-                if i.get("db") == "NCBI GeneID"
-            ]
+            self.__genes = [f"entrez.{i}" for i in self._xrefs("NCBI GeneID")]
         return self.__genes
 
+    def _tissue_data(self, tag):
+        """Yields the data elements of the (first) expression element with the tag and their tissues."""
+        expression_elem = _child(self.__entry, tag)
+        if expression_elem is None:
+            return
+
+        for item in expression_elem:
+            if item.tag != "data":
+                continue
+            tissue = _child(item, "tissue")
+            tissue_obj = get_tissue(tissue) if tissue is not None else None
+            if tissue_obj is not None:
+                yield item, tissue_obj
+
     @property
     def rna_expression(self):
         if self.__rna_expression is not None:
             return self.__rna_expression
 
-        rna_expression_elem = self.__entry.find("rnaExpression")
         expression = []
-
-        for item in rna_expression_elem.findall("data"):
-            tissue = item.find("tissue")
-            tissue_obj = get_tissue(tissue)
-            if tissue_obj is None:
-                continue
-
+        for item, tissue_obj in self._tissue_data("rnaExpression"):
             data = {"tissue": tissue_obj}
-
-            for key, xpath in [
-                ("nTPM", "./level[@type='normalizedRNAExpression']"),
-                ("pTPM", "./level[@type='proteinCodingRNAExpression']"),
-                ("TPM", "./level[@type='RNAExpression']"),
-            ]:
-                expr = item.find(xpath)
-                if expr is not None:
-                    data[key] = float(expr.get("expRNA"))
-
+            for level in item:
+                key = _RNA_LEVELS.get(level.get("type")) if level.tag == "level" else None
+                # the first level of each type counts
+                if key is not None and key not in data:
+                    data[key] = float(level.get("expRNA"))
             expression.append(data)
 
         self.__rna_expression = expression
@@ -79,24 +95,11 @@ class HPAEntry:
     def protein_expression(self):
         if self.__protein_expression is not None:
             return self.__protein_expression
-        tissue_expression_elem = self.__entry.find("tissueExpression")
-
-        if tissue_expression_elem is None:
-            self.__protein_expression = []
-            return self.__protein_expression
-
-        expression = []
 
-        for item in tissue_expression_elem.findall("data"):
-            tissue = item.find("tissue")
-            tissue_obj = get_tissue(tissue)
-            if tissue_obj is None:
-                continue
-
-            level = item.find("level").text
-            expression.append({"tissue": tissue_obj, "level": level})
-
-        self.__protein_expression = expression
+        self.__protein_expression = [
+            {"tissue": tissue_obj, "level": _child(item, "level").text}
+            for item, tissue_obj in self._tissue_data("tissueExpression")
+        ]
         return self.__protein_expression
 
 
@@ -112,68 +115,81 @@ def get_tissue(tissue):
     return uberon_ids
 
 
-def iter_entries():
+def iter_entry_chunks():
+    """Yields chunks of (unparsed) entry elements, see iter_element_chunks."""
     fname = get_file_location("all")
-    with gzip.open(fname, "rt") as f:
-        xml_parser = et.iterparse(f, events=("end",))
+    with gzip.open(fname, "rb") as f:
+        yield from iter_element_chunks(f, "entry")
+
+
+def _init_worker(known_ids):
+    global _known_ids
+    _known_ids = known_ids
+
+
+def _parse_entries(chunk):
+    """Returns the gene and protein expression updates of a chunk of entries, for the known IDs."""
+    tissues, genes, proteins = _known_ids
+    gene_expression = []
+    protein_expression = []
+
+    for elem in parse_element_chunk(chunk):
+        entry = HPAEntry(elem)
 
-        for _, elem in xml_parser:
-            if elem.tag != "entry":
+        for gene in entry.genes:
+            if gene not in genes:
                 continue
+            for rna_expr in entry.rna_expression:
+                geit = GeneExpressedInTissue(
+                    sourceDomainId=gene,
+                    TPM=rna_expr.get("TPM"),
+                    nTPM=rna_expr.get("nTPM"),
+                    pTPM=rna_expr.get("pTPM"),
+                    dataSources=["hpa"],
+                )
+                for tissue in rna_expr["tissue"]:
+                    if tissue in tissues:
+                        geit.targetDomainId = tissue
+                        gene_expression.append(geit.generate_update())
+
+        for protein in entry.proteins:
+            if protein not in proteins:
+                continue
+            for pro_expr in entry.protein_expression:
+                peit = ProteinExpressedInTissue(sourceDomainId=protein, level=pro_expr["level"], dataSources=["hpa"])
+                for tissue in pro_expr["tissue"]:
+                    if tissue in tissues:
+                        peit.targetDomainId = tissue
+                        protein_expression.append(peit.generate_update())
 
-            entry = HPAEntry(elem)
-            gene_expression = []
-            protein_expression = []
-
-            for gene in entry.genes:
-                for rna_expr in entry.rna_expression:
-                    gene_expression += [
-                        GeneExpressedInTissue(
-                            sourceDomainId=gene,
-                            targetDomainId=tissue,
-                            TPM=rna_expr.get("TPM"),
-                            nTPM=rna_expr.get("nTPM"),
-                            pTPM=rna_expr.get("pTPM"),
-                            dataSources=["hpa"],
-                        )
-                        for tissue in rna_expr["tissue"]
-                    ]
-
-            for protein in entry.proteins:
-                for pro_expr in entry.protein_expression:
-                    protein_expression += [
-                        ProteinExpressedInTissue(
-                            sourceDomainId=protein, targetDomainId=tissue, level=pro_expr["level"], dataSources=["hpa"]
-                        )
-                        for tissue in pro_expr["tissue"]
-                    ]
-
-            yield gene_expression, protein_expression
-
-            elem.clear()
+    return gene_expression, protein_expression
 
 
-def parse_hpa():
-    logger.info("Parsing Human Protein Atlas")
-    tissues = {i["primaryDomainId"] for i in Tissue.find(MongoInstance.DB)}
-    genes = {i["primaryDomainId"] for i in Gene.find(MongoInstance.DB)}
-    proteins = {i["primaryDomainId"] for i in Protein.find(MongoInstance.DB)}
+def _iter_expression_updates(workers):
+    """Yields (gene expression updates, protein expression updates) for chunks of entries.
 
-    for chunk in tqdm(chunked(iter_entries(), 10), leave=False):
-        gene_expression, protein_expression = zip(*chunk)
+    The parent only decompresses the file and splits it into chunks, which are
+    parsed by `workers` processes.
+    """
+    known_ids = (id_index.primary_ids(Tissue), id_index.primary_ids(Gene), id_index.primary_ids(Protein))
+    if workers <= 1:
+        _init_worker(known_ids)
+        yield from map(_parse_entries, iter_entry_chunks())
+        return
 
-        gene_expression = [
-            item.generate_update()
-            for item in chain(*gene_expression)
-            if item.sourceDomainId in genes and item.targetDomainId in tissues
-        ]
-        if gene_expression:
-            MongoInstance.DB[GeneExpressedInTissue.collection_name].bulk_write(gene_expression)
+    with _mp.get_context("fork").Pool(workers, initializer=_init_worker, initargs=(known_ids,)) as pool:
+        yield from pool.imap(_parse_entries, iter_entry_chunks())
 
-        protein_expression = [
-            item.generate_update()
-            for item in chain(*protein_expression)
-            if item.sourceDomainId in proteins and item.targetDomainId in tissues
-        ]
-        if protein_expression:
-            MongoInstance.DB[ProteinExpressedInTissue.collection_name].bulk_write(protein_expression)
+
+def parse_hpa():
+    logger.info("Parsing Human Protein Atlas")
+    workers = _config.get("db.hpa_workers") or 1
+
+    # the loaders write the updates of each chunk in batches of db.write_batch_bytes
+    with (
+        bulk_load.loader(GeneExpressedInTissue.collection_name) as gene_writer,
+        bulk_load.loader(ProteinExpressedInTissue.collection_name) as protein_writer,
+    ):
+        for gene_expression, protein_expression in tqdm(_iter_expression_updates(workers), leave=False):
+            gene_writer.write(gene_expression)
+            protein_writer.write(protein_expression)
@@ -6,7 +6,7 @@ import obonet
 from more_itertools import chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import MongoInstance, bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.nodes.phenotype import Phenotype
@@ -17,7 +17,7 @@ get_file_location = _get_file_location_factory("hpo")
 
 @_lru_cache(maxsize=None)
 def get_disorder_by_domain_id(domain_id):
-    return [disorder["primaryDomainId"] for disorder in Disorder.find(MongoInstance.DB, {"domainIds": domain_id})]
+    return list(Disorder.find_field(MongoInstance.DB, "primaryDomainId", {"domainIds": domain_id}))
 
 
 class HPONode:
@@ -132,11 +132,16 @@ def parse_hpoa():
 
 
 def parse():
-    for chunk in _tqdm(chunked(parse_phenotypes(), 1_000), leave=False, desc="Parsing HPO phenotypes"):
-        updates = [node.generate_update() for node in chunk]
-        MongoInstance.DB[Phenotype.collection_name].bulk_write(updates)
-
-    for chunk in _tqdm(chunked(parse_hpoa(), 1_000), leave=False, desc="Parsing HPO disorder-phenotype relationships"):
-        updates = [rel.generate_update() for rel in chunk]
-        MongoInstance.DB[DisorderHasPhenotype.collection_name].bulk_write(updates)
+    with bulk_load.loader(Phenotype.collection_name) as writer:
+        for chunk in _tqdm(chunked(parse_phenotypes(), 1_000), leave=False, desc="Parsing HPO phenotypes"):
+            updates = [node.generate_update() for node in chunk]
+            writer.write(updates)
+    id_index.invalidate(Phenotype)
+
+    with bulk_load.loader(DisorderHasPhenotype.collection_name) as writer:
+        for chunk in _tqdm(
+            chunked(parse_hpoa(), 1_000), leave=False, desc="Parsing HPO disorder-phenotype relationships"
+        ):
+            updates = [rel.generate_update() for rel in chunk]
+            writer.write(updates)
     get_disorder_by_domain_id.cache_clear()
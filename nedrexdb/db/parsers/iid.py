@@ -5,7 +5,7 @@ from pathlib import Path as _Path
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.edges.protein_interacts_with_protein import ProteinInteractsWithProtein as _PPI
 from nedrexdb.db.models.nodes.protein import Protein as _Protein
 from nedrexdb.db.parsers import _get_file_location_factory
@@ -239,9 +239,8 @@ class IIDRow:
 
 
 class IIDParser:
-    def __init__(self, f, method_scores):
+    def __init__(self, f):
         self.f: _Path = f
-        self.method_scores = method_scores
 
         if self.f.name.endswith(".gz") or self.f.name.endswith(".gzip"):
             self.gzipped = True
@@ -254,21 +253,22 @@ class IIDParser:
         else:
             f = self.f.open()
 
-        proteins = {i["primaryDomainId"] for i in _Protein.find(MongoInstance.DB)}
+        proteins = id_index.primary_ids(_Protein)
 
         fieldnames = next(f).strip().split("\t")
         reader = _DictReader(f, delimiter="\t", fieldnames=fieldnames)
         updates = (IIDRow(row).parse() for row in reader)
         updates = (ppi for ppi in updates if ppi.memberOne in proteins and ppi.memberTwo in proteins)
-        updates = (ppi.generate_update(self.method_scores, MongoInstance.DB) for ppi in updates)
+        updates = (ppi.generate_update() for ppi in updates)
 
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing IID"):
-            MongoInstance.DB[_PPI.collection_name].bulk_write(chunk)
+        with bulk_load.loader(_PPI.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing IID"):
+                writer.write(chunk)
 
         f.close()
 
 
-def parse_ppis(method_scores):
+def parse_ppis():
     logger.info("Parsing IID")
     filename = get_file_location("human")
-    IIDParser(filename, method_scores).parse()
+    IIDParser(filename).parse()
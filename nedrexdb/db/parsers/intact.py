@@ -5,7 +5,7 @@ from zipfile import ZipFile as _ZipFile
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.nodes.protein import Protein
 from nedrexdb.db.models.edges.protein_interacts_with_protein import ProteinInteractsWithProtein
 from nedrexdb.db.parsers import _get_file_location_factory
@@ -57,10 +57,11 @@ def parse_ppis():
             yield from IntActRow(row).parse()
 
 
-def parse(method_scores):
+def parse():
     logger.info("Parsing IntAct")
-    proteins = {i["primaryDomainId"] for i in Protein.find(MongoInstance.DB)}
-    updates = (ppi.generate_update(method_scores, MongoInstance.DB) for ppi in parse_ppis() if ppi.memberOne in proteins and ppi.memberTwo in proteins)
+    proteins = id_index.primary_ids(Protein)
+    updates = (ppi.generate_update() for ppi in parse_ppis() if ppi.memberOne in proteins and ppi.memberTwo in proteins)
 
-    for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing PPIs from IntAct"):
-        MongoInstance.DB[ProteinInteractsWithProtein.collection_name].bulk_write(chunk)
+    with bulk_load.loader(ProteinInteractsWithProtein.collection_name) as writer:
+        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing PPIs from IntAct"):
+            writer.write(chunk)
@@ -7,7 +7,7 @@ import requests
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.edges.gene_associated_with_disorder import GeneAssociatedWithDisorder
 from nedrexdb.db.models.nodes.gene import Gene
 from nedrexdb.db.parsers import _get_file_location_factory
@@ -94,8 +94,8 @@ class IntOGenParser:
             logger.warning(f"{len(f_dict) - len(f_dict_tmp)} intogen rows were left out, because intogen2mondo could not map: {set(not_mapped)}")
         f_dict = f_dict_tmp
 
-        symbol2entrez = {gene["approvedSymbol"]: gene["primaryDomainId"]
-                         for gene in Gene.find(MongoInstance.DB)}
+        symbol2entrez = {symbol: genes[-1]
+                         for symbol, genes in id_index.id_map(Gene, field="approvedSymbol").items()}
         
         # remove rows with symbols that cannot be mapped to entrez
         f_dict_tmp = []
@@ -111,15 +111,15 @@ class IntOGenParser:
 
         updates = (IntOGenRow(row).parse(self.intogen2mondo, symbol2entrez)
                    for row in f_dict)
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing IntOGen"):
-            chunk = list(_chain(*chunk))
-            chunk = [gawd.generate_update() for gawd in chunk]
+        with bulk_load.loader(GeneAssociatedWithDisorder.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing IntOGen"):
+                chunk = list(_chain(*chunk))
+                chunk = [gawd.generate_update() for gawd in chunk]
 
-            if not chunk:
-                continue
+                if not chunk:
+                    continue
 
-            MongoInstance.DB[GeneAssociatedWithDisorder.collection_name].bulk_write(
-                chunk)
+                writer.write(chunk)
 
         f.close()
 
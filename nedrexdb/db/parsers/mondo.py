@@ -3,7 +3,7 @@ from functools import lru_cache
 
 from more_itertools import chunked as _chunked
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.edges.disorder_is_subtype_of_disorder import (
@@ -127,7 +127,7 @@ def _is_deprecated(node) -> bool:
 
 
 def _parse_edges(edges):
-    mondo_nodes = {node["primaryDomainId"] for node in Disorder.find(MongoInstance.DB)}
+    mondo_nodes = id_index.primary_ids(Disorder)
     prefix = "http://purl.obolibrary.org/obo/MONDO_"
     for edge in edges:
         if not edge["sub"].startswith(prefix):
@@ -164,9 +164,12 @@ def parse_mondo_json():
     nodes = filter(lambda i: not _is_deprecated(i), nodes)
 
     mondo_records = (MondoRecord(node).parse().generate_update() for node in nodes)
-    for chunk in _chunked(mondo_records, 1_000):
-        MongoInstance.DB[Disorder.collection_name].bulk_write(chunk)
+    with bulk_load.loader(Disorder.collection_name) as writer:
+        for chunk in _chunked(mondo_records, 1_000):
+            writer.write(chunk)
+    id_index.invalidate(Disorder)
 
     edges = graph["edges"]
-    for chunk in _chunked(_parse_edges(edges), 1_000):
-        MongoInstance.DB[DisorderIsSubtypeOfDisorder.collection_name].bulk_write(chunk)
+    with bulk_load.loader(DisorderIsSubtypeOfDisorder.collection_name) as writer:
+        for chunk in _chunked(_parse_edges(edges), 1_000):
+            writer.write(chunk)
@@ -5,7 +5,7 @@ from typing import Optional as _Optional
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, bulk_writer, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.gene import Gene
 
@@ -110,12 +110,14 @@ def parse_gene_info():
         reader = _DictReader(filtered_f, delimiter=delimiter, fieldnames=columns)
         updates = (GeneInfoRow(row).parse().generate_update() for row in reader)
 
-        for chunk in _tqdm(
-            _chunked(updates, 1_000),
-            desc="Parsing NCBI gene info",
-            leave=False,
-        ):
-            MongoInstance.DB[Gene.collection_name].bulk_write(chunk)
+        with bulk_load.loader(Gene.collection_name) as writer:
+            for chunk in _tqdm(
+                _chunked(updates, 1_000),
+                desc="Parsing NCBI gene info",
+                leave=False,
+            ):
+                writer.write(chunk)
+    id_index.invalidate(Gene)
 
 
 def parse_gene_summary():
@@ -133,9 +135,6 @@ def parse_gene_summary():
             if row["tax_id"] == "9606"
         )
 
-        for chunk in _tqdm(
-            _chunked(updates, 1_000),
-            desc="Parsing NCBI gene summaries",
-            leave=False,
-        ):
-            MongoInstance.DB[Gene.collection_name].bulk_write(chunk)
\ No newline at end of file
+        with bulk_writer.writer(Gene.collection_name) as writer:
+            writer.write(_tqdm(updates, desc="Parsing NCBI gene summaries", leave=False))
+    id_index.invalidate(Gene)
\ No newline at end of file
@@ -7,7 +7,7 @@ from pathlib import Path as _Path
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.edges.gene_associated_with_disorder import GeneAssociatedWithDisorder
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.nodes.gene import Gene
@@ -18,14 +18,7 @@ get_file_location = _get_file_location_factory("ncg")
 
 
 def _umls_to_nedrex_map() -> dict[str, list[str]]:
-    d = _defaultdict(list)
-
-    for dis in Disorder.find(MongoInstance.DB):
-        umls_ids = [acc for acc in dis["domainIds"] if acc.startswith("umls.")]
-        for umls_id in umls_ids:
-            d[umls_id].append(dis["primaryDomainId"])
-
-    return d
+    return _defaultdict(list, id_index.id_map(Disorder, prefix="umls."))
 
 
 class NCGRow:
@@ -75,20 +68,19 @@ class NCGParser:
 
         reader = _DictReader(f, delimiter="\t")
 
-        genes = {gene["primaryDomainId"]
-                 for gene in Gene.find(MongoInstance.DB)}
+        genes = id_index.primary_ids(Gene)
 
         updates = (NCGRow(row).parse(self.ncg2mondo) for row in reader)
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing NCG"):
-            chunk = list(_chain(*chunk))
-            chunk = [gawd.generate_update()
-                     for gawd in chunk if gawd.sourceDomainId in genes]
+        with bulk_load.loader(GeneAssociatedWithDisorder.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing NCG"):
+                chunk = list(_chain(*chunk))
+                chunk = [gawd.generate_update()
+                         for gawd in chunk if gawd.sourceDomainId in genes]
 
-            if not chunk:
-                continue
+                if not chunk:
+                    continue
 
-            MongoInstance.DB[GeneAssociatedWithDisorder.collection_name].bulk_write(
-                chunk)
+                writer.write(chunk)
 
         f.close()
 
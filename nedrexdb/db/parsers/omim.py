@@ -7,7 +7,7 @@ from typing import Optional as _Optional
 
 from more_itertools import chunked as _chunked
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.edges.gene_associated_with_disorder import GeneAssociatedWithDisorder
 from nedrexdb.db.models.nodes.gene import Gene
 from nedrexdb.db.models.nodes.disorder import Disorder
@@ -61,14 +61,7 @@ class OMIMRow:
 
 
 def _generate_omim_to_nedrex_map() -> dict[str, list[str]]:
-    d = _defaultdict(list)
-
-    for disorder in Disorder.find(MongoInstance.DB):
-        omim_accs = [acc for acc in disorder["domainIds"] if acc.startswith("omim.")]
-        for acc in omim_accs:
-            d[acc].append(disorder["primaryDomainId"])
-
-    return d
+    return _defaultdict(list, id_index.id_map(Disorder, prefix="omim."))
 
 
 class GeneMap2Parser:
@@ -104,15 +97,16 @@ class GeneMap2Parser:
             )
 
             omim_nedrex_map = _generate_omim_to_nedrex_map()
-            genes = {gene["primaryDomainId"] for gene in Gene.find(MongoInstance.DB)}
+            genes = id_index.primary_ids(Gene)
 
             updates = (OMIMRow(row).parse(omim_nedrex_map) for row in reader)
             updates = (update for update in updates if update is not None)
-            for chunk in _chunked(updates, 1_000):
-                chunk = [assoc.generate_update() for assoc in _chain(*updates) if assoc.sourceDomainId in genes]
-                if not chunk:
-                    continue
-                MongoInstance.DB[GeneAssociatedWithDisorder.collection_name].bulk_write(chunk)
+            with bulk_load.loader(GeneAssociatedWithDisorder.collection_name) as writer:
+                for chunk in _chunked(updates, 1_000):
+                    chunk = [assoc.generate_update() for assoc in _chain(*updates) if assoc.sourceDomainId in genes]
+                    if not chunk:
+                        continue
+                    writer.write(chunk)
 
 
 def parse_gene_disease_associations():
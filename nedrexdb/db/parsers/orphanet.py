@@ -2,7 +2,7 @@ from collections import defaultdict as _defaultdict
 from pathlib import Path as _Path
 import xml.etree.cElementTree as _et
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.logger import logger
 from nedrexdb.db.models.nodes.disorder import Disorder
 from nedrexdb.db.models.nodes.gene import Gene
@@ -22,10 +22,8 @@ class OrphanetParser:
     
     def get_orpha_mondo_mapping(self):
         orpha_mondo = _defaultdict(list)
-        for item in Disorder.find(MongoInstance.DB):
-            orpha_ids = [id.replace("orpha.", "") for id in item["domainIds"] if id.startswith("orpha.")]
-            for orpha_id in orpha_ids:
-                orpha_mondo[orpha_id].append(item["primaryDomainId"])
+        for orpha_id, mondo_ids in id_index.id_map(Disorder, prefix="orpha.").items():
+            orpha_mondo[orpha_id.replace("orpha.", "")].extend(mondo_ids)
         return orpha_mondo
                 
 
@@ -107,7 +105,7 @@ class OrphanetParser:
         logger.info(f"Average number of genes per disorder: {avg_gene_ids:.2f}")
         
         # get gene id mapping
-        symbol2entrez = {gene["approvedSymbol"]: gene["primaryDomainId"] for gene in Gene.find(MongoInstance.DB)}
+        symbol2entrez = {symbol: genes[-1] for symbol, genes in id_index.id_map(Gene, field="approvedSymbol").items()}
         n_unmapped = 0
         n_added = 0
 
@@ -122,7 +120,8 @@ class OrphanetParser:
                         ).generate_update())
                 else:
                     n_unmapped += 1
-        MongoInstance.DB[GeneAssociatedWithDisorder.collection_name].bulk_write(chunk)
+        with bulk_load.loader(GeneAssociatedWithDisorder.collection_name) as writer:
+            writer.write(chunk)
 
         if n_unmapped:
             logger.info(f"Orphanet added {n_added} disease gene associations ({n_unmapped} skipped) ")
@@ -4,7 +4,7 @@ from csv import DictReader as _DictReader
 from more_itertools import chunked as _chunked
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.models.edges.protein_in_pathway import ProteinInPathway
 from nedrexdb.db.models.nodes.pathway import Pathway
 from nedrexdb.db.models.nodes.protein import Protein
@@ -102,8 +102,10 @@ class ReactomeParser:
         #       NeDRexDB. This is because each row is a *relation* and, thus,
         #       a single pathway can appear multiple times (as part of many)
         #       relations).
-        for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing pathways"):
-            MongoInstance.DB[Pathway.collection_name].bulk_write(chunk)
+        with bulk_load.loader(Pathway.collection_name) as writer:
+            for chunk in _tqdm(_chunked(updates, 1_000), leave=False, desc="Parsing pathways"):
+                writer.write(chunk)
+        id_index.invalidate(Pathway)
 
         f.close()
 
@@ -115,8 +117,8 @@ class ReactomeParser:
 
         reader = _DictReader(f, fieldnames=self.columns, delimiter=self.delimiter)
 
-        protein_ids = {i["primaryDomainId"] for i in Protein.find(MongoInstance.DB)}
-        pathway_ids = {i["primaryDomainId"] for i in Pathway.find(MongoInstance.DB)}
+        protein_ids = id_index.primary_ids(Protein)
+        pathway_ids = id_index.primary_ids(Pathway)
 
         updates = (ReactomeRow(row).parse_protein_pathway_link() for row in reader)
         updates = (update for update in updates if update is not None)
@@ -124,10 +126,11 @@ class ReactomeParser:
         updates = (update for update in updates if update.targetDomainId in pathway_ids)
         updates = (update.generate_update() for update in updates)
 
-        for chunk in _tqdm(
-            _chunked(updates, 1_000), leave=False, desc="Parsing protein-pathway relationships from Reactome"
-        ):
-            MongoInstance.DB[ProteinInPathway.collection_name].bulk_write(chunk)
+        with bulk_load.loader(ProteinInPathway.collection_name) as writer:
+            for chunk in _tqdm(
+                _chunked(updates, 1_000), leave=False, desc="Parsing protein-pathway relationships from Reactome"
+            ):
+                writer.write(chunk)
 
         f.close()
 
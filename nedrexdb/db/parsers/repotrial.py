@@ -1,6 +1,6 @@
 import csv
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import MongoInstance, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.disorder import Disorder
 
@@ -24,3 +24,4 @@ def parse():
                     }
                 },
             )
+    id_index.invalidate(Disorder)
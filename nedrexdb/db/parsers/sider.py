@@ -6,7 +6,7 @@ from itertools import chain, product
 from more_itertools import chunked
 from tqdm import tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.drug import Drug
 from nedrexdb.db.models.nodes.side_effect import SideEffect
@@ -19,16 +19,16 @@ get_file_location = _get_file_location_factory("sider")
 def pubchem_to_drugbank_map():
     d = defaultdict(list)
 
-    for drug in Drug.find(MongoInstance.DB):
-        pubchem_ids = [i.split(".")[1] for i in drug["domainIds"] if i.startswith("pubchem.")]
+    for pubchem_id, drug_ids in id_index.id_map(Drug, prefix="pubchem.").items():
+        pcid = pubchem_id.split(".")[1]
         # NOTE: Remove IDs > than 8 chars in length.
         # SIDER uses stitch IDs, which arebased on PubChem IDs.
         # From what I can tell, IDs start CID1 or CID0,
         # followed by a zero-padded 8-char PubChem ID.
-        pubchem_ids = [i for i in pubchem_ids if len(i) <= 8]
-        for pcid in pubchem_ids:
-            d[f"CID0{pcid.zfill(8)}"].append(drug["primaryDomainId"])
-            d[f"CID1{pcid.zfill(8)}"].append(drug["primaryDomainId"])
+        if len(pcid) > 8:
+            continue
+        d[f"CID0{pcid.zfill(8)}"].extend(drug_ids)
+        d[f"CID1{pcid.zfill(8)}"].extend(drug_ids)
 
     return d
 
@@ -36,10 +36,8 @@ def pubchem_to_drugbank_map():
 def umls_to_meddra_map():
     d = defaultdict(list)
 
-    for side_effect in SideEffect.find(MongoInstance.DB):
-        umls_ids = [i.split(".")[1] for i in side_effect["domainIds"] if i.startswith("umls")]
-        for umls_id in umls_ids:
-            d[umls_id].append(side_effect["primaryDomainId"])
+    for umls_id, side_effect_ids in id_index.id_map(SideEffect, prefix="umls").items():
+        d[umls_id.split(".")[1]].extend(side_effect_ids)
 
     return d
 
@@ -77,5 +75,6 @@ def parse():
 
                 updates.append(dhse.generate_update())
     logger.debug(f"Identified {len(updates)} DrugHasSideEffect edges")
-    for chunk in tqdm(chunked(updates, 1_000)):
-        MongoInstance.DB[DrugHasSideEffect.collection_name].bulk_write(chunk)
+    with bulk_load.loader(DrugHasSideEffect.collection_name) as writer:
+        for chunk in tqdm(chunked(updates, 1_000)):
+            writer.write(chunk)
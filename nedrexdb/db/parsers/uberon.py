@@ -2,7 +2,7 @@ import json
 
 from more_itertools import chunked
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.tissue import Tissue
 
@@ -26,5 +26,7 @@ def parse():
         for node in uberon_nodes
     )
 
-    for chunk in chunked(tissues, 1_000):
-        MongoInstance.DB[Tissue.collection_name].bulk_write(chunk)
+    with bulk_load.loader(Tissue.collection_name) as writer:
+        for chunk in chunked(tissues, 1_000):
+            writer.write(chunk)
+    id_index.invalidate(Tissue)
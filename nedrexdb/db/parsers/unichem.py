@@ -1,12 +1,11 @@
 import csv
 import gzip
-import time
 
-from more_itertools import chunked
 from pymongo import UpdateMany
 from tqdm import tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import bulk_writer, id_index
+from nedrexdb.db.models.nodes.drug import Drug
 from nedrexdb.db.parsers import _get_file_location_factory
 
 get_file_location = _get_file_location_factory("unichem")
@@ -24,25 +23,20 @@ def validate_file(file) -> bool:
 
 def parse():
     fname = get_file_location("pubchem_drugbank_map")
-    updates = []
 
-    with gzip.open(fname, "rt") as f:
+    # the writer's backpressure keeps the parser from running ahead of MongoDB
+    with gzip.open(fname, "rt") as f, bulk_writer.writer(Drug.collection_name) as writer:
         reader = csv.reader(f, delimiter="\t")
         next(reader)  # Skip the header row
 
-        for db, pc in tqdm(reader, leave=False):
-            update = UpdateMany(
+        writer.write(
+            UpdateMany(
                 {"domainIds": f"drugbank.{db}"},
                 {
                     "$addToSet": {"domainIds": f"pubchem.{pc}", "dataSources": "unichem"},
                 },
                 upsert=False,
             )
-
-            updates.append(update)
-
-    coll = MongoInstance.DB["drug"]
-    # previously n:500
-    for chunk in tqdm(chunked(updates, 10000), leave=False):
-        coll.bulk_write(chunk)
-        time.sleep(0.1)
+            for db, pc in tqdm(reader, leave=False)
+        )
+    id_index.invalidate(Drug)
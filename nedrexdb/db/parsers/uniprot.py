@@ -1,19 +1,21 @@
 
 import gzip as _gzip
+import multiprocessing as _mp
 import re as _re
+import shutil as _shutil
+import subprocess as _subprocess
 import sys as _sys
 import itertools as _itertools
-from csv import (
-    DictReader as _DictReader,
-    field_size_limit as _field_size_limit,
-)
+from contextlib import contextmanager as _contextmanager
+from csv import field_size_limit as _field_size_limit
 
-from Bio import SeqIO as _SeqIO, SeqRecord as _SeqRecord
+from Bio import SeqRecord as _SeqRecord
 from more_itertools import chunked as _chunked
 from pymongo import UpdateOne
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb import config as _config
+from nedrexdb.db import bulk_load, bulk_writer, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.gene import Gene
 from nedrexdb.db.models.nodes.protein import Protein
@@ -26,6 +28,80 @@ get_file_location = _get_file_location_factory("uniprot")
 
 _field_size_limit(_sys.maxsize)
 
+# records are sent to the workers in blocks of roughly this many characters
+_BLOCK_SIZE = 4 * 1024 * 1024
+_RECORD_END = "\n//\n"
+
+
+class FlatFileRecord:
+    """The parts of a UniProt flat-file entry that UniProtRecord uses.
+
+    Mirrors the attributes of the SeqRecord that Bio.SeqIO's "swiss" parser
+    returns (id, name, description, seq and the used annotations), but only
+    reads the ID, AC, DE, GN, OX, CC and sequence lines.
+    """
+
+    def __init__(self, lines, reviewed):
+        accessions = []
+        description = []
+        gene_names = []
+        taxids = []
+        comments = []
+        sequence = []
+
+        for line in lines:
+            key = line[:2]
+            if key == "  ":
+                sequence.append(line[5:].replace(" ", ""))
+                continue
+
+            value = line[5:].rstrip()
+            if key == "ID":
+                self.name = value.split()[0]
+            elif key == "AC":
+                accessions.extend(value.rstrip(";").split("; "))
+            elif key == "DE":
+                description.append(value.strip())
+            elif key == "GN":
+                if value == "and":
+                    gene_names.append("")
+                else:
+                    if not gene_names:
+                        gene_names.append("")
+                    gene_names[-1] += value + " "
+            elif key == "OX":
+                # evidence codes are ignored, as in Bio.SwissProt
+                value = value.split("{")[0].rstrip().rstrip(";")
+                if not taxids:
+                    value = value.split("=", 1)[1]
+                taxids.extend(value.split(", "))
+            elif key == "CC":
+                topic, text = line[5:8], line[9:].rstrip()
+                if topic == "-!-" or (topic == "   " and not comments):
+                    comments.append(text)
+                elif topic == "   ":
+                    comments[-1] += " " + text
+
+        self.id = accessions[0]
+        self.description = " ".join(description)
+        self.seq = "".join(sequence)
+        self.annotations = {"ncbi_taxid": taxids, "reviewed": str(reviewed)}
+        if gene_names:
+            self.annotations["gene_name"] = [self._parse_gene_name(text) for text in gene_names]
+        if comments:
+            self.annotations["comment"] = "\n".join(comments)
+
+    @staticmethod
+    def _parse_gene_name(text):
+        gene_name = {}
+        for token in text.rstrip("; ").split("; "):
+            if "=" not in token:
+                continue
+            # the value may include an equals sign, e.g. Name=Lacc1=POX4 {ECO:0000313|EMBL:KDQ27217.1}
+            key, value = token.strip().split("=", 1)
+            gene_name[key] = value if key == "Name" else value.split(", ")
+        return gene_name
+
 
 class UniProtRecord:
     _CURLY_REGEX = _re.compile(r"{|}")
@@ -138,7 +214,7 @@ class IDMapRow:
         return f"uniprot.{self._row['UniProtKB-AC']}"
 
     def get_target_domain_ids(self) -> list[str]:
-        genes = [f"entrez.{acc}" for acc in self._row["GeneID (EntrezGene)"].split(";") if acc.strip()]
+        genes = [f"entrez.{acc.strip()}" for acc in self._row["GeneID (EntrezGene)"].split(";") if acc.strip()]
         return genes
 
     def parse(self):
@@ -151,98 +227,162 @@ class IDMapRow:
             pebg.targetDomainId = gene
             yield pebg
 
-# apparently SeqIO.parse does not parse (UN)REVIEWED in the ID line... therefore manually added here
-def _iter_gzipped_swiss(fname, reviewed):
-    with _gzip.open(fname, "rt") as f:
-        for record in _SeqIO.parse(f, "swiss"):
-            record.annotations["reviewed"] = str(reviewed)
-            yield record
+@_contextmanager
+def _open_gzipped_text(fname):
+    """Decompresses in a pigz process if available, otherwise with the gzip module."""
+    pigz = _shutil.which("pigz")
+    if not pigz:
+        with _gzip.open(fname, "rt") as f:
+            yield f
+        return
+
+    with _subprocess.Popen([pigz, "-dc", str(fname)], stdout=_subprocess.PIPE, text=True) as proc:
+        yield proc.stdout
+    if proc.returncode != 0:
+        raise _subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def iter_record_blocks(f, block_size=_BLOCK_SIZE):
+    """Splits a flat file into blocks of complete records (each ending with a // line)."""
+    rest = ""
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(_RECORD_END)
+        if end == -1:
+            rest = data
+            continue
+        end += len(_RECORD_END)
+        yield data[:end]
+        rest = data[end:]
+    if rest.strip():
+        yield rest
+
+
+def iter_flat_file_records(block, reviewed):
+    lines = []
+    for line in block.splitlines():
+        if line.startswith("//"):
+            yield FlatFileRecord(lines, reviewed)
+            lines = []
+        else:
+            lines.append(line)
 
 
-def parse_proteins():
-    logger.info("Parsing uniprot proteins")
-    filenames = [get_file_location("trembl"), get_file_location("swissprot")]
-    uniprot_records = _itertools.chain(*[_iter_gzipped_swiss(filenames[filenum], bool(filenum)) for filenum in (0, 1)])
-    updates = (UniProtRecord(record).parse().generate_update() for record in uniprot_records)
-
-    for chunk in _tqdm(
-        _chunked(updates, 1_000),
-        desc="Parsing Swiss-Prot and TrEMBL",
-        leave=False,
-    ):
-        MongoInstance.DB[Protein.collection_name].bulk_write(chunk)
+def _read_record_blocks(fname):
+    with _open_gzipped_text(fname) as f:
+        yield from iter_record_blocks(f)
 
 
-def parse_idmap():
-    logger.info("Parsing UniProt ID-Map")
-    fieldnames = (
-        "UniProtKB-AC",
-        "UniProtKB-ID",
-        "GeneID (EntrezGene)",
-        "RefSeq",
-        "GI",
-        "PDB",
-        "GO",
-        "UniRef100",
-        "UniRef90",
-        "UniRef50",
-        "UniParc",
-        "PIR",
-        "NCBI-taxon",
-        "MIM",
-        "UniGene",
-        "PubMed",
-        "EMBL",
-        "EMBL-CDS",
-        "Ensembl",
-        "Ensembl_TRS",
-        "Ensembl_PRO",
-        "Additional PubMed",
-    )
-    filename = get_file_location("idmapping")
+def _parse_block(args):
+    block, reviewed = args
+    return [UniProtRecord(record).parse().generate_update() for record in iter_flat_file_records(block, reviewed)]
+
 
-    comment_char = "#"
-    delimiter = "\t"
+def _iter_protein_updates(filenames, workers):
+    """Parses the records of (filename, reviewed) pairs into updates, across `workers` processes.
 
-    gene_ids = {doc["primaryDomainId"] for doc in Gene.find(MongoInstance.DB)}
-    protein_ids = {doc["primaryDomainId"] for doc in Protein.find(MongoInstance.DB)}
+    The parent only decompresses and splits the files into blocks of records.
+    """
+    blocks = ((block, reviewed) for fname, reviewed in filenames for block in _read_record_blocks(fname))
+    if workers <= 1:
+        for args in blocks:
+            yield from _parse_block(args)
+        return
 
-    # Pass one to get the relationships between NCBI genes and UniProt proteins
-    with _gzip.open(filename, "rt") as f:
-        filtered_f = filter(lambda row: row[0] != comment_char, f)
-        reader = _DictReader(filtered_f, delimiter=delimiter, fieldnames=fieldnames)
+    with _mp.get_context("fork").Pool(workers) as pool:
+        for updates in pool.imap(_parse_block, blocks):
+            yield from updates
 
-        def record_gen():
-            for row in reader:
-                for pebg in IDMapRow(row).parse():
-                    if pebg.sourceDomainId not in protein_ids:
-                        continue
-                    if pebg.targetDomainId not in gene_ids:
-                        continue
 
-                    yield pebg
+def parse_proteins():
+    logger.info("Parsing uniprot proteins")
+    # the reviewed flag is set by file (Swiss-Prot or TrEMBL), not taken from the ID line
+    filenames = [(get_file_location("trembl"), False), (get_file_location("swissprot"), True)]
+    workers = _config.get("db.uniprot_workers") or 1
+    updates = _iter_protein_updates(filenames, workers)
 
-        updates = (pebg.generate_update() for pebg in record_gen())
+    with bulk_load.loader(Protein.collection_name) as writer:
         for chunk in _tqdm(
             _chunked(updates, 1_000),
-            desc="Parsing UniProt ID map (NCBI relationships)",
+            desc="Parsing Swiss-Prot and TrEMBL",
             leave=False,
         ):
-            MongoInstance.DB[ProteinEncodedByGene.collection_name].bulk_write(chunk)
+            writer.write(chunk)
+    id_index.invalidate(Protein)
+
+
+_IDMAP_FIELDNAMES = (
+    "UniProtKB-AC",
+    "UniProtKB-ID",
+    "GeneID (EntrezGene)",
+    "RefSeq",
+    "GI",
+    "PDB",
+    "GO",
+    "UniRef100",
+    "UniRef90",
+    "UniRef50",
+    "UniParc",
+    "PIR",
+    "NCBI-taxon",
+    "MIM",
+    "UniGene",
+    "PubMed",
+    "EMBL",
+    "EMBL-CDS",
+    "Ensembl",
+    "Ensembl_TRS",
+    "Ensembl_PRO",
+    "Additional PubMed",
+)
 
-    # Pass two to add the ENSEMBL protein IDs
-    with _gzip.open(filename, "rt") as f:
-        filtered_f = filter(lambda row: row[0] != comment_char, f)
-        reader = _DictReader(filtered_f, delimiter=delimiter, fieldnames=fieldnames)
 
-        def update_gen():
-            for row in reader:
-                pdid = f"uniprot.{row['UniProtKB-AC']}"
-                ensembl_ids = [f"ensembl.{i.strip()}" for i in row["Ensembl_PRO"].split(";") if i.strip()]
-                for ensembl_id in ensembl_ids:
-                    yield UpdateOne({"primaryDomainId": pdid}, {"$addToSet": {"domainIds": ensembl_id}}, upsert=False)
+def iter_idmap_rows(f, columns):
+    """Yields dicts of only the given columns of the (tab-separated) ID mapping file."""
+    indices = [(col, _IDMAP_FIELDNAMES.index(col)) for col in columns]
+    maxsplit = max(idx for _, idx in indices) + 1
+    for line in f:
+        if not line.strip() or line.startswith("#"):
+            continue
+        values = line.rstrip("\n").split("\t", maxsplit)
+        yield {col: values[idx] if idx < len(values) else "" for col, idx in indices}
 
-        for chunk in _tqdm(
-            _chunked(update_gen(), 1_000), desc="Parsing UniProt ID map (ENSEMBL relationships)", leave=False
-        ):
-            MongoInstance.DB[Protein.collection_name].bulk_write(chunk)
+
+def ensembl_xref_update(row):
+    """Returns one update adding all Ensembl protein IDs of a row to the protein (None if there are none)."""
+    ensembl_ids = [f"ensembl.{i.strip()}" for i in row["Ensembl_PRO"].split(";") if i.strip()]
+    if not ensembl_ids:
+        return None
+    pdid = f"uniprot.{row['UniProtKB-AC']}"
+    return UpdateOne({"primaryDomainId": pdid}, {"$addToSet": {"domainIds": {"$each": ensembl_ids}}}, upsert=False)
+
+
+def parse_idmap():
+    logger.info("Parsing UniProt ID-Map")
+    filename = get_file_location("idmapping")
+
+    gene_ids = id_index.primary_ids(Gene)
+    protein_ids = id_index.primary_ids(Protein)
+
+    # A single pass for both the relationships between NCBI genes and UniProt proteins and the Ensembl protein IDs
+    with (
+        _gzip.open(filename, "rt") as f,
+        bulk_load.loader(ProteinEncodedByGene.collection_name) as pebg_writer,
+        bulk_writer.writer(Protein.collection_name) as xref_writer,
+    ):
+        rows = iter_idmap_rows(f, ("UniProtKB-AC", "GeneID (EntrezGene)", "Ensembl_PRO"))
+        for row in _tqdm(rows, desc="Parsing UniProt ID map", leave=False):
+            if f"uniprot.{row['UniProtKB-AC']}" not in protein_ids:
+                continue
+
+            pebg_writer.write(
+                pebg.generate_update() for pebg in IDMapRow(row).parse() if pebg.targetDomainId in gene_ids
+            )
+
+            update = ensembl_xref_update(row)
+            if update is not None:
+                xref_writer.write([update])
+    id_index.invalidate(Protein)
@@ -14,7 +14,7 @@ from more_itertools import chunked as _chunked
 from pymongo import UpdateOne
 from tqdm import tqdm as _tqdm
 
-from nedrexdb.db import MongoInstance
+from nedrexdb.db import MongoInstance, bulk_load, id_index
 from nedrexdb.db.parsers import _get_file_location_factory
 from nedrexdb.db.models.nodes.protein import Protein
 from nedrexdb.logger import logger
@@ -142,32 +142,37 @@ def parse():
     signature_coll.create_index("primaryDomainId")
 
     protein_has_sig_coll = MongoInstance.DB["protein_has_signature"]
-    protein_has_sig_coll.create_index("sourceDomainId")
-    protein_has_sig_coll.create_index("targetDomainId")
     protein_has_sig_coll.create_index([("sourceDomainId", 1), ("targetDomainId", 1)])
 
     records_iter = _chain(iter_records(get_file_location("swissprot")), iter_records(get_file_location("trembl")))
 
-    protein_ids = {doc["primaryDomainId"] for doc in Protein.find(MongoInstance.DB)}
+    protein_ids = id_index.primary_ids(Protein)
 
     parsed_records = 0
     missing_protein_ids = set()
-    for chunk in _tqdm(_chunked(records_iter, 1_000), desc="Parsing signatures from UniProt", leave=False):
-        signatures = []
-        relationships = []
-
-        records = [SwissRecordParser(data) for data in chunk]
-        for record in records:
-            parsed_records+=1
-            if record.id not in protein_ids:
-                missing_protein_ids.add(record.id)
-                continue
-            signatures += [sig.to_update() for sig in record.signatures]
-            relationships += [generate_protein_signature_update(record.id, sig.domain_id) for sig in record.signatures]
-        if len(signatures) > 0:
-            signature_coll.bulk_write(signatures)
-        if len(relationships) > 0:
-            protein_has_sig_coll.bulk_write(relationships)
+    with (
+        bulk_load.loader("signature") as signature_writer,
+        bulk_load.loader("protein_has_signature") as relationship_writer,
+    ):
+        for chunk in _tqdm(_chunked(records_iter, 1_000), desc="Parsing signatures from UniProt", leave=False):
+            signatures = []
+            relationships = []
+
+            records = [SwissRecordParser(data) for data in chunk]
+            for record in records:
+                parsed_records+=1
+                if record.id not in protein_ids:
+                    missing_protein_ids.add(record.id)
+                    continue
+                signatures += [sig.to_update() for sig in record.signatures]
+                relationships += [
+                    generate_protein_signature_update(record.id, sig.domain_id) for sig in record.signatures
+                ]
+            signature_writer.write(signatures)
+            relationship_writer.write(relationships)
+    # only needed for queries, so built once the collection is written
+    protein_has_sig_coll.create_index("sourceDomainId")
+    protein_has_sig_coll.create_index("targetDomainId")
     logger.info(f"Parsed {parsed_records} proteins, {len(missing_protein_ids)} were not parsed yet.")
     logger.debug(f"Missing protein IDs: {missing_protein_ids}")
 
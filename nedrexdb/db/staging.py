@@ -0,0 +1,119 @@
+"""Staging of parser output, merged into the shared collections after the parsers ran.
+
+Several parsers write the same collections (e.g., five sources write
+gene_associated_with_disorder). In staging mode (db.staging), the parser
+tasks no other task depends on write their operations to collections of
+their own instead, in the database <db.mongo_db>_staging (named
+"<task>.<collection>"), so they do not contend for the shared collections,
+and the result does not depend on the order the tasks finish in. Once all
+tasks are done, bulk_load.merge_staged writes the staged operations of each
+collection, task by task in the declared order, through a bulk loader.
+
+The writers of bulk_load and bulk_writer stage the operations of the task
+running in the process (see activate). A staged task has to write from a
+single process; writes not going through these writers are not staged. As
+its writes only reach the shared collections after all tasks ran, a task
+that reads back what it wrote is not stageable (see ParserTask).
+"""
+
+import os as _os
+from itertools import count as _count
+
+from pymongo import InsertOne as _InsertOne, UpdateMany as _UpdateMany, UpdateOne as _UpdateOne
+
+from nedrexdb.db import MongoInstance
+
+SUFFIX = "_staging"
+_OPERATIONS = {"InsertOne": _InsertOne, "UpdateOne": _UpdateOne, "UpdateMany": _UpdateMany}
+
+_TASK = None
+# (task, collection) -> sequence numbers of the staged operations
+_SEQUENCES = {}
+
+
+def activate(task_name):
+    """Stages the writes of this process as those of the task, until deactivate is called."""
+    global _TASK
+    _TASK = task_name
+
+
+def deactivate():
+    global _TASK
+    _TASK = None
+
+
+def current():
+    """Returns the name of the task whose writes are staged, if any."""
+    return _TASK
+
+
+def database():
+    return MongoInstance.CLIENT[f"{MongoInstance.DB.name}{SUFFIX}"]
+
+
+def collection(task_name, collection_name):
+    return database()[f"{task_name}.{collection_name}"]
+
+
+def staged_collections(task_name):
+    """Returns the collections the task staged operations for."""
+    prefix = f"{task_name}."
+    return {name[len(prefix):] for name in database().list_collection_names() if name.startswith(prefix)}
+
+
+def drop():
+    MongoInstance.CLIENT.drop_database(database().name)
+
+
+def encode(operation):
+    """Returns a write operation as a document."""
+    kind = type(operation).__name__
+    if kind not in _OPERATIONS:
+        raise ValueError(f"{kind} operations cannot be staged")
+    if kind == "InsertOne":
+        return {"op": kind, "doc": operation._doc}
+    doc = {"op": kind, "filter": operation._filter, "doc": operation._doc, "upsert": operation._upsert}
+    if operation._array_filters is not None:
+        doc["array_filters"] = operation._array_filters
+    return doc
+
+
+def decode(doc):
+    """Returns the write operation of a document returned by encode."""
+    operation = _OPERATIONS[doc["op"]]
+    if doc["op"] == "InsertOne":
+        return operation(doc["doc"])
+    return operation(doc["filter"], doc["doc"], upsert=doc["upsert"], array_filters=doc.get("array_filters"))
+
+
+def operations(task_name, collection_name, batch_size=10_000):
+    """Yields the operations staged by the task for the collection, in the order they were written."""
+    cursor = collection(task_name, collection_name).find(sort=[("_id", 1)], batch_size=batch_size)
+    for doc in cursor:
+        yield decode(doc)
+
+
+class StagingWriter:
+    """Stages the operations written for a collection, using `writer` (a BulkWriter of the staging collection)."""
+
+    def __init__(self, writer, task_name, collection_name):
+        self._writer = writer
+        key = (task_name, collection_name)
+        if key not in _SEQUENCES:
+            _SEQUENCES[key] = (_os.getpid(), _count())
+        pid, self._sequence = _SEQUENCES[key]
+        if pid != _os.getpid():
+            raise RuntimeError(f"task {task_name!r} stages {collection_name!r} from more than one process")
+
+    @property
+    def stats(self):
+        return self._writer.stats
+
+    def write(self, operations):
+        self._writer.write(_InsertOne({"_id": next(self._sequence), **encode(op)}) for op in operations)
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
@@ -4,6 +4,7 @@ import os
 import shutil as _shutil
 import re as _re
 import time
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
 from pymongo import MongoClient
 
 import requests
@@ -22,6 +23,7 @@ from nedrexdb.downloaders.ncg import download_ncg as _download_ncg
 from nedrexdb.downloaders.intogen import download_intogen as _download_intogen
 from nedrexdb.downloaders.orphanet import download_orphanet as _download_orphanet
 from nedrexdb.downloaders.opentargets import download_opentargets as _download_opentargets
+from nedrexdb.downloaders.manifest import DownloadManifest as _DownloadManifest
 from nedrexdb.exceptions import (
     ProcessError as _ProcessError,
 )
@@ -64,9 +66,79 @@ def update_version(name, source_url, unique_pattern, mode="date", skip_digits=0)
     logger.debug(f"{name}: date: {date}, version: {version}")
     return {"date": f"{date}", "version": version}
 
+def _download_bespoke(ignored_sources, no_download_meta):
+    # these download one after another: some of them change the working directory
+    for source, download in (
+        ("opentargets", _download_opentargets),
+        ("ncg", _download_ncg),
+        ("intogen", _download_intogen),
+        ("orphanet", _download_orphanet),
+        ("chembl", _download_chembl),
+        ("biogrid", _download_biogrid),
+    ):
+        if source in ignored_sources:
+            continue
+        if source not in no_download_meta:
+            download()
+        else:
+            logger.debug(f"{source} is already up-to-date")
+
+
+def _source_downloads(data, source_dir, exclude_keys):
+    username = data.get("username")
+    password = data.get("password")
+
+    downloads = []
+    for _, download in filter(lambda i: i[0] not in exclude_keys, data.items()):
+        url = download.get("url")
+        filename = download.get("filename")
+        if url is None:
+            continue
+        if filename is None:
+            filename = url.rsplit("/", 1)[1]
+
+        downloads.append(
+            Downloader(
+                url=url,
+                target=source_dir / filename,
+                username=username,
+                password=password,
+                connections=download.get("connections", 1),
+                checksum=download.get("checksum"),
+            )
+        )
+    return downloads
+
+
+def _download_source(source, downloads, manifest):
+    for d in downloads:
+        d.target.parent.mkdir(exist_ok=True)
+        validated = False
+        written = False
+        retries = 3
+        timeout = 30
+        while not validated and retries > 0:
+            if not d.download():
+                break
+            written = True
+            validated = validate_download(d.target, source)
+            if not validated:
+                logging.error(f"failed to verify download of {d.target.name} for {source}! "
+                              f"Retrying in {timeout} seconds.")
+                retries -= 1
+                time.sleep(timeout)
+        # a file that was not (re)written in this run stays out of the manifest, so it is retried next time
+        if not written:
+            logger.error(f"{d.target.name} of {source} was not downloaded")
+        elif validated:
+            if not manifest.record(d):
+                logger.debug(f"{d.target.name} of {source} has the same content as before")
+
+
 def download_all(force=False, ignored_sources=set(), no_download_meta={}):
     base = _Path(_config["db.root_directory"])
-    download_dir = base / _config["sources.directory"]
+    # absolute, as the bespoke downloaders change the working directory while the others run
+    download_dir = (base / _config["sources.directory"]).resolve()
 
     if force and (download_dir).exists():
         _shutil.rmtree(download_dir)
@@ -79,94 +151,50 @@ def download_all(force=False, ignored_sources=set(), no_download_meta={}):
     exclude_keys.update(ignored_sources)
 
     logger.debug(f"ignore sources for download: {ignored_sources}")
-    
-    if "opentargets" not in ignored_sources:
-        if "opentargets" not in no_download_meta:
-            _download_opentargets()
-        else:
-            logger.debug("opentargets is already up-to-date")
-    if "ncg" not in ignored_sources:
-        if "ncg" not in no_download_meta:
-            _download_ncg()
-        else:
-            logger.debug("ncg is already up-to-date")
-    if "intogen" not in ignored_sources:
-        if "intogen" not in no_download_meta:
-            _download_intogen()
-        else:
-            logger.debug("intogen is already up-to-date")
-    if "orphanet" not in ignored_sources:
-        if "orphanet" not in no_download_meta:
-            _download_orphanet()
-        else:
-            logger.debug("orphanet is already up-to-date")
-    if "chembl" not in ignored_sources:
-        if "chembl" not in no_download_meta:
-            _download_chembl()
-        else:
-            logger.debug("chembl is already up-to-date")
-    if "biogrid" not in ignored_sources:
-        if "biogrid" not in no_download_meta:
-            _download_biogrid()
-        else:
-            logger.debug("biogrid is already up-to-date")
 
-    for source in filter(lambda i: i not in exclude_keys, sources):
-
-        # Catch case to skip sources with bespoke downloaders entirely.
-        if source in {
-            "biogrid",
-            "chembl",
-            "ncg",
-            "opentargets",
-            "cosmic",
-            "intogen",
-            "hippie",
-            "sider"
-        }:
-            continue
-
-        # Catch case to skip sources with bespoke downloaders after setting metadata.
-        if source in {
-            "drugbank",
-            "disgenet",
-        }:
-            continue
-
-        # only download if necessary (by checking previous metadata)
-        if source not in no_download_meta:
-            (download_dir / source).mkdir(exist_ok=True)
-
-            data = sources[source]
-            username = data.get("username")
-            password = data.get("password")
-
-            for _, download in filter(lambda i: i[0] not in exclude_keys, data.items()):
-                url = download.get("url")
-                filename = download.get("filename")
-                if url is None:
-                    continue
-                if filename is None:
-                    filename = url.rsplit("/", 1)[1]
-
-                d = Downloader(
-                    url=url,
-                    target=download_dir / source / filename,
-                    username=username,
-                    password=password,
-                )
-                validated = False
-                retries = 3
-                timeout = 30
-                while not validated and retries > 0:
-                    d.download()
-                    validated = validate_download(download_dir / source / filename, source)
-                    if not validated:
-                        logging.error(f"failed to verify download of {filename} for {source}! Retrying in {timeout} seconds.")
-                        retries -= 1
-                        time.sleep(timeout)
-        else:
-            logger.debug(f"{source} is already up-to-date")
+    workers = _config.get("db.download_workers") or 1
+    manifest = _DownloadManifest(download_dir / "manifest.json")
+    with _ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as pool:
+        futures = [pool.submit(_download_bespoke, ignored_sources, no_download_meta)]
+        downloads = {}
+
+        for source in filter(lambda i: i not in exclude_keys, sources):
+
+            # Catch case to skip sources with bespoke downloaders entirely.
+            if source in {
+                "biogrid",
+                "chembl",
+                "ncg",
+                "opentargets",
+                "cosmic",
+                "intogen",
+                "hippie",
+                "sider"
+            }:
+                continue
+
+            # Catch case to skip sources with bespoke downloaders after setting metadata.
+            if source in {
+                "drugbank",
+                "disgenet",
+            }:
+                continue
+
+            # only download if necessary (by checking previous metadata)
+            if source not in no_download_meta:
+                downloads[source] = _source_downloads(sources[source], download_dir / source, exclude_keys)
+            else:
+                logger.debug(f"{source} is already up-to-date")
+
+        # files the servers report unchanged since the last download are skipped
+        unchanged = manifest.check([d for ds in downloads.values() for d in ds], workers=max(workers, 8))
+        for d in unchanged:
+            logger.debug(f"{d.target.name} is unchanged since the last download")
+        for source, ds in downloads.items():
+            futures.append(pool.submit(_download_source, source, [d for d in ds if d not in unchanged], manifest))
+
+        for future in futures:
+            future.result()
 
 def validate_download(file, source):
     if source == "unichem":
@@ -278,7 +306,7 @@ def get_versions(no_download):
 
     version = "live"
 
-    mongo_port = 27017
+    mongo_port = mconfig["db"][version.lower()].get("mongo_port_internal", 27017)
     mongo_host = mconfig["db"][version.lower()]["mongo_name"]
     db_name = mconfig["db"]["mongo_db"]
 
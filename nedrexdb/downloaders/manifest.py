@@ -0,0 +1,112 @@
+"""A record of the files downloaded, to skip the files that did not change since.
+
+For each URL, the manifest (<sources.directory>/manifest.json) keeps the ETag,
+Last-Modified date and Content-Length the server reported, and the size,
+modification time and SHA-256 hash of the downloaded file. Before downloading,
+the servers are asked (in parallel) whether the files changed: with a HEAD
+request compared against the manifest, or, if HEAD is not supported, with a
+conditional GET (If-None-Match / If-Modified-Since). A file is skipped if the
+server reports the same version and the local file was not touched since, so
+sources without a version string are not downloaded again every day.
+"""
+
+import json as _json
+import os as _os
+import threading as _threading
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+
+import requests as _requests  # type: ignore
+
+from nedrexdb.common import file_digest as _file_digest
+from nedrexdb.logger import logger
+
+_TIMEOUT = 30
+_HEADERS = {"etag": "ETag", "last_modified": "Last-Modified", "content_length": "Content-Length"}
+
+
+def _remote(response):
+    return {key: response.headers.get(header) for key, header in _HEADERS.items()}
+
+
+class DownloadManifest:
+    def __init__(self, path):
+        self._path = path
+        self._lock = _threading.Lock()
+        try:
+            self._entries = _json.loads(path.read_text())
+        except (OSError, ValueError):
+            self._entries = {}
+        # what the servers reported in `check`, recorded with the downloaded files
+        self._remote = {}
+
+    def _local_unchanged(self, entry, target):
+        try:
+            stat = target.stat()
+        except OSError:
+            return False
+        return stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get("mtime_ns")
+
+    def _query(self, downloader):
+        """Returns whether the server still has the version of the file in the manifest."""
+        entry = self._entries.get(downloader.url)
+        if downloader.url.startswith("ftp://"):
+            return False
+        auth = downloader.auth()
+        try:
+            response = _requests.head(downloader.url, auth=auth, allow_redirects=True, timeout=_TIMEOUT)
+            if response.status_code >= 400:
+                headers = {}
+                if entry and entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry and entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+                # the body is not read: the response is closed right away
+                with _requests.get(
+                    downloader.url, auth=auth, headers=headers, stream=True, timeout=_TIMEOUT
+                ) as response:
+                    self._remote[downloader.url] = _remote(response)
+                    return response.status_code == 304
+        except _requests.RequestException as e:
+            logger.debug(f"could not check {downloader.url}: {e}")
+            return False
+
+        remote = self._remote[downloader.url] = _remote(response)
+        if entry is None or not (remote["etag"] or remote["last_modified"]):
+            return False
+        return all(entry.get(key) == value for key, value in remote.items())
+
+    def unchanged(self, downloader):
+        entry = self._entries.get(downloader.url)
+        if not self._query(downloader) or entry is None:
+            return False
+        return self._local_unchanged(entry, downloader.target)
+
+    def check(self, downloaders, workers=8):
+        """Returns the downloaders whose files are unchanged, asking the servers in parallel."""
+        downloaders = list(downloaders)
+        if not downloaders:
+            return []
+        with _ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest") as pool:
+            results = list(pool.map(self.unchanged, downloaders))
+        return [d for d, unchanged in zip(downloaders, results) if unchanged]
+
+    def record(self, downloader):
+        """Records a downloaded file; returns whether its content differs from the previous download."""
+        stat = downloader.target.stat()
+        sha256 = _file_digest(downloader.target)
+        with self._lock:
+            previous = self._entries.get(downloader.url, {})
+            self._entries[downloader.url] = {
+                **self._remote.get(downloader.url, {}),
+                "file": str(downloader.target),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+            }
+            self._save()
+        return previous.get("sha256") != sha256
+
+    def _save(self):
+        tmp = self._path.with_name(f"{self._path.name}.tmp")
+        tmp.write_text(_json.dumps(self._entries, indent=2, sort_keys=True))
+        _os.replace(tmp, self._path)
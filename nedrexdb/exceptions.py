@@ -16,3 +16,7 @@ class MongoDBError(NeDRexError):
 
 class ProcessError(NeDRexError):
     pass
+
+
+class DownloadError(NeDRexError):
+    pass
@@ -0,0 +1,76 @@
+from nedrexdb.control.scheduler import ParserTask
+from nedrexdb.db.build_cache import BuildCache
+
+
+def _noop():
+    pass
+
+
+def test_build_cache_reuses_unchanged_collections(tmp_path):
+    for source in ("ncbi", "disgenet", "go", "hpo"):
+        (tmp_path / source).mkdir()
+        (tmp_path / source / "data.tsv").write_text(source)
+    tasks = [
+        ParserTask("ncbi", _noop, ("ncbi",)),
+        ParserTask("disgenet", _noop, ("disgenet",), ("ncbi",)),
+        ParserTask("go", _noop, ("go",)),
+        ParserTask("hpo", _noop, ("hpo",), ("go",)),
+    ]
+    writes = {
+        "ncbi": {"gene"},
+        "disgenet": {"gene_associated_with_disorder", "gene"},
+        "go": {"go"},
+        "hpo": {"phenotype", "metadata"},
+    }
+
+    first = BuildCache(download_dir=tmp_path)
+    assert first.skip(tasks) == tasks
+    first.record(writes)
+    assert first.entries["hpo"]["collections"] == ["phenotype"]
+
+    # unchanged inputs: everything is restored
+    cache = BuildCache(first.entries, download_dir=tmp_path)
+    assert cache.plan(tasks) == ({"ncbi", "disgenet", "go", "hpo"}, {"gene", "gene_associated_with_disorder", "go",
+                                                                     "phenotype"})
+
+    # disgenet changed, and shares the gene collection with ncbi; go changed, and hpo requires it
+    (tmp_path / "disgenet" / "data.tsv").write_text("new")
+    (tmp_path / "go" / "data.tsv").write_text("new")
+    cache = BuildCache(first.entries, download_dir=tmp_path)
+    assert cache.plan(tasks) == (set(), set())
+
+    (tmp_path / "go" / "data.tsv").write_text("go")
+    cache = BuildCache(first.entries, download_dir=tmp_path)
+    run = cache.skip(tasks)
+    assert cache.restored == {"go", "phenotype"}
+    assert [task.func is _noop for task in run] == [True, True, False, False]
+    cache.record({"ncbi": {"gene"}, "disgenet": {"gene"}, "go": set(), "hpo": set()})
+    assert cache.entries["hpo"] == first.entries["hpo"]
+    assert cache.entries["disgenet"]["key"] != first.entries["disgenet"]["key"]
+
+
+def test_wrapper_task_keys_follow_the_wrapped_modules(tmp_path, monkeypatch):
+    import os
+    import types
+    from nedrexdb.db import build_cache
+
+    package = tmp_path / "nedrexdb"
+    (package / "db" / "parsers").mkdir(parents=True)
+    for name in ("__init__.py", "common.py", "db/__init__.py", "db/parsers/__init__.py", "db/helper.py"):
+        (package / name).write_text("")
+    (package / "db" / "parsers" / "example.py").write_text("from nedrexdb.db import helper\n")
+    monkeypatch.setattr(build_cache, "_PACKAGE_DIRECTORY", package)
+    # a wrapper like those in build.py, calling a parser module
+    monkeypatch.setitem(_wrapper.__globals__, "example", types.ModuleType("nedrexdb.db.parsers.example"))
+
+    tasks = [ParserTask("example", _wrapper, ())]
+    keys = [BuildCache(download_dir=tmp_path).task_keys(tasks)["example"]]
+    for path in (package / "db" / "parsers" / "example.py", package / "db" / "helper.py"):
+        path.write_text(path.read_text() + "# changed\n")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        keys.append(BuildCache(download_dir=tmp_path).task_keys(tasks)["example"])
+    assert len(set(keys)) == 3
+
+
+def _wrapper():
+    example.parse()  # noqa: F821
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from nedrexdb.db.bulk_load import BulkLoader
+from nedrexdb.db.models.edges.drug_has_side_effect import DrugHasSideEffect
+
+
+class _FakeCollection:
+    name = "drug_has_side_effect"
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.inserted = []
+        self.written = []
+
+    def estimated_document_count(self):
+        return 0
+
+    def index_information(self):
+        return {"edge": {"key": [("sourceDomainId", 1), ("targetDomainId", 1)], "unique": True}}
+
+    def bulk_write(self, operations, ordered=True):
+        inserts = [op._doc for op in operations if isinstance(op, InsertOne)]
+        self.written += [op for op in operations if not isinstance(op, InsertOne)]
+        errors = [
+            {"index": i, "code": 11000}
+            for i, doc in enumerate(inserts)
+            if (doc["sourceDomainId"], doc["targetDomainId"]) in self.existing
+        ]
+        self.inserted += [doc for i, doc in enumerate(inserts) if i not in {e["index"] for e in errors}]
+        result = {"nInserted": len(inserts) - len(errors), "nUpserted": 0, "nMatched": 0, "nModified": 0}
+        if errors:
+            raise BulkWriteError({**result, "writeErrors": errors})
+        return SimpleNamespace(bulk_api_result={**result, "writeErrors": []})
+
+
+def test_bulk_loader_merges_upserts():
+    coll = _FakeCollection(existing=[("drugbank.DB2", "meddra.1")])
+    loader = BulkLoader(coll)
+    loader.write(
+        [
+            DrugHasSideEffect(sourceDomainId="drugbank.DB1", targetDomainId="meddra.1", maximum_frequency=0.1,
+                              minimum_frequency=0.1, dataSources=["sider"]).generate_update(),
+            DrugHasSideEffect(sourceDomainId="drugbank.DB1", targetDomainId="meddra.1", maximum_frequency=0.3,
+                              minimum_frequency=0.2, dataSources=["sider", "other"]).generate_update(),
+            DrugHasSideEffect(sourceDomainId="drugbank.DB2", targetDomainId="meddra.1",
+                              dataSources=["sider"]).generate_update(),
+            UpdateOne({"sourceDomainId": "drugbank.DB1"}, {"$set": {"checked": True}}),
+        ]
+    )
+    loader.close()
+
+    (doc,) = coll.inserted
+    assert doc["dataSources"] == ["sider", "other"]
+    assert (doc["maximum_frequency"], doc["minimum_frequency"]) == (0.3, 0.1)
+    assert doc["type"] == "DrugHasSideEffect" and "created" in doc
+
+    # the existing document gets a merged upsert, the update without upsert is passed through last
+    upsert, passthrough = coll.written
+    assert upsert._filter == {"sourceDomainId": "drugbank.DB2", "targetDomainId": "meddra.1"}
+    assert upsert._upsert and upsert._doc["$addToSet"] == {"dataSources": {"$each": ["sider"]}}
+    assert passthrough._doc == {"$set": {"checked": True}}
+
+
+def test_load_indexes_cover_upsert_filters():
+    from nedrexdb.db import _MODELS
+
+    for model in _MODELS:
+        if not hasattr(model, "generate_update"):
+            continue
+        fields = set(model().generate_update()._filter)
+        load_keys = [[key for key, _ in index.document["key"].items()] for index in model.load_indexes()]
+        # the upserts are looked up by an index built before the parsers run
+        assert any(keys[0] in fields and set(keys) <= fields for keys in load_keys), model
+
+
+def test_bulk_writer_batches_and_counts():
+    import pytest
+    from nedrexdb.db.bulk_writer import BulkWriter
+
+    class Collection:
+        name = "example"
+
+        def __init__(self):
+            self.batches = []
+
+        def bulk_write(self, operations, ordered=True):
+            assert not ordered
+            self.batches.append(len(operations))
+            if any(op._doc["n"] == 19 for op in operations):
+                raise BulkWriteError({"nInserted": len(operations) - 1, "writeErrors": [{"index": 0, "code": 1}]})
+            return SimpleNamespace(bulk_api_result={"nInserted": len(operations), "writeErrors": []})
+
+    coll = Collection()
+    writer = BulkWriter(coll, batch_bytes=100, workers=2, max_in_flight=1)
+    writer.write(InsertOne({"n": i}) for i in range(20))
+    with pytest.raises(BulkWriteError):
+        writer.close()
+    # each document is 12 bytes, so batches of 9 documents are sent
+    assert sorted(coll.batches) == [2, 9, 9]
+    assert (writer.stats.inserted, writer.stats.errors) == (19, 1)
+
+
+def test_staged_operations_round_trip():
+    from pymongo import UpdateMany
+    from nedrexdb.db import staging
+
+    update = DrugHasSideEffect(sourceDomainId="drugbank.DB1", targetDomainId="meddra.1", maximum_frequency=0.1,
+                               dataSources=["sider"]).generate_update()
+    for op in (update, InsertOne({"a": 1}), UpdateMany({"a": 1}, {"$set": {"b": 2}})):
+        decoded = staging.decode(staging.encode(op))
+        assert type(decoded) is type(op) and decoded == op
@@ -1,7 +1,9 @@
 import pytest
 import numpy as np
 import pandas as pd
-from nedrexdb.db.mongo_to_neo import flatten, determine_series_type
+import io
+
+from nedrexdb.db.mongo_to_neo import flatten, determine_series_type, infer_column_types, csv_columns, write_csv
 
 def test_flatten():
     nested = {
@@ -49,3 +51,379 @@ def test_determine_series_type_empty():
     # If all items are skipped, s (set) will be empty.
     # Actually if s is empty, it returns False because len(s) != 1.
     assert determine_series_type(s) == False
+
+def test_infer_column_types():
+    docs = [
+        {"_id": 1, "primaryDomainId": "a", "synonyms": ["x", "y"], "mixed": 1, "meta": {"n": 2}},
+        {"_id": 2, "primaryDomainId": "b", "synonyms": [], "mixed": "one", "score": 0.5},
+    ]
+    types = infer_column_types(docs, excluded_keys=("_id",))
+    assert types == {
+        "primaryDomainId": "string",
+        "synonyms": "string[]",
+        "mixed": "string",
+        "meta.n": "int",
+        "score": "double",
+    }
+
+
+def test_streamed_edge_csv():
+    docs = [
+        {"sourceDomainId": "drugbank.DB1", "targetDomainId": "mondo.1", "type": "DrugHasIndication",
+         "dataSources": ["ctd", "drugcentral"]},
+        {"sourceDomainId": "drugbank.DB2", "targetDomainId": "mondo.2", "type": "DrugHasIndication"},
+    ]
+    columns = csv_columns(infer_column_types(docs), kind="edge")
+    f = io.StringIO()
+    write_csv(docs, columns, f, chunk_size=1)
+    assert f.getvalue().splitlines() == [
+        "sourceDomainId:START_ID,targetDomainId:END_ID,dataSources:string[],type:string,:TYPE",
+        "drugbank.DB1,mondo.1,ctd|drugcentral,DrugHasIndication,DrugHasIndication",
+        "drugbank.DB2,mondo.2,,DrugHasIndication,DrugHasIndication",
+    ]
+
+
+def test_methods_score():
+    from nedrexdb.db.models.edges.protein_interacts_with_protein import methods_score
+
+    method_scores = {"two hybrid": 0.5, "affinity chromatography": 0.25}
+    # duplicates across sources are only counted once, unknown methods score 0
+    assert methods_score(["two hybrid", "two hybrid", "unknown"], method_scores) == 0.5
+    assert methods_score(["two hybrid", "affinity chromatography"], method_scores) == 0.75
+    assert methods_score([], method_scores) == 0.0
+
+
+class _FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection, batch_size=None):
+        include = {k for k, v in projection.items() if v}
+        for doc in self.docs:
+            if include:
+                yield {k: v for k, v in doc.items() if k in include}
+            else:
+                yield {k: v for k, v in doc.items() if k not in projection}
+
+
+def test_export_collection_split_gzip(tmp_path):
+    import gzip
+    from nedrexdb.db.mongo_to_neo import export_collection
+
+    docs = [
+        {"_id": i, "primaryDomainId": f"uniprot.P{i}", "type": "Protein", "taxid": 9606, "created": None}
+        for i in range(5)
+    ]
+    # no export schema for this collection, so the types are inferred
+    files = export_collection({"example": _FakeCollection(docs)}, "example", tmp_path, "node", rows_per_file=2)
+    assert files == [
+        "example.header.csv.gz",
+        "example.part000.csv.gz",
+        "example.part001.csv.gz",
+        "example.part002.csv.gz",
+    ]
+
+    def read(name):
+        with gzip.open(tmp_path / name, "rt") as f:
+            return f.read().splitlines()
+
+    assert read(files[0]) == ["primaryDomainId:ID,taxid:int,type:string,:LABEL"]
+    assert read(files[1]) == ["uniprot.P0,9606,Protein,Protein", "uniprot.P1,9606,Protein,Protein"]
+    assert read(files[3]) == ["uniprot.P4,9606,Protein,Protein"]
+
+
+def test_schema_export_coerces_values():
+    from nedrexdb.db.export_schema import get_column_types
+
+    column_types = get_column_types("gene_associated_with_disorder")
+    assert column_types["omimMappingCode"] == "int"
+    assert column_types["omimFlags"] == "string[]"
+    assert column_types["scoreOpenTargets"] == "double"
+
+    columns = [
+        column
+        for column in csv_columns(column_types, kind="edge")
+        if column[0] in ("sourceDomainId", "targetDomainId", "omimMappingCode", "omimFlags", "score")
+    ]
+    docs = [
+        {"sourceDomainId": "entrez.1", "targetDomainId": "mondo.1", "omimMappingCode": "3", "omimFlags": "?",
+         "score": 1},
+        {"sourceDomainId": "entrez.2", "targetDomainId": "mondo.2", "omimMappingCode": "n/a", "omimFlags": ["{", "?"]},
+    ]
+    f = io.StringIO()
+    write_csv(docs, columns, f)
+    assert f.getvalue().splitlines() == [
+        "sourceDomainId:START_ID,targetDomainId:END_ID,omimMappingCode:int,omimFlags:string[],score:double",
+        "entrez.1,mondo.1,3,?,1.0",
+        "entrez.2,mondo.2,,{|?,",
+    ]
+
+
+_UNIPROT_ENTRIES = """\
+ID   TEST1_HUMAN             Reviewed;          20 AA.
+AC   P12345; Q99999;
+DE   RecName: Full=Test protein 1 {ECO:0000305};
+DE            Short=TP1;
+DE   Contains:
+DE     RecName: Full=Chain A;
+GN   Name=TST1 {ECO:0000312|HGNC:1}; Synonyms=TP, TEST;
+GN   and
+GN   Name=TST2;
+OS   Homo sapiens (Human).
+OX   NCBI_TaxID=9606 {ECO:0000313|EMBL:AEX14553.1};
+CC   -!- FUNCTION: Does things and
+CC       other things.
+CC   ---------------------------------------------------------------------------
+SQ   SEQUENCE   20 AA;  2000 MW;  ABCDEF0123456789 CRC64;
+     MKTAYIAKQR QISFVKSHFS
+//
+ID   TEST2_HUMAN             Unreviewed;          12 AA.
+AC   A0A000;
+DE   SubName: Full=Uncharacterized protein {ECO:0000313|EMBL:X};
+OS   Homo sapiens (Human).
+OX   NCBI_TaxID=9606;
+SQ   SEQUENCE   12 AA;  1200 MW;  0123456789ABCDEF CRC64;
+     MKTAYIAKQR QI
+//
+"""
+
+
+def test_flat_file_records_match_biopython():
+    from Bio import SeqIO
+    from nedrexdb.db.parsers.uniprot import UniProtRecord, iter_flat_file_records, iter_record_blocks
+
+    expected = []
+    for record in SeqIO.parse(io.StringIO(_UNIPROT_ENTRIES), "swiss"):
+        record.annotations["reviewed"] = "True"
+        expected.append(UniProtRecord(record).parse().model_dump())
+
+    # a small block size splits the file between the records
+    blocks = list(iter_record_blocks(io.StringIO(_UNIPROT_ENTRIES), block_size=64))
+    records = [record for block in blocks for record in iter_flat_file_records(block, True)]
+    assert [UniProtRecord(record).parse().model_dump() for record in records] == expected
+
+
+def test_idmap_single_pass_row():
+    from nedrexdb.db.parsers.uniprot import IDMapRow, ensembl_xref_update, iter_idmap_rows
+
+    columns = [""] * 22
+    columns[0], columns[2], columns[20] = "P12345", "1; 2", "ENSP01; ENSP02"
+    f = io.StringIO("\t".join(columns) + "\n")
+    (row,) = iter_idmap_rows(f, ("UniProtKB-AC", "GeneID (EntrezGene)", "Ensembl_PRO"))
+
+    assert [pebg.targetDomainId for pebg in IDMapRow(row).parse()] == ["entrez.1", "entrez.2"]
+    update = ensembl_xref_update(row)
+    assert update._filter == {"primaryDomainId": "uniprot.P12345"}
+    assert update._doc == {"$addToSet": {"domainIds": {"$each": ["ensembl.ENSP01", "ensembl.ENSP02"]}}}
+
+
+def test_export_collection_from_columnar(tmp_path, monkeypatch):
+    import gzip
+    import nedrexdb
+    from nedrexdb.db import columnar
+    from nedrexdb.db.mongo_to_neo import export_collection
+
+    monkeypatch.setattr(nedrexdb.config, "data", {"db": {"root_directory": str(tmp_path), "columnar": True}})
+    docs = [{"primaryDomainId": f"uniprot.P{i}", "type": "Protein", "taxid": 9606} for i in range(3)]
+    docs[2]["comments"] = ["late field"]
+    columnar.write_collection({"example": _FakeCollection(docs)}, "example", batch_rows=2)
+    assert len(columnar.parts("example")) == 2
+    assert list(columnar.read("example", ["comments", "missing"])) == [{}, {}, {"comments": ["late field"]}]
+    assert columnar.attribute_counts("example") == (3, {"primaryDomainId": 3, "type": 3, "taxid": 3, "comments": 1})
+
+    # MongoDB is not read at all
+    files = export_collection({}, "example", tmp_path, "node")
+    with gzip.open(tmp_path / files[1], "rt") as f:
+        rows = f.read().splitlines()
+    assert rows[2] == "uniprot.P2,9606,late field,Protein,Protein"
+
+
+def test_clinvar_vcf_regions_from_tabix_index(tmp_path, monkeypatch):
+    import gzip
+    import struct
+    from nedrexdb.db.parsers import clinvar
+
+    records = [
+        ("1", 100, "GENEINFO=A:1;CLNVC=single_nucleotide_variant;ORIGIN_RS=9;RS=5"),
+        ("1", 20_000, "CLNVC=deletion"),
+        ("1", 40_000, "CLNVC=deletion;GENEINFO=B:2|C:3"),
+        ("2", 10, "CLNVC=insertion"),
+    ]
+    # one gzip member (BGZF block) per record, so every record starts at a virtual offset (block << 16)
+    vcf = tmp_path / "clinvar.vcf.gz"
+    offsets = []
+    with open(vcf, "wb") as f:
+        f.write(gzip.compress(b"##fileformat=VCFv4.1\n"))
+        for idx, (chrom, pos, info) in enumerate(records):
+            offsets.append(f.tell() << 16)
+            f.write(gzip.compress(f"{chrom}\t{pos}\t{idx}\tA\tG\t.\t.\t{info}\n".encode()))
+
+    def reference(first, linear):
+        return struct.pack("<iIi2Qi", 1, 4681, 1, offsets[first], offsets[-1], len(linear)) + struct.pack(
+            f"<{len(linear)}Q", *linear
+        )
+
+    index = struct.pack("<4s8i", b"TBI\1", 2, 2, 1, 2, 0, ord("#"), 0, 4) + b"1\x002\x00"
+    index += reference(0, [offsets[0], offsets[1], offsets[2]]) + reference(3, [offsets[3]])
+    (tmp_path / "clinvar.vcf.gz.tbi").write_bytes(gzip.compress(index))
+
+    monkeypatch.setattr(clinvar, "_REGION_WINDOWS", 2)
+    parser = clinvar.ClinVarVCFParser(str(vcf))
+    regions = parser.regions()
+    assert [region[::2] for region in regions] == [("1", None), ("1", 32769), ("2", None)]
+    rows = [row for region in regions for row in parser.iter_rows(region)]
+    assert [row.identifier for row in rows] == [row.identifier for row in parser.iter_rows()]
+    assert [row.identifier for row in rows] == ["clinvar.0", "clinvar.1", "clinvar.2", "clinvar.3"]
+
+    assert rows[0].get_rs() == ["dbsnp.5"] and rows[0].variant_type == "Single Nucleotide Variant"
+    assert rows[2].associated_genes == ["entrez.2", "entrez.3"] and rows[1].info("RS") is None
+
+
+def test_clinvar_xml_chunks_parse_known_variants():
+    import io
+    from nedrexdb.db.parsers import clinvar
+
+    def archive(variation_id, accession, xref):
+        return (
+            f'<VariationArchive VariationID="{variation_id}" VariationType="single nucleotide variant">'
+            "<ClassifiedRecord><ClinicalAssertionList><ClinicalAssertion>"
+            f'<ClinVarAccession Accession="{accession}" Type="SCV"/>'
+            "<Classification><ReviewStatus>criteria provided</ReviewStatus>"
+            "<GermlineClassification>Pathogenic</GermlineClassification></Classification>"
+            f'<TraitSet Type="Disease"><Trait Type="Disease">{xref}</Trait></TraitSet>'
+            "</ClinicalAssertion></ClinicalAssertionList></ClassifiedRecord></VariationArchive>\n"
+        )
+
+    omim = '<XRef ID="100" DB="OMIM"/>'
+    xml = '<?xml version="1.0"?>\n<ClinVarVariationRelease>\n{}</ClinVarVariationRelease>\n'.format(
+        archive(1, "SCV1", omim) + archive(2, "SCV2", omim) + archive(3, "SCV3", '<XRef ID="1" DB="MedGen"/>')
+    )
+
+    chunks = list(clinvar.iter_archive_chunks(io.BytesIO(xml.encode()), {"clinvar.1", "clinvar.3"}, block_size=50))
+    assert b"".join(chunks).count(b"<VariationArchive ") == 2 and b"SCV2" not in b"".join(chunks)
+
+    clinvar._init_xml_worker({"omim.100": ["mondo.1"]})
+    (update,) = [update for chunk in chunks for update in clinvar._parse_archives(chunk)]
+    assert update._filter == {"accession": "SCV1"}
+    assert update._doc["$set"]["targetDomainId"] == "mondo.1"
+    assert update._doc["$set"]["reviewStatus"] == "criteria provided"
+    assert update._doc["$addToSet"]["effects"] == {"$each": ["Pathogenic"]}
+
+
+def test_hpa_entries_parse_in_chunks(monkeypatch, tmp_path):
+    import gzip
+    from nedrexdb.db.parsers import hpa
+
+    entry = (
+        '<entry version="23.0"><name>A</name><identifier id="ENSG1" db="Ensembl">'
+        '<xref id="1" db="NCBI GeneID"/><xref id="P1" db="Uniprot/SWISSPROT"/></identifier>'
+        '<tissueExpression source="HPA"><data><tissue ontologyTerms="UBERON:1,UBERON:9">liver</tissue>'
+        "<level type=\"expression\">High</level></data></tissueExpression>"
+        '<rnaExpression assayType="consensusTissue"><data><tissue ontologyTerms="UBERON:1">liver</tissue>'
+        '<level type="normalizedRNAExpression" expRNA="2.5"/><level type="RNAExpression" expRNA="1"/></data>'
+        '<data><tissue>unmapped</tissue><level type="RNAExpression" expRNA="3"/></data></rnaExpression>'
+        "</entry>\n"
+    )
+    fname = tmp_path / "proteinatlas.xml.gz"
+    # the second entry is of an unknown gene and protein
+    other = entry.replace('id="1"', 'id="2"').replace('id="P1"', 'id="P2"')
+    fname.write_bytes(gzip.compress(f"<proteinAtlas>\n{entry}{other}</proteinAtlas>".encode()))
+    monkeypatch.setattr(hpa, "get_file_location", lambda label: fname)
+    monkeypatch.setattr(hpa.id_index, "primary_ids", lambda model: {
+        "tissue": {"uberon.1"}, "gene": {"entrez.1"}, "protein": {"uniprot.P1"}}[model.collection_name])
+
+    (gene_expression, protein_expression), = hpa._iter_expression_updates(workers=1)
+    (gene_update,) = gene_expression
+    assert gene_update._filter == {"sourceDomainId": "entrez.1", "targetDomainId": "uberon.1"}
+    assert {key: gene_update._doc["$set"][key] for key in ("TPM", "nTPM", "pTPM")} == {
+        "TPM": 1.0, "nTPM": 2.5, "pTPM": None}
+    assert [update._filter["targetDomainId"] for update in protein_expression] == ["uberon.1"]
+    assert protein_expression[0]._doc["$set"]["level"] == "High"
+
+
+def test_drugbank_full_database_chunks(monkeypatch, tmp_path):
+    import zipfile
+    from nedrexdb.db.parsers import drugbank
+
+    drug = """<drug type="small molecule" created="2005-06-13">
+  <drugbank-id primary="true">DB00001</drugbank-id><drugbank-id>APRD00001</drugbank-id>
+  <name>Example</name><description/><cas-number>1-2-3</cas-number><indication>Pain</indication>
+  <groups><group>approved</group></groups>
+  <categories><category><category>Analgesics</category><mesh-id>D1</mesh-id></category></categories>
+  <synonyms><synonym language="english">Ex</synonym></synonyms>
+  <pathways><pathway><drugs><drug><drugbank-id>DB00002</drugbank-id><name>Other</name></drug></drugs></pathway>
+  </pathways>
+  <targets><target><actions><action>inhibitor</action></actions>
+    <polypeptide id="P1" source="Swiss-Prot"/><polypeptide id="X1" source="Other"/></target>
+    <target><polypeptide id="P2" source="TrEMBL"/></target></targets>
+  <calculated-properties><property><kind>SMILES</kind><value>CCO</value></property></calculated-properties>
+</drug>
+"""
+    xml = f'<?xml version="1.0"?>\n<drugbank xmlns="http://www.drugbank.ca" version="5.1">\n{drug}</drugbank>\n'
+    fname = tmp_path / "drugbank_all_full_database.xml.zip"
+    with zipfile.ZipFile(fname, "w") as zf:
+        zf.writestr("full database.xml", xml)
+    monkeypatch.setattr(drugbank.id_index, "primary_ids", lambda model: {"uniprot.P1"})
+
+    ((drug_update,), (target_update,)), = drugbank._iter_drug_updates(fname, workers=1)
+    assert drug_update._filter == {"primaryDomainId": "drugbank.DB00001"}
+    fields = {**drug_update._doc["$set"], **drug_update._doc.get("$setOnInsert", {})}
+    assert fields["displayName"] == "Example" and fields["smiles"] == "CCO" and fields["description"] == ""
+    assert target_update._filter == {"sourceDomainId": "drugbank.DB00001", "targetDomainId": "uniprot.P1"}
+    assert drug_update._doc["$addToSet"]["drugCategories"] == {"$each": ["Analgesics"]}
+    assert target_update._doc["$addToSet"]["actions"] == {"$each": ["inhibitor"]}
+
+
+def test_opentargets_associations_are_joined_in_arrow(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from nedrexdb.db.parsers.opentargets import OpenTargetsParser
+
+    def write(name, table):
+        # Spark writes directories of part files (and a _SUCCESS marker)
+        (tmp_path / name).mkdir()
+        pq.write_table(pa.table(table), tmp_path / name / "part-00000.parquet")
+        (tmp_path / name / "_SUCCESS").touch()
+
+    write("disease", {"id": ["EFO_1", "MONDO_0000002", "EFO_3"],
+                      "dbXRefs": [["MONDO:0000001", "OMIM:1"], [], ["DOID:3"]]})
+    write("association_overall_direct", {"diseaseId": ["EFO_1", "MONDO_0000001", "MONDO_0000002", "EFO_3"],
+                                         "targetId": ["ENSG1", "ENSG1", "ENSG2", "ENSG1"],
+                                         "score": [0.1, 0.5, None, 0.9]})
+    write("association_by_datasource_direct", {"diseaseId": ["EFO_1", "MONDO_0000002", "EFO_3", "OMIM_1", "EFO_1"],
+                                               "targetId": ["ENSG1", "ENSG2", "ENSG1", "ENSG1", "ENSG9"],
+                                               "datasourceId": ["chembl", "eva", "eva", "europepmc", "eva"]})
+
+    parser = OpenTargetsParser(tmp_path / "association_by_datasource_direct", tmp_path / "disease",
+                               tmp_path / "association_overall_direct")
+    df = parser.associations({"mondo.0000001", "mondo.0000002"}, {"ENSG1": "entrez.1", "ENSG2": "entrez.2"})
+    # the last summary score of a disorder and target counts; rows without a score, an unmapped disease
+    # or an unknown gene are dropped
+    assert df.to_pylist() == [
+        {"sourceDomainId": "entrez.1", "mapped_mondo": "mondo.0000001", "datasourceId": "opentargets_chembl",
+         "summaryScore": 0.5},
+        {"sourceDomainId": "entrez.1", "mapped_mondo": "mondo.0000001", "datasourceId": "opentargets_europepmc",
+         "summaryScore": 0.5},
+    ]
+
+
+def test_columnar_round_trips_mixed_types(tmp_path, monkeypatch):
+    import nedrexdb
+    from nedrexdb.db import columnar
+
+    monkeypatch.setattr(nedrexdb.config, "data", {"db": {"root_directory": str(tmp_path), "columnar": True}})
+    docs = [
+        # ints and floats mixed in a batch, then ints only (not cast into the earlier part)
+        {"score": 2, "flag": True, "xrefs": {}},
+        {"score": 0.5, "flag": "yes", "xrefs": {"a": 1}, "comment": None},
+        {"score": 3, "flag": False},
+        {"score": 4, "flag": True},
+    ]
+    columnar.write_collection({"example": _FakeCollection(docs)}, "example", batch_rows=2)
+
+    read = list(columnar.read("example"))
+    assert read == docs
+    assert [type(doc["score"]) for doc in read] == [int, float, int, int]
+    assert [type(doc["flag"]) for doc in read] == [bool, str, bool, bool]
+    # fields set to null count, as in the documents
+    assert columnar.attribute_counts("example") == (4, {"score": 4, "flag": 4, "xrefs": 2, "comment": 1})
@@ -0,0 +1,51 @@
+import os
+
+import nedrexdb
+from nedrexdb.db import MongoInstance, client_options
+
+
+def test_connect_uses_client_settings_and_forks(monkeypatch):
+    monkeypatch.setattr(
+        nedrexdb.config,
+        "data",
+        {
+            "db": {
+                "mongo_db": "nedrex",
+                "dev": {"mongo_name": "localhost", "mongo_port": 26017, "mongo_port_internal": 27999},
+                "mongo_client": {"max_pool_size": 7, "compressors": ["zlib", "unknown"], "w": "majority"},
+            }
+        },
+    )
+    for attr in ("CLIENT", "DB", "VERSION"):
+        monkeypatch.setattr(MongoInstance, attr, getattr(MongoInstance, attr))
+
+    assert client_options() == {
+        "maxPoolSize": 7,
+        "minPoolSize": 0,
+        "w": "majority",
+        "journal": False,
+        "compressors": "zlib",
+    }
+
+    MongoInstance.connect("dev")
+    parent = MongoInstance.CLIENT
+    assert ("localhost", 27999) in parent.topology_description.server_descriptions()
+
+    pid = os.fork()
+    if pid == 0:
+        # the child must not share the parent's client
+        os._exit(0 if MongoInstance.CLIENT is not parent and MongoInstance.DB.name == "nedrex" else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    parent.close()
+
+
+def test_export_workers_use_client_settings(monkeypatch):
+    from nedrexdb.db import mongo_to_neo
+
+    monkeypatch.setattr(nedrexdb.config, "data", {"db": {"mongo_client": {"max_pool_size": 3, "w": 0}}})
+    monkeypatch.setattr(mongo_to_neo, "_WORKER_DB", None)
+    mongo_to_neo._init_export_worker("localhost", 27999, "nedrex")
+    client = mongo_to_neo._WORKER_DB.client
+    assert client.options.pool_options.max_pool_size == 3 and client.write_concern.document == {"w": 0, "j": False}
+    client.close()
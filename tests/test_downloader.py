@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from nedrexdb import common
+from nedrexdb.common import Downloader
+
+_DATA = bytes(range(256)) * 400
+
+
+class _Handler(BaseHTTPRequestHandler):
+    ranges = []
+
+    def _headers(self, status, length, extra=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"v1"')
+        for key, value in extra:
+            self.send_header(key, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(_DATA))
+
+    def do_GET(self):
+        if self.path.endswith(".md5"):
+            body = f"{hashlib.md5(_DATA).hexdigest()}  data.bin\n".encode()
+            self._headers(200, len(body))
+            self.wfile.write(body)
+            return
+        header = self.headers.get("Range")
+        if header is None or self.headers.get("If-Range") not in (None, '"v1"'):
+            self._headers(200, len(_DATA))
+            self.wfile.write(_DATA)
+            return
+        start, end = header.removeprefix("bytes=").split("-")
+        start, end = int(start), int(end) if end else len(_DATA) - 1
+        self.ranges.append((start, end))
+        self._headers(206, end - start + 1, [("Content-Range", f"bytes {start}-{end}/{len(_DATA)}")])
+        self.wfile.write(_DATA[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.ranges = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_download_resumes_partial_file(server, tmp_path):
+    url = f"{server}/data.bin"
+    d = Downloader(url=url, target=tmp_path / "data.bin", username=None, password=None, checksum=f"{url}.md5")
+    d.part.write_bytes(_DATA[:1000])
+    d._state_file.write_text(json.dumps({"url": url, "size": len(_DATA), "validator": '"v1"'}))
+
+    d.download()
+    assert (tmp_path / "data.bin").read_bytes() == _DATA
+    assert _Handler.ranges == [(1000, len(_DATA) - 1)]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["data.bin"]
+
+
+def test_download_in_ranges_and_checksum(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(common, "_MIN_SEGMENT_SIZE", 1024)
+    monkeypatch.setattr(common.time, "sleep", lambda _: None)
+    target = tmp_path / "data.bin"
+
+    Downloader(url=f"{server}/data.bin", target=target, username=None, password=None, connections=4).download()
+    assert target.read_bytes() == _DATA
+    assert sorted(_Handler.ranges) == [(0, 25599), (25600, 51199), (51200, 76799), (76800, 102399)]
+
+    # a file not matching its checksum is never moved to the target
+    target.unlink()
+    d = Downloader(url=f"{server}/data.bin", target=target, username=None, password=None, checksum="md5:0")
+    assert not d.download()
+    assert not target.exists()
+
+
+def test_manifest_skips_unchanged_files(server, tmp_path):
+    from nedrexdb.downloaders.manifest import DownloadManifest
+
+    d = Downloader(url=f"{server}/data.bin", target=tmp_path / "data.bin", username=None, password=None)
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    assert manifest.check([d]) == []
+    d.download()
+    assert manifest.record(d)
+
+    # a new process reads the manifest back
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    assert manifest.check([d]) == [d]
+    assert not manifest.record(d)
+
+    # the local file was modified
+    d.target.write_bytes(b"")
+    assert manifest.check([d]) == []
+
+
+def test_failed_download_is_not_recorded(server, tmp_path, monkeypatch):
+    from nedrexdb import downloaders
+    from nedrexdb.downloaders.manifest import DownloadManifest
+
+    monkeypatch.setattr(common.time, "sleep", lambda _: None)
+    target = tmp_path / "data.bin"
+    target.write_bytes(b"old")
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+
+    # the stale file must not be recorded under the server's current validators
+    d = Downloader(url=f"{server}/data.bin", target=target, username=None, password=None, checksum="md5:0")
+    downloaders._download_source("example", [d], manifest)
+    assert target.read_bytes() == b"old"
+    assert manifest.check([d]) == []
+
+
+def test_truncated_ftp_download_is_not_moved_to_target(tmp_path, monkeypatch):
+    import subprocess
+
+    monkeypatch.setattr(common.time, "sleep", lambda _: None)
+    d = Downloader(url="ftp://example.org/data.bin", target=tmp_path / "data.bin", username=None, password=None)
+    monkeypatch.setattr(Downloader, "_ftp_size", lambda self: len(_DATA))
+
+    calls = []
+
+    def wget(args, check):
+        # the first transfer dies (status 4), the others finish but are short
+        calls.append(args)
+        with open(args[-2], "ab") as f:
+            f.write(_DATA[:1000])
+        return subprocess.CompletedProcess(args, 4 if len(calls) == 1 else 0)
+
+    monkeypatch.setattr(common.subprocess, "run", wget)
+    assert not d.download()
+    assert len(calls) == 3 and not d.target.exists() and d.part.stat().st_size == 3000
@@ -0,0 +1,64 @@
+from nedrexdb.db import MongoInstance, id_index
+from nedrexdb.db.models.nodes.disorder import Disorder
+
+
+class _CountingCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.scans = 0
+
+    def with_options(self, **kwargs):
+        return self
+
+    def find(self, query, projection, batch_size=0):
+        self.scans += 1
+        for doc in self.docs:
+            yield {k: v for k, v in doc.items() if projection.get(k)}
+
+
+def test_id_index_caches_until_invalidated(monkeypatch):
+    coll = _CountingCollection(
+        [
+            {"primaryDomainId": "mondo.1", "domainIds": ["mondo.1", "omim.100", "umls.C1"], "displayName": "a"},
+            {"primaryDomainId": "mondo.2", "domainIds": ["mondo.2", "omim.100"], "displayName": "b"},
+        ]
+    )
+    monkeypatch.setattr(MongoInstance, "DB", {Disorder.collection_name: coll})
+    id_index.invalidate(Disorder)
+    id_index.written_collections()
+
+    assert id_index.primary_ids(Disorder) == {"mondo.1", "mondo.2"}
+    assert id_index.id_map(Disorder, prefix="omim.") == {"omim.100": ["mondo.1", "mondo.2"]}
+    assert id_index.primary_ids(Disorder) == {"mondo.1", "mondo.2"}
+    assert coll.scans == 2
+
+    coll.docs.append({"primaryDomainId": "mondo.3", "domainIds": ["mondo.3"]})
+    id_index.invalidate(Disorder)
+    assert id_index.primary_ids(Disorder) == {"mondo.1", "mondo.2", "mondo.3"}
+    assert coll.scans == 3
+    assert id_index.written_collections() == {Disorder.collection_name}
+
+    # a write by another process is passed on as a new version
+    id_index.sync({Disorder.collection_name: 1})
+    id_index.primary_ids(Disorder)
+    assert coll.scans == 4
+
+
+def test_completed_writes_drop_lookups(monkeypatch):
+    from types import SimpleNamespace
+    from nedrexdb.db import build_cache
+
+    coll = _CountingCollection([{"primaryDomainId": "mondo.1"}])
+    monkeypatch.setattr(MongoInstance, "DB", {Disorder.collection_name: coll})
+    id_index.invalidate(Disorder)
+    id_index.primary_ids(Disorder)
+
+    listener = build_cache._WriteListener()
+    listener.started(SimpleNamespace(command_name="update", command={"update": Disorder.collection_name},
+                                     database_name="nedrex", request_id=1))
+    coll.docs.append({"primaryDomainId": "mondo.2"})
+    # the lookup is kept until the write is done
+    assert id_index.primary_ids(Disorder) == {"mondo.1"}
+    listener.succeeded(SimpleNamespace(request_id=1))
+    assert id_index.primary_ids(Disorder) == {"mondo.1", "mondo.2"}
+    assert Disorder.collection_name in id_index.written_collections()
@@ -0,0 +1,114 @@
+import importlib
+import itertools
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+import nedrexdb  # noqa: E402
+from nedrexdb.db import MongoInstance  # noqa: E402
+
+_SMILES = {
+    "drugbank.DB1": "CCO",
+    "drugbank.DB2": "CCCO",
+    "drugbank.DB3": "c1ccccc1",
+    "drugbank.DB4": "Cc1ccccc1",
+    "drugbank.DB5": "Oc1ccccc1",
+    "drugbank.DB6": "CC(=O)Oc1ccccc1C(=O)O",
+    "drugbank.DB9": "CCCCO",
+    # cannot be parsed, so it is left out
+    "drugbank.DB7": "not a smiles",
+    "drugbank.DB8": "",
+}
+
+
+class _DrugCollection:
+    def __init__(self, smiles):
+        self.smiles = smiles
+
+    def find(self, query, projection):
+        return [{"primaryDomainId": k, "smiles": v} for k, v in self.smiles.items() if v]
+
+
+class _SimilarityCollection:
+    def __init__(self):
+        self.docs = []
+
+    def delete_many(self, query):
+        self.docs = []
+
+    def insert_many(self, docs, ordered=True):
+        self.docs += docs
+
+    def create_index(self, keys):
+        pass
+
+
+@pytest.fixture
+def similarity(tmp_path, monkeypatch):
+    # the module binds the collections on import
+    monkeypatch.setattr(MongoInstance, "DB", {"drug": None, "molecule_similarity_molecule": None})
+    module = importlib.import_module("nedrexdb.analyses.molecule_similarity")
+    monkeypatch.setattr(nedrexdb.config, "data", {"db": {"root_directory": str(tmp_path)}})
+    monkeypatch.setattr(module, "_DRUG_SIMILARITY_COLL", _SimilarityCollection())
+    return module
+
+
+def _run(similarity, monkeypatch, smiles):
+    monkeypatch.setattr(similarity, "_DRUG_COLL", _DrugCollection(smiles))
+    similarity.run()
+    return {(doc["memberOne"], doc["memberTwo"]): doc for doc in similarity._DRUG_SIMILARITY_COLL.docs}
+
+
+def _expected_pairs(similarity, smiles):
+    """Compares every pair of parsable drugs, without screening."""
+    fingerprints = {k: similarity.compute_fingerprints(v) for k, v in smiles.items() if v}
+    fingerprints = {k: fp for k, fp in fingerprints.items() if fp is not None}
+    pairs = {}
+    for a, b in itertools.combinations(sorted(fingerprints), 2):
+        scores = {
+            key: similarity.DataStructs.TanimotoSimilarity(fingerprints[a][key], fingerprints[b][key])
+            for key in similarity._SCORE_KEYS
+        }
+        if scores["morgan_r2"] >= 0.3 or scores["maccs"] >= 0.8:
+            pairs[(a, b)] = scores
+    return pairs
+
+
+def _assert_pairs(docs, expected):
+    assert set(docs) == set(expected)
+    for pair, scores in expected.items():
+        assert {key: docs[pair][key] for key in scores} == pytest.approx(scores)
+
+
+def test_similar_pairs_cold_cache(similarity, monkeypatch):
+    docs = _run(similarity, monkeypatch, _SMILES)
+
+    expected = _expected_pairs(similarity, _SMILES)
+    # the filter keeps some pairs and drops others
+    assert 0 < len(expected) < len(list(itertools.combinations(range(7), 2)))
+    _assert_pairs(docs, expected)
+    assert all(a < b for a, b in docs)
+    assert not any("drugbank.DB7" in pair or "drugbank.DB8" in pair for pair in docs)
+
+
+def test_similar_pairs_warm_cache(similarity, monkeypatch):
+    _run(similarity, monkeypatch, _SMILES)
+
+    # one molecule changes, one is removed
+    smiles = dict(_SMILES, **{"drugbank.DB4": "CCc1ccccc1"})
+    del smiles["drugbank.DB2"]
+    compute_fingerprints = similarity.compute_fingerprints
+    computed = []
+    monkeypatch.setattr(similarity, "compute_fingerprints", lambda s: computed.append(s) or compute_fingerprints(s))
+    score_rows = similarity.score_rows
+    scored = []
+    monkeypatch.setattr(similarity, "score_rows", lambda rows, ids, *args: scored.extend(ids[i] for i in rows)
+                        or score_rows(rows, ids, *args))
+    docs = _run(similarity, monkeypatch, smiles)
+
+    # only the changed molecule is fingerprinted and compared again
+    assert computed == ["CCc1ccccc1"]
+    assert scored == ["drugbank.DB4"]
+    _assert_pairs(docs, _expected_pairs(similarity, smiles))
+    assert not any("drugbank.DB2" in pair for pair in docs)
@@ -0,0 +1,129 @@
+import pytest
+from pymongo import InsertOne
+
+from nedrexdb.control.scheduler import ParserTask, resolve_tasks, run_tasks, stage_leaf_tasks
+from nedrexdb.exceptions import AssumptionError
+
+
+def _noop():
+    pass
+
+
+def _names(tasks):
+    return [task.name for task in tasks]
+
+
+def test_resolve_tasks_dependency_order():
+    tasks = [
+        ParserTask("hpo", _noop, ("hpo",), ("mondo",)),
+        ParserTask("mondo", _noop, ("mondo",)),
+        ParserTask("ncbi", _noop, ("ncbi",)),
+    ]
+    assert _names(resolve_tasks(tasks, set())) == ["mondo", "hpo", "ncbi"]
+
+
+def test_resolve_tasks_ignored_sources():
+    tasks = [
+        ParserTask("mondo", _noop, ("mondo",)),
+        ParserTask("hpo", _noop, ("hpo",), ("mondo",)),
+        ParserTask("biogrid", _noop, ("biogrid", "hippie")),
+    ]
+    # requirements on ignored tasks are treated as satisfied
+    assert _names(resolve_tasks(tasks, {"mondo", "hippie"})) == ["hpo"]
+
+
+def test_resolve_tasks_unknown_requirement():
+    tasks = [ParserTask("hpo", _noop, ("hpo",), ("disorder",))]
+    with pytest.raises(AssumptionError):
+        resolve_tasks(tasks, set())
+
+
+def test_resolve_tasks_cycle():
+    tasks = [
+        ParserTask("a", _noop, ("a",), ("b",)),
+        ParserTask("b", _noop, ("b",), ("a",)),
+    ]
+    with pytest.raises(AssumptionError):
+        resolve_tasks(tasks, set())
+
+
+def test_run_tasks_serial():
+    calls = []
+    tasks = [
+        ParserTask("hpo", lambda: calls.append("hpo"), ("hpo",), ("mondo",)),
+        ParserTask("mondo", lambda: calls.append("mondo"), ("mondo",)),
+    ]
+    timings = run_tasks(tasks, ignored_sources=set(), workers=1)
+    assert calls == ["mondo", "hpo"]
+    assert set(timings) == {"mondo", "hpo"}
+
+
+def test_stage_leaf_tasks():
+    tasks = [
+        ParserTask("mondo", _noop, ("mondo",)),
+        ParserTask("hpo", _noop, ("hpo",), ("mondo",)),
+        ParserTask("clinvar", _noop, ("clinvar",), ("mondo",), stageable=False),
+    ]
+    assert [task.staged for task in stage_leaf_tasks(tasks)] == [False, True, False]
+
+
+class _Collection(list):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+
+class _Collections(dict):
+    def __missing__(self, name):
+        self[name] = _Collection(name)
+        return self[name]
+
+
+class _Database:
+    def __init__(self, collections):
+        self._collections = collections
+
+    def __getitem__(self, name):
+        return self._collections[name]
+
+
+class _Writer:
+    def __init__(self, coll):
+        self.coll = coll
+
+    def write(self, operations):
+        self.coll.extend(op._doc for op in operations)
+
+    def close(self):
+        pass
+
+
+def test_unstageable_task_reads_its_own_writes(monkeypatch):
+    import nedrexdb
+    from nedrexdb.db import MongoInstance, bulk_load, staging
+
+    collections = _Collections()
+    monkeypatch.setattr(nedrexdb.config, "data", {"db": {"bulk_load": False}})
+    monkeypatch.setattr(bulk_load, "_BulkWriter", _Writer)
+    monkeypatch.setattr(MongoInstance, "DB", _Database(collections))
+    monkeypatch.setattr(staging, "collection", lambda task, name: collections[f"{task}.{name}"])
+    monkeypatch.setattr(staging, "_SEQUENCES", {})
+
+    seen = {}
+
+    def write_and_read(task_name):
+        def func():
+            with bulk_load.loader("nodes") as writer:
+                writer.write([InsertOne({"task": task_name})])
+            seen[task_name] = list(collections["nodes"])
+        return func
+
+    tasks = stage_leaf_tasks([
+        ParserTask("staged", write_and_read("staged"), ("staged",)),
+        ParserTask("unstaged", write_and_read("unstaged"), ("unstaged",), stageable=False),
+    ])
+    run_tasks(tasks, ignored_sources=set(), workers=1)
+
+    # the staged task only sees its writes after the merge, the unstageable task right away
+    assert seen == {"staged": [], "unstaged": [{"task": "unstaged"}]}
+    assert collections["staged.nodes"] == [{"_id": 0, "op": "InsertOne", "doc": {"task": "staged"}}]